@@ -0,0 +1,265 @@
+# almacen_minions.py - Almacén de minions en arrays NumPy (struct-of-arrays) para mover en lote
+import numpy as np
+
+from mapa import MAPA
+from rutas import RutaCompilada
+
+EQUIPOS = ("aliados", "enemigos")
+TIPOS = ("melee", "caster", "siege")
+
+DISTANCIA_LLEGADA_BASE = 10   # Distancia a la base enemiga a la que el minion desaparece
+PASO_VELOCIDAD_MINIONS = 0.1  # La velocidad de los minions está en píxeles por cada 0.1 s de juego
+
+# Columnas que guarda exportar() (pos se recalcula a partir de ruta y distancia)
+COLUMNAS_RESPALDO = ("id", "velocidad", "distancia", "ruta", "vida", "vida_max", "daño",
+                     "rango_ataque", "reduccion_daño", "equipo", "tipo", "objetivo")
+
+
+class AlmacenMinions:
+    """Minions de ambos equipos guardados en arrays contiguos.
+
+    Cada minion es una fila: ruta, distancia recorrida sobre ella, velocidad,
+    vida, equipo, tipo... Las rutas se compilan una vez (RutaCompilada) y moverse
+    es sumar la velocidad a la distancia; `pos` es una caché derivada de
+    (ruta, distancia). `vista()` reconstruye los diccionarios de los mensajes.
+    """
+
+    def __init__(self, capacidad=1024):
+        self.n = 0
+        self.siguiente_id = 1  # Identificador estable de cada minion (para interpolar entre instantáneas)
+        self._reservar(capacidad)
+
+        # Rutas compiladas: inicio + puntos de ruta + destino final
+        self.rutas = []                # índice -> RutaCompilada
+        self.ids_rutas = []            # índice -> ruta_id
+        self.indices_rutas = {}        # ruta_id -> índice
+        self.puntos_por_ruta = []      # puntos de ruta originales (para la vista)
+        self.destinos_por_ruta = []
+        self.longitud_rutas = np.zeros(0)
+
+    def _reservar(self, capacidad):
+        self.capacidad = capacidad
+        self.id = np.zeros(capacidad, dtype=np.int64)
+        self.pos = np.zeros((capacidad, 2))
+        self.velocidad = np.zeros(capacidad)
+        self.distancia = np.zeros(capacidad)
+        self.ruta = np.zeros(capacidad, dtype=np.int32)
+        self.vida = np.zeros(capacidad)
+        self.vida_max = np.zeros(capacidad)
+        self.daño = np.zeros(capacidad)
+        self.rango_ataque = np.zeros(capacidad)
+        self.reduccion_daño = np.zeros(capacidad)
+        self.equipo = np.zeros(capacidad, dtype=np.int8)
+        self.tipo = np.zeros(capacidad, dtype=np.int8)
+        self.objetivo = np.full(capacidad, -1, dtype=np.int32)
+
+    def _columnas(self):
+        return ("id", "pos", "velocidad", "distancia", "ruta", "vida", "vida_max", "daño",
+                "rango_ataque", "reduccion_daño", "equipo", "tipo", "objetivo")
+
+    def _crecer(self, minimo):
+        """Duplica la capacidad de todos los arrays conservando los minions vivos"""
+        nueva = max(minimo, self.capacidad * 2)
+        anteriores = {nombre: getattr(self, nombre)[:self.n] for nombre in self._columnas()}
+        self._reservar(nueva)
+        for nombre, datos in anteriores.items():
+            getattr(self, nombre)[:self.n] = datos
+
+    def __len__(self):
+        return self.n
+
+    def contar(self, equipo):
+        return int(np.count_nonzero(self.equipo[:self.n] == EQUIPOS.index(equipo)))
+
+    def registrar_ruta(self, ruta_id, puntos, destino, inicio):
+        """Compila una ruta (si no existía) y devuelve su índice"""
+        if ruta_id in self.indices_rutas:
+            return self.indices_rutas[ruta_id]
+        indice = len(self.ids_rutas)
+        self.rutas.append(RutaCompilada(ruta_id, [tuple(inicio)] + [tuple(p) for p in puntos] + [tuple(destino)]))
+        self.ids_rutas.append(ruta_id)
+        self.indices_rutas[ruta_id] = indice
+        self.puntos_por_ruta.append([tuple(p) for p in puntos])
+        self.destinos_por_ruta.append(list(destino))
+        self.longitud_rutas = np.array([ruta.longitud_total for ruta in self.rutas])
+        return indice
+
+    def agregar(self, minion):
+        """Añade un minion en el formato de diccionario de los mensajes"""
+        if self.n >= self.capacidad:
+            self._crecer(self.n + 1)
+        i = self.n
+        inicio = minion.get("inicio")
+        if inicio is None:
+            # Las vistas no traen el inicio: el de las rutas del mapa es el nexo del equipo
+            ruta_mapa = MAPA.rutas_minions.get(minion["ruta_id"])
+            inicio = ruta_mapa.puntos[0] if ruta_mapa is not None else minion["pos"]
+        indice_ruta = self.registrar_ruta(minion["ruta_id"], minion["puntos_ruta"], minion["destino"], inicio)
+        ruta = self.rutas[indice_ruta]
+        id_minion = minion.get("id")
+        if id_minion is None:
+            id_minion = self.siguiente_id
+        self.siguiente_id = max(self.siguiente_id, id_minion + 1)
+        distancia = minion.get("distancia")
+        if distancia is None:
+            # Minion sin distancia (recién creado o de un mensaje antiguo): proyectar su posición
+            distancia = ruta.proyectar(*minion["pos"], segmento=minion.get("indice_punto_actual", 0))
+        self.id[i] = id_minion
+        self.ruta[i] = indice_ruta
+        self.distancia[i] = distancia
+        self.pos[i] = ruta.posicion(distancia)
+        self.velocidad[i] = minion["velocidad"]
+        self.vida[i] = minion["vida"]
+        self.vida_max[i] = minion.get("vida_max", minion["vida"])
+        self.daño[i] = minion["daño"]
+        self.rango_ataque[i] = minion["rango_ataque"]
+        self.reduccion_daño[i] = minion.get("reduccion_daño", 0)
+        self.equipo[i] = EQUIPOS.index(minion["equipo"])
+        self.tipo[i] = TIPOS.index(minion["tipo"])
+        self.objetivo[i] = -1
+        self.n += 1
+        return i
+
+    def agregar_varios(self, minions):
+        for minion in minions:
+            self.agregar(minion)
+
+    def limpiar(self):
+        self.n = 0
+
+    def exportar(self):
+        """Copia compacta para un punto de control: rutas y columnas en bytes (sin la caché `pos`)"""
+        n = self.n
+        return {
+            "n": n,
+            "siguiente_id": self.siguiente_id,
+            "rutas": [[ruta_id, [list(p) for p in puntos], list(destino), list(ruta.puntos[0])]
+                      for ruta_id, puntos, destino, ruta in zip(self.ids_rutas, self.puntos_por_ruta,
+                                                                self.destinos_por_ruta, self.rutas)],
+            "datos": b"".join(getattr(self, nombre)[:n].tobytes() for nombre in COLUMNAS_RESPALDO)
+        }
+
+    def importar(self, copia):
+        """Sustituye los minions por los de `exportar()` (de la misma máquina: orden de bytes nativo)"""
+        self.limpiar()
+        # Las rutas pueden quedar con otro índice en este almacén
+        indices = np.array([self.registrar_ruta(ruta_id, puntos, destino, inicio)
+                            for ruta_id, puntos, destino, inicio in copia["rutas"]] or [0], dtype=np.int32)
+        n = copia["n"]
+        if n > self.capacidad:
+            self._crecer(n)
+        desplazamiento = 0
+        for nombre in COLUMNAS_RESPALDO:
+            columna = getattr(self, nombre)
+            columna[:n] = np.frombuffer(copia["datos"], dtype=columna.dtype, count=n, offset=desplazamiento)
+            desplazamiento += n * columna.itemsize
+        self.ruta[:n] = indices[self.ruta[:n]]
+        self.n = n
+        self.siguiente_id = max(self.siguiente_id, copia["siguiente_id"])
+        self.actualizar_posiciones()
+
+    def mover(self, factor=1.0):
+        """Un paso de movimiento en lote: sumar velocidad a la distancia y quitar los que llegaron.
+
+        `factor` escala la velocidad (p. ej. dt / paso de referencia). Devuelve
+        cuántos minions llegaron a la base enemiga en este paso.
+        """
+        n = self.n
+        if n == 0:
+            return 0
+        self.distancia[:n] += self.velocidad[:n] * factor
+
+        # Los que están junto a la base enemiga (final de la ruta) desaparecen
+        llegaron = self.distancia[:n] >= self.longitud_rutas[self.ruta[:n]] - DISTANCIA_LLEGADA_BASE
+        cantidad = int(np.count_nonzero(llegaron))
+        if cantidad:
+            self.quitar(llegaron)
+        self.actualizar_posiciones()
+        return cantidad
+
+    def actualizar_posiciones(self):
+        """Recalcula la caché `pos` a partir de (ruta, distancia), una búsqueda por ruta"""
+        n = self.n
+        rutas = self.ruta[:n]
+        for indice_ruta, ruta in enumerate(self.rutas):
+            en_ruta = rutas == indice_ruta
+            if en_ruta.any():
+                self.pos[:n][en_ruta] = ruta.posiciones(self.distancia[:n][en_ruta])
+
+    def segmentos(self, indices):
+        """Segmento actual de cada minion (equivale al índice del siguiente punto de ruta)"""
+        segmentos = np.zeros(len(indices), dtype=np.int32)
+        rutas = self.ruta[indices]
+        for indice_ruta, ruta in enumerate(self.rutas):
+            en_ruta = rutas == indice_ruta
+            if en_ruta.any():
+                segmentos[en_ruta] = ruta.segmentos_de(self.distancia[indices][en_ruta])
+        return segmentos
+
+    def quitar(self, mascara):
+        """Elimina los minions marcados compactando los arrays (mantiene el orden)"""
+        conservar = ~mascara
+        restantes = int(np.count_nonzero(conservar))
+        for nombre in self._columnas():
+            columna = getattr(self, nombre)
+            columna[:restantes] = columna[:self.n][conservar]
+        self.n = restantes
+
+    def asignar_objetivos(self, equipo, indice_estructuras):
+        """Guarda en `objetivo` la primera estructura en rango de ataque (-1 si ninguna).
+
+        `indice_estructuras` es un IndiceEstatico con las estructuras enemigas.
+        """
+        indices = self.indices_equipo(equipo)
+        if len(indices):
+            self.objetivo[indices] = indice_estructuras.primero_en_rango(
+                self.pos[indices], self.rango_ataque[indices])
+
+    def indices_equipo(self, equipo):
+        return np.flatnonzero(self.equipo[:self.n] == EQUIPOS.index(equipo))
+
+    def mascara_rectangulo(self, x0, y0, x1, y1):
+        """Máscara de los minions dentro del rectángulo [x0, x1] x [y0, y1]"""
+        pos = self.pos[:self.n]
+        return (pos[:, 0] >= x0) & (pos[:, 0] <= x1) & (pos[:, 1] >= y0) & (pos[:, 1] <= y1)
+
+    def vista(self, equipo, mascara=None):
+        """Adaptador: lista de diccionarios de un equipo en el formato de los mensajes"""
+        if mascara is None:
+            indices = self.indices_equipo(equipo)
+        else:
+            indices = np.flatnonzero((self.equipo[:self.n] == EQUIPOS.index(equipo)) & mascara)
+        posiciones = self.pos[indices].tolist()
+        rutas = self.ruta[indices].tolist()
+        columnas = zip(self.id[indices].tolist(), posiciones, rutas, self.velocidad[indices].tolist(),
+                       self.distancia[indices].tolist(), self.segmentos(indices).tolist(),
+                       self.vida[indices].tolist(),
+                       self.vida_max[indices].tolist(), self.daño[indices].tolist(),
+                       self.rango_ataque[indices].tolist(), self.reduccion_daño[indices].tolist(),
+                       self.tipo[indices].tolist(), self.objetivo[indices].tolist())
+        minions = []
+        for (id_minion, pos, ruta, velocidad, distancia, indice_punto, vida, vida_max, daño, rango, reduccion,
+             tipo, objetivo) in columnas:
+            minions.append({
+                "id": id_minion,
+                "tipo": TIPOS[tipo],
+                "vida": vida,
+                "vida_max": vida_max,
+                "daño": daño,
+                "velocidad": velocidad,
+                "ruta_id": self.ids_rutas[ruta],
+                "pos": pos,
+                "objetivo": objetivo if objetivo >= 0 else None,
+                "equipo": equipo,
+                "rango_ataque": rango,
+                "destino": self.destinos_por_ruta[ruta],
+                "puntos_ruta": self.puntos_por_ruta[ruta],
+                "indice_punto_actual": indice_punto,
+                "distancia": distancia,  # Con ruta_id basta para reconstruir la posición
+                "reduccion_daño": reduccion
+            })
+        return minions
+
+    def vista_completa(self, mascara=None):
+        """Diccionario {"aliados": [...], "enemigos": [...]} como en estado_juego"""
+        return {equipo: self.vista(equipo, mascara) for equipo in EQUIPOS}
@@ -0,0 +1,154 @@
+# atlas.py - Sprites ya escalados empaquetados en una sola imagen (atlas) con su índice, en caché en disco
+import hashlib
+import json
+import os
+import sys
+
+import pygame
+
+DIRECTORIO_ASSETS = "assets"
+DIRECTORIO_CACHE = os.path.join(DIRECTORIO_ASSETS, "cache")
+ANCHO_ATLAS = 512
+VERSION_ATLAS = 1  # Cambiarla si cambia el formato del atlas o del índice
+
+# Nombre del sprite -> (archivo de origen, tamaño final)
+SPRITES = {
+    "personaje1": ("personaje1.png", (70, 70)),
+    "personaje2": ("personaje2.png", (70, 70)),
+    "personaje1_seleccion": ("personaje1.png", (150, 150)),
+    "personaje2_seleccion": ("personaje2.png", (150, 150)),
+    "personaje_defecto": (None, (50, 50)),  # Jugadores sin personaje elegido
+    "torre_aliada": ("torre_aliada.png", (60, 60)),
+    "torre_enemiga": ("torre_enemiga.png", (60, 60)),
+    "inhibidor_aliado": ("inhibidor_aliado.png", (50, 50)),
+    "inhibidor_enemigo": ("inhibidor_enemigo.png", (50, 50)),
+    "nexo_aliado": ("nexo_aliado.png", (80, 80)),
+    "nexo_enemigo": ("nexo_enemigo.png", (80, 80)),
+    "melee": ("minion_mele.png", (40, 40)),
+    "caster": ("caster_minion.png", (40, 40)),
+    "siege": ("cañon_minion.png", (50, 50)),
+}
+
+
+def _circulos(tamaño, *colores):
+    def dibujar(superficie):
+        radio = tamaño // 2
+        for i, color in enumerate(colores):
+            pygame.draw.circle(superficie, color, (radio, radio), radio - i * 10)
+    return tamaño, dibujar
+
+
+def _rectangulo(tamaño, color, borde=0):
+    return tamaño, lambda superficie: pygame.draw.rect(superficie, color, (0, 0, tamaño, tamaño), 0, borde)
+
+
+def _inhibidor(color):
+    return 50, lambda superficie: pygame.draw.polygon(superficie, color, [(25, 0), (50, 50), (25, 40), (0, 50)])
+
+
+# Imágenes por defecto si falta un archivo: archivo -> (tamaño, función que dibuja)
+RESPALDOS = {
+    "personaje1.png": _circulos(70, (0, 0, 255)),
+    "personaje2.png": _circulos(70, (255, 0, 0)),
+    None: _rectangulo(50, (0, 255, 0)),
+    "torre_aliada.png": _rectangulo(60, (0, 255, 0), 10),
+    "torre_enemiga.png": _rectangulo(60, (255, 0, 0), 10),
+    "inhibidor_aliado.png": _inhibidor((0, 255, 0)),
+    "inhibidor_enemigo.png": _inhibidor((255, 0, 0)),
+    "nexo_aliado.png": _circulos(80, (0, 200, 0), (0, 255, 0)),
+    "nexo_enemigo.png": _circulos(80, (200, 0, 0), (255, 0, 0)),
+    "minion_mele.png": _rectangulo(40, (200, 0, 0)),
+    "caster_minion.png": _rectangulo(40, (0, 0, 200)),
+    "cañon_minion.png": _rectangulo(50, (150, 150, 0)),
+}
+
+
+def hash_fuentes(directorio=DIRECTORIO_ASSETS):
+    """Huella del contenido de las imágenes de origen y de la tabla de sprites"""
+    huella = hashlib.sha1(json.dumps([VERSION_ATLAS, SPRITES], sort_keys=True).encode("utf-8"))
+    for archivo in sorted({archivo for archivo, _ in SPRITES.values() if archivo}):
+        huella.update(archivo.encode("utf-8"))
+        try:
+            with open(os.path.join(directorio, archivo), "rb") as f:
+                huella.update(f.read())
+        except OSError:
+            huella.update(b"\0")  # Sin archivo: se usará la imagen por defecto
+    return huella.hexdigest()[:16]
+
+
+def _cargar_origen(directorio, archivo):
+    try:
+        if archivo is not None:
+            return pygame.image.load(os.path.join(directorio, archivo))
+    except (pygame.error, FileNotFoundError):
+        pass
+    tamaño, dibujar = RESPALDOS[archivo]
+    superficie = pygame.Surface((tamaño, tamaño), pygame.SRCALPHA)
+    dibujar(superficie)
+    return superficie
+
+
+def distribuir(tamaños, ancho=ANCHO_ATLAS):
+    """Coloca rectángulos por estantes (del más alto al más bajo). Devuelve ({nombre: rect}, alto total)"""
+    rects = {}
+    x = y = alto_estante = 0
+    for nombre, (w, h) in sorted(tamaños.items(), key=lambda item: (-item[1][1], item[0])):
+        if x + w > ancho:
+            x, y = 0, y + alto_estante
+            alto_estante = 0
+        rects[nombre] = [x, y, w, h]
+        x += w
+        alto_estante = max(alto_estante, h)
+    return rects, y + alto_estante
+
+
+def construir_atlas(directorio=DIRECTORIO_ASSETS, cache=DIRECTORIO_CACHE, huella=None):
+    """Decodifica y escala cada imagen una vez y guarda el atlas (PNG) y su índice (JSON)"""
+    huella = huella or hash_fuentes(directorio)
+    rects, alto = distribuir({nombre: tamaño for nombre, (_, tamaño) in SPRITES.items()})
+    atlas = pygame.Surface((ANCHO_ATLAS, alto), pygame.SRCALPHA)
+    atlas.fill((0, 0, 0, 0))
+    origenes = {}
+    for nombre, (archivo, tamaño) in SPRITES.items():
+        if archivo not in origenes:
+            origenes[archivo] = _cargar_origen(directorio, archivo)
+        sprite = pygame.transform.scale(origenes[archivo], tamaño)
+        # MAX sobre el atlas vacío copia también el canal alfa, sin mezclar
+        atlas.blit(sprite, rects[nombre][:2], special_flags=pygame.BLEND_RGBA_MAX)
+
+    os.makedirs(cache, exist_ok=True)
+    for viejo in os.listdir(cache):
+        if viejo.startswith("atlas-"):
+            os.remove(os.path.join(cache, viejo))  # Atlas de versiones anteriores de los assets
+    ruta = os.path.join(cache, f"atlas-{huella}")
+    pygame.image.save(atlas, ruta + ".png")
+    with open(ruta + ".json", "w", encoding="utf-8") as f:
+        json.dump({"huella": huella, "sprites": rects}, f, indent=2, ensure_ascii=False)
+    return atlas, rects
+
+
+def cargar_atlas(directorio=DIRECTORIO_ASSETS, cache=DIRECTORIO_CACHE):
+    """{nombre: Surface} con cada sprite como subsuperficie del atlas (que se construye si falta).
+
+    Las subsuperficies comparten píxeles con el atlas: se pueden dibujar pero no
+    modificar. Requiere un modo de vídeo ya creado (convert_alpha).
+    """
+    huella = hash_fuentes(directorio)
+    ruta = os.path.join(cache, f"atlas-{huella}")
+    try:
+        with open(ruta + ".json", encoding="utf-8") as f:
+            rects = json.load(f)["sprites"]
+        if set(rects) != set(SPRITES):
+            raise ValueError("índice incompleto")
+        atlas = pygame.image.load(ruta + ".png")
+    except (OSError, ValueError, KeyError, pygame.error):
+        atlas, rects = construir_atlas(directorio, cache, huella)
+    atlas = atlas.convert_alpha()
+    return {nombre: atlas.subsurface(rect) for nombre, rect in rects.items()}
+
+
+if __name__ == "__main__":
+    # Paso de construcción: python atlas.py [directorio de assets]
+    directorio = sys.argv[1] if len(sys.argv) > 1 else DIRECTORIO_ASSETS
+    _, rects = construir_atlas(directorio, os.path.join(directorio, "cache"))
+    print(json.dumps({"huella": hash_fuentes(directorio), "sprites": rects}, ensure_ascii=False))
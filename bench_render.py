@@ -0,0 +1,105 @@
+# bench_render.py - Medición del dibujo del cliente pygame sin ventana (SDL_VIDEODRIVER=dummy)
+import argparse
+import copy
+import json
+import os
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Antes de importar pygame
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+
+from estadisticas import percentiles
+
+FASES = ("dibujar_mapa", "dibujar_minions", "dibujar_otros_jugadores", "dibujar_footer",
+         "actualizar_minions", "dibujar_juego")
+
+
+def poblar(juego, minions, jugadores, rng):
+    """Llena el juego con `minions` repartidos por las rutas y `jugadores` visibles"""
+    almacen = juego.minions
+    almacen.limpiar()
+    while almacen.n < minions:
+        almacen.agregar_varios(juego.generar_oleada("aliados"))
+        almacen.agregar_varios(juego.generar_oleada("enemigos"))
+    almacen.n = minions
+    # Cada minion en un punto al azar de su ruta (sin llegar a la base) y con vida al azar
+    almacen.distancia[:minions] = rng.uniform(0, almacen.longitud_rutas[almacen.ruta[:minions]] - 20)
+    almacen.vida[:minions] = rng.uniform(0, 1, minions) * almacen.vida_max[:minions]
+    almacen.actualizar_posiciones()
+
+    juego.otros_jugadores = {}
+    for i in range(jugadores):
+        juego.otros_jugadores[str(i)] = {
+            "id": str(i),
+            "nombre": f"Jugador {i}",
+            "personaje": (1, 2, None)[i % 3],  # También el caso sin personaje elegido
+            "pos": [float(rng.uniform(50, juego.ANCHO - 50)), float(rng.uniform(100, juego.ALTO - 100))],
+            "vida": int(rng.integers(1, 101)),
+            "vida_max": 100,
+            "visible": True
+        }
+
+
+def medir(juego, minions, jugadores, fotogramas, rng):
+    """Milisegundos por fotograma de cada fase para una población dada"""
+    poblar(juego, minions, jugadores, rng)
+    base = copy.deepcopy(juego.minions)
+    tiempos = {fase: [] for fase in FASES}
+    juego.redibujar_todo = True
+    for _ in range(fotogramas):
+        # Cada fotograma parte de la misma población: actualizar_minions quita a los que llegan
+        juego.minions = copy.deepcopy(base)
+        juego.oleadas["tiempo_juego"] += 1 / 60  # El pie cambia como en una partida
+        juego.rects_sucios = []
+        for fase in FASES:
+            funcion = getattr(juego, fase)
+            inicio = time.perf_counter()
+            funcion()
+            tiempos[fase].append((time.perf_counter() - inicio) * 1000)
+    return {
+        fase: {"media": round(sum(muestras) / len(muestras), 4),
+               **{clave: round(valor, 4) for clave, valor in percentiles(muestras).items()},
+               "max": round(max(muestras), 4)}
+        for fase, muestras in tiempos.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Medición del dibujo del cliente sin ventana")
+    parser.add_argument("--minions", type=int, nargs="+", default=[0, 100, 500, 2000],
+                        help="Cantidades de minions a medir")
+    parser.add_argument("--jugadores", type=int, nargs="+", default=[0, 10, 50],
+                        help="Cantidades de otros jugadores a medir")
+    parser.add_argument("--fotogramas", type=int, default=200, help="Fotogramas por combinación")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", default=None, help="Archivo JSON para los resultados")
+    args = parser.parse_args()
+
+    from multijugador import Juego
+    juego = Juego()
+    juego.estado = "juego"  # Sin menú ni selección de personaje
+    rng = np.random.default_rng(args.semilla)
+
+    resultados = []
+    for minions in args.minions:
+        for jugadores in args.jugadores:
+            resultados.append({"minions": minions, "jugadores": jugadores,
+                               "ms": medir(juego, minions, jugadores, args.fotogramas, rng)})
+    informe = {
+        "fotogramas": args.fotogramas,
+        "semilla": args.semilla,
+        "resultados": resultados,
+        "textos": juego.textos.estadisticas()
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    for fila in resultados:
+        medias = ", ".join(f"{fase} {datos['media']:.3f}" for fase, datos in fila["ms"].items())
+        print(f"{fila['minions']:>5} minions {fila['jugadores']:>3} jugadores (ms): {medias}")
+
+
+if __name__ == "__main__":
+    main()
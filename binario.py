@@ -0,0 +1,370 @@
+# binario.py - Códec binario por esquema para los mensajes más frecuentes (alternativa a JSON)
+import json
+import struct
+import time
+
+from almacen_minions import EQUIPOS, TIPOS
+from instantaneas import REEMPLAZO
+
+# Las coordenadas viajan como int16 en cuartos de píxel (±8191 px, precisión 0.25 px)
+ESCALA_COORDENADAS = 4
+ESCALA_VIDA = 10        # vida, vida_max y daño de los minions en décimas (uint16)
+ESCALA_VELOCIDAD = 100  # velocidad de los minions en centésimas (uint16)
+
+# Primer byte de la carga: tipo de mensaje. Nunca coincide con '{' (0x7B), así que
+# una carga binaria se distingue de una JSON sin negociar nada al decodificar
+CODIGOS = {
+    "movimiento": 1,
+    "actualizacion_posicion": 2,
+    "actualizacion_posiciones": 3,
+    "jugador_dañado": 4,
+    "nueva_oleada": 5,
+    "estado_juego": 6,
+    "estado_delta": 7,
+    "entrada": 8,
+    "entrada_confirmada": 9
+}
+TIPOS_POR_CODIGO = {codigo: tipo for tipo, codigo in CODIGOS.items()}
+
+MOVIMIENTO = struct.Struct("!IhhBh")          # id, x, y, tiene scroll_y, scroll_y
+POSICION = struct.Struct("!Ihh")              # id, x, y
+ENTRADA = struct.Struct("!IIBhB")             # id, seq, tiene scroll_y, scroll_y, cantidad de teclas
+ENTRADA_CONFIRMADA = struct.Struct("!Ihh")    # seq, x, y
+CANTIDAD = struct.Struct("!H")
+JUGADOR_DAÑADO = struct.Struct("!Ifhh")       # id, vida, torre x, torre y
+NUEVA_OLEADA = struct.Struct("!HI?")          # contador, tiempo, limpiar
+INSTANTANEA = struct.Struct("!II")            # seq, longitud del JSON del resto del estado
+DELTA = struct.Struct("!III")                 # seq, base, longitud del JSON del delta
+RUTA = struct.Struct("!B")
+PUNTO = struct.Struct("!hh")
+# id, tipo, ruta, x, y, distancia, indice_punto_actual, vida, vida_max, daño, velocidad,
+# rango_ataque, objetivo, reduccion_daño
+MINION = struct.Struct("!IBBhhHBHHHHHhB")
+
+
+class ErrorCodec(ValueError):
+    """El contenido no encaja en el esquema binario (se usa JSON en su lugar)"""
+
+
+def _comprobar_claves(contenido, permitidas):
+    sobrantes = set(contenido) - permitidas
+    if sobrantes:
+        raise ErrorCodec(f"Campos sin esquema binario: {', '.join(sorted(sobrantes))}")
+
+
+def _id(valor):
+    return int(valor)
+
+
+def _coordenada(valor):
+    return round(valor * ESCALA_COORDENADAS)
+
+
+def _punto(valor):
+    return [valor[0] / ESCALA_COORDENADAS, valor[1] / ESCALA_COORDENADAS]
+
+
+# --- Mensajes pequeños -------------------------------------------------------
+
+def _codificar_movimiento(contenido):
+    _comprobar_claves(contenido, {"id", "pos", "scroll_y"})
+    x, y = contenido["pos"]
+    scroll_y = contenido.get("scroll_y")
+    return MOVIMIENTO.pack(_id(contenido["id"]), _coordenada(x), _coordenada(y),
+                           scroll_y is not None, _coordenada(scroll_y or 0))
+
+
+def _decodificar_movimiento(datos):
+    id_jugador, x, y, tiene_scroll, scroll_y = MOVIMIENTO.unpack(datos)
+    mensaje = {"id": str(id_jugador), "pos": _punto((x, y))}
+    if tiene_scroll:
+        mensaje["scroll_y"] = scroll_y / ESCALA_COORDENADAS
+    return mensaje
+
+
+def _codificar_entrada(contenido):
+    _comprobar_claves(contenido, {"id", "seq", "teclas", "scroll_y"})
+    scroll_y = contenido.get("scroll_y")
+    teclas = contenido["teclas"]
+    return ENTRADA.pack(_id(contenido["id"]), contenido["seq"], scroll_y is not None,
+                        _coordenada(scroll_y or 0), len(teclas)) + bytes(teclas)
+
+
+def _decodificar_entrada(datos):
+    id_jugador, seq, tiene_scroll, scroll_y, cantidad = ENTRADA.unpack_from(datos)
+    mensaje = {"id": str(id_jugador), "seq": seq,
+               "teclas": list(datos[ENTRADA.size:ENTRADA.size + cantidad])}
+    if tiene_scroll:
+        mensaje["scroll_y"] = scroll_y / ESCALA_COORDENADAS
+    return mensaje
+
+
+def _codificar_entrada_confirmada(contenido):
+    _comprobar_claves(contenido, {"seq", "pos"})
+    x, y = contenido["pos"]
+    return ENTRADA_CONFIRMADA.pack(contenido["seq"], _coordenada(x), _coordenada(y))
+
+
+def _decodificar_entrada_confirmada(datos):
+    seq, x, y = ENTRADA_CONFIRMADA.unpack(datos)
+    return {"seq": seq, "pos": _punto((x, y))}
+
+
+def _codificar_actualizacion_posicion(contenido):
+    _comprobar_claves(contenido, {"id", "pos"})
+    x, y = contenido["pos"]
+    return POSICION.pack(_id(contenido["id"]), _coordenada(x), _coordenada(y))
+
+
+def _decodificar_actualizacion_posicion(datos):
+    id_jugador, x, y = POSICION.unpack(datos)
+    return {"id": str(id_jugador), "pos": _punto((x, y))}
+
+
+def _codificar_actualizacion_posiciones(contenido):
+    _comprobar_claves(contenido, {"posiciones"})
+    posiciones = contenido["posiciones"]
+    partes = [CANTIDAD.pack(len(posiciones))]
+    for id_jugador, (x, y) in posiciones.items():
+        partes.append(POSICION.pack(_id(id_jugador), _coordenada(x), _coordenada(y)))
+    return b''.join(partes)
+
+
+def _decodificar_actualizacion_posiciones(datos):
+    cantidad, = CANTIDAD.unpack_from(datos)
+    posiciones = {}
+    for id_jugador, x, y in POSICION.iter_unpack(datos[CANTIDAD.size:CANTIDAD.size + cantidad * POSICION.size]):
+        posiciones[str(id_jugador)] = _punto((x, y))
+    return {"posiciones": posiciones}
+
+
+def _codificar_jugador_dañado(contenido):
+    _comprobar_claves(contenido, {"id", "vida", "torre_pos"})
+    x, y = contenido["torre_pos"]
+    return JUGADOR_DAÑADO.pack(_id(contenido["id"]), contenido["vida"], _coordenada(x), _coordenada(y))
+
+
+def _decodificar_jugador_dañado(datos):
+    id_jugador, vida, x, y = JUGADOR_DAÑADO.unpack(datos)
+    return {"id": str(id_jugador), "vida": vida, "torre_pos": _punto((x, y))}
+
+
+def _codificar_nueva_oleada(contenido):
+    _comprobar_claves(contenido, {"contador", "tiempo", "limpiar"})
+    return NUEVA_OLEADA.pack(contenido["contador"], contenido["tiempo"], bool(contenido.get("limpiar", False)))
+
+
+def _decodificar_nueva_oleada(datos):
+    contador, tiempo, limpiar = NUEVA_OLEADA.unpack(datos)
+    return {"contador": contador, "tiempo": tiempo, "limpiar": limpiar}
+
+
+# --- Minions e instantáneas ---------------------------------------------------
+
+def codificar_minions(minions):
+    """Tabla de minions {"aliados": [...], "enemigos": [...]}: rutas una vez y 26 bytes por minion"""
+    rutas = {}  # ruta_id -> índice
+    partes_rutas = []
+    partes_minions = []
+    for equipo in EQUIPOS:
+        lista = minions.get(equipo, [])
+        partes_minions.append(CANTIDAD.pack(len(lista)))
+        for minion in lista:
+            ruta_id = minion["ruta_id"]
+            if ruta_id not in rutas:
+                rutas[ruta_id] = len(rutas)
+                nombre = str(ruta_id).encode('utf-8')
+                puntos = minion["puntos_ruta"]
+                partes_rutas.append(RUTA.pack(len(nombre)) + nombre + RUTA.pack(len(puntos)))
+                partes_rutas.extend(PUNTO.pack(_coordenada(x), _coordenada(y)) for x, y in puntos)
+                partes_rutas.append(PUNTO.pack(*map(_coordenada, minion["destino"])))
+            x, y = minion["pos"]
+            objetivo = minion.get("objetivo")
+            partes_minions.append(MINION.pack(
+                minion.get("id", 0), TIPOS.index(minion["tipo"]), rutas[ruta_id], _coordenada(x), _coordenada(y),
+                _coordenada(minion.get("distancia", 0)), minion.get("indice_punto_actual", 0),
+                round(max(minion["vida"], 0) * ESCALA_VIDA), round(minion["vida_max"] * ESCALA_VIDA),
+                round(minion["daño"] * ESCALA_VIDA), round(minion["velocidad"] * ESCALA_VELOCIDAD),
+                round(minion["rango_ataque"]), -1 if objetivo is None else objetivo,
+                round(minion.get("reduccion_daño", 0))))
+    return b''.join([RUTA.pack(len(rutas))] + partes_rutas + partes_minions)
+
+
+def decodificar_minions(datos, desplazamiento=0):
+    """Inversa de codificar_minions; devuelve (minions, desplazamiento final)"""
+    cantidad_rutas, = RUTA.unpack_from(datos, desplazamiento)
+    desplazamiento += RUTA.size
+    rutas = []
+    for _ in range(cantidad_rutas):
+        largo, = RUTA.unpack_from(datos, desplazamiento)
+        desplazamiento += RUTA.size
+        nombre = bytes(datos[desplazamiento:desplazamiento + largo]).decode('utf-8')
+        desplazamiento += largo
+        cantidad_puntos, = RUTA.unpack_from(datos, desplazamiento)
+        desplazamiento += RUTA.size
+        puntos = []
+        for _ in range(cantidad_puntos):
+            puntos.append(_punto(PUNTO.unpack_from(datos, desplazamiento)))
+            desplazamiento += PUNTO.size
+        destino = _punto(PUNTO.unpack_from(datos, desplazamiento))
+        desplazamiento += PUNTO.size
+        rutas.append((nombre, puntos, destino))
+
+    minions = {}
+    for equipo in EQUIPOS:
+        cantidad, = CANTIDAD.unpack_from(datos, desplazamiento)
+        desplazamiento += CANTIDAD.size
+        fin = desplazamiento + cantidad * MINION.size
+        lista = []
+        for (id_minion, tipo, ruta, x, y, distancia, indice_punto, vida, vida_max, daño, velocidad,
+             rango, objetivo, reduccion) in MINION.iter_unpack(datos[desplazamiento:fin]):
+            nombre, puntos, destino = rutas[ruta]
+            lista.append({
+                "id": id_minion,
+                "tipo": TIPOS[tipo],
+                "vida": vida / ESCALA_VIDA,
+                "vida_max": vida_max / ESCALA_VIDA,
+                "daño": daño / ESCALA_VIDA,
+                "velocidad": velocidad / ESCALA_VELOCIDAD,
+                "ruta_id": nombre,
+                "pos": _punto((x, y)),
+                "objetivo": objetivo if objetivo >= 0 else None,
+                "equipo": equipo,
+                "rango_ataque": rango,
+                "destino": destino,
+                "puntos_ruta": puntos,
+                "indice_punto_actual": indice_punto,
+                "distancia": distancia / ESCALA_COORDENADAS,
+                "reduccion_daño": reduccion
+            })
+        minions[equipo] = lista
+        desplazamiento = fin
+    return minions, desplazamiento
+
+
+def _codificar_estado_juego(contenido):
+    # El resto del estado (mapa, estructuras, oleadas) no tiene un esquema fijo: va en JSON
+    resto = json.dumps({clave: valor for clave, valor in contenido.items()
+                        if clave not in ("seq", "minions")}).encode('utf-8')
+    return INSTANTANEA.pack(contenido["seq"], len(resto)) + resto + codificar_minions(contenido["minions"])
+
+
+def _decodificar_estado_juego(datos):
+    seq, largo = INSTANTANEA.unpack_from(datos)
+    inicio = INSTANTANEA.size
+    mensaje = json.loads(bytes(datos[inicio:inicio + largo]))
+    mensaje["seq"] = seq
+    mensaje["minions"], _ = decodificar_minions(datos, inicio + largo)
+    return mensaje
+
+
+def _codificar_estado_delta(contenido):
+    # Los minions no van como delta sino como tabla completa: 26 bytes por minion
+    # ocupan menos que el delta JSON de sus campos cambiados
+    _comprobar_claves(contenido, {"seq", "base", "delta", "minions_completos", "minions"})
+    if "minions_completos" not in contenido:
+        raise ErrorCodec("estado_delta binario necesita la tabla completa de minions")
+    delta = json.dumps(contenido["delta"]).encode('utf-8')
+    return (DELTA.pack(contenido["seq"], contenido["base"], len(delta)) + delta
+            + codificar_minions(contenido["minions_completos"]))
+
+
+def _decodificar_estado_delta(datos):
+    seq, base, largo = DELTA.unpack_from(datos)
+    inicio = DELTA.size
+    minions, _ = decodificar_minions(datos, inicio + largo)
+    return {
+        "seq": seq,
+        "base": base,
+        "delta": json.loads(bytes(datos[inicio:inicio + largo])),
+        "minions": [REEMPLAZO, minions]  # Mismo significado que un delta que reemplaza la lista
+    }
+
+
+CODIFICADORES = {
+    "movimiento": _codificar_movimiento,
+    "actualizacion_posicion": _codificar_actualizacion_posicion,
+    "actualizacion_posiciones": _codificar_actualizacion_posiciones,
+    "jugador_dañado": _codificar_jugador_dañado,
+    "nueva_oleada": _codificar_nueva_oleada,
+    "estado_juego": _codificar_estado_juego,
+    "estado_delta": _codificar_estado_delta,
+    "entrada": _codificar_entrada,
+    "entrada_confirmada": _codificar_entrada_confirmada
+}
+DECODIFICADORES = {
+    "movimiento": _decodificar_movimiento,
+    "actualizacion_posicion": _decodificar_actualizacion_posicion,
+    "actualizacion_posiciones": _decodificar_actualizacion_posiciones,
+    "jugador_dañado": _decodificar_jugador_dañado,
+    "nueva_oleada": _decodificar_nueva_oleada,
+    "estado_juego": _decodificar_estado_juego,
+    "estado_delta": _decodificar_estado_delta,
+    "entrada": _decodificar_entrada,
+    "entrada_confirmada": _decodificar_entrada_confirmada
+}
+
+
+def codificar(tipo, contenido):
+    """Carga binaria del mensaje; ErrorCodec si el tipo o el contenido no tienen esquema"""
+    codificador = CODIFICADORES.get(tipo)
+    if codificador is None:
+        raise ErrorCodec(f"El tipo {tipo} no tiene esquema binario")
+    contenido = {clave: valor for clave, valor in contenido.items() if clave != "tipo"}
+    try:
+        return bytes((CODIGOS[tipo],)) + codificador(contenido)
+    except (KeyError, TypeError, ValueError, IndexError, struct.error) as e:
+        raise ErrorCodec(f"{tipo}: {e}")
+
+
+def es_binario(carga):
+    return bool(carga) and carga[0] in TIPOS_POR_CODIGO
+
+
+def decodificar(carga):
+    """Diccionario del mensaje (con "tipo") a partir de una carga binaria"""
+    tipo = TIPOS_POR_CODIGO[carga[0]]
+    mensaje = DECODIFICADORES[tipo](memoryview(carga)[1:])
+    mensaje["tipo"] = tipo
+    return mensaje
+
+
+def comparar(repeticiones=2000):
+    """Bytes y tiempo de codificar + decodificar cada mensaje frecuente, JSON frente a binario"""
+    from almacen_minions import AlmacenMinions
+    from mapa import MAPA
+    from protocolo import decodificar_mensaje
+    from salas import crear_estado_inicial
+
+    # Una oleada de cada equipo (como Sala.generar_oleada), avanzada un poco por sus rutas
+    minions = AlmacenMinions()
+    for equipo in EQUIPOS:
+        minions.agregar_varios(MAPA.oleada(equipo))
+    minions.mover(40)
+
+    ejemplos = {
+        "movimiento": {"id": "12", "pos": [402.5, 300.0], "scroll_y": 0},
+        "actualizacion_posiciones": {"posiciones": {str(i): [49 + i * 7.5, 500 - i * 3.25] for i in range(20)}},
+        "jugador_dañado": {"id": "7", "vida": 85, "torre_pos": [200, 480]},
+        "nueva_oleada": {"contador": 3, "tiempo": 125, "limpiar": False},
+        "estado_juego": {"seq": 41, **crear_estado_inicial(), "minions": minions.vista_completa()}
+    }
+    resultados = {}
+    for tipo, contenido in ejemplos.items():
+        fila = {}
+        for formato, codificador in (("json", lambda: json.dumps({"tipo": tipo, **contenido}).encode('utf-8')),
+                                     ("binario", lambda: codificar(tipo, contenido))):
+            carga = codificador()
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                decodificar_mensaje(codificador())
+            fila[formato] = {"bytes": len(carga),
+                             "us_por_mensaje": round((time.perf_counter() - inicio) / repeticiones * 1e6, 2)}
+        fila["reduccion_bytes"] = round(1 - fila["binario"]["bytes"] / fila["json"]["bytes"], 3)
+        fila["reduccion_cpu"] = round(1 - fila["binario"]["us_por_mensaje"] / fila["json"]["us_por_mensaje"], 3)
+        resultados[tipo] = fila
+    return resultados
+
+
+if __name__ == "__main__":
+    print(json.dumps(comparar(), indent=2, ensure_ascii=False))
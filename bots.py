@@ -0,0 +1,297 @@
+# bots.py - Enjambre de jugadores simulados (sin pygame) para pruebas de carga del servidor
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+from collections import deque
+
+from protocolo import (DecodificadorTramas, FORMATO_JSON, FORMATOS, MODO_TRAMAS, codificar_mensaje,
+                       decodificar_mensaje, empaquetar_trama)
+from mapa import MAPA
+from estadisticas import percentiles
+
+TASA_MOVIMIENTO = 60   # Mensajes de movimiento por segundo, como el bucle de Juego
+INTERVALO_PING = 1.0   # Segundos entre medidas de latencia de cada bot
+VELOCIDAD_BOT = 5      # Píxeles por fotograma, igual que el jugador por defecto
+INSTANTANEAS_RECORDADAS = 32  # Como HistorialInstantaneas del cliente
+
+
+class EstadisticasEnjambre:
+    """Contadores de todos los bots de un proceso"""
+
+    def __init__(self):
+        self.conectados = 0
+        self.errores = 0
+        self.mensajes_recibidos = 0
+        self.bytes_recibidos = 0
+        self.mensajes_enviados = 0
+        self.bytes_enviados = 0
+        self.por_tipo = {}
+        self.latencias = []  # ms, ida y vuelta de ping/pong a través de la cola de salida
+
+    def resumen(self):
+        return {
+            "conectados": self.conectados,
+            "errores": self.errores,
+            "mensajes_recibidos": self.mensajes_recibidos,
+            "bytes_recibidos": self.bytes_recibidos,
+            "mensajes_enviados": self.mensajes_enviados,
+            "bytes_enviados": self.bytes_enviados,
+            "por_tipo": self.por_tipo,
+            "latencias": self.latencias
+        }
+
+
+class Bot:
+    """Jugador simulado con el mismo protocolo que Juego: conectar, nuevo_jugador,
+    movimiento a 60 Hz recorriendo una ruta del mapa, y desconectar al terminar."""
+
+    def __init__(self, numero, host, port, ruta, estadisticas, sala=None, codec=FORMATO_JSON):
+        self.numero = numero
+        self.host = host
+        self.port = port
+        self.ruta = ruta
+        self.estadisticas = estadisticas
+        self.sala = sala
+        self.codec = codec
+        self.formato = FORMATO_JSON
+        self.id_cliente = None
+        self.writer = None
+        self.bienvenida = asyncio.Event()
+        # Instantáneas recibidas: se confirman como hace Juego para recibir deltas y no keyframes
+        self.instantaneas = deque(maxlen=INSTANTANEAS_RECORDADAS)
+        self.distancia = random.uniform(0, 2 * ruta.longitud_total)
+
+    def posicion(self):
+        """Ida y vuelta sobre la ruta"""
+        longitud = self.ruta.longitud_total
+        d = self.distancia % (2 * longitud)
+        return list(self.ruta.posicion(d if d <= longitud else 2 * longitud - d))
+
+    def enviar_mensaje(self, tipo, contenido):
+        """Enviar mensaje al servidor (mismo formato que Juego.enviar_mensaje)"""
+        datos = empaquetar_trama(codificar_mensaje(tipo, {
+            "id": self.id_cliente,
+            **contenido
+        }, self.formato))
+        self.writer.write(datos)
+        self.estadisticas.mensajes_enviados += 1
+        self.estadisticas.bytes_enviados += len(datos)
+
+    def confirmar_instantanea(self, seq):
+        """ack_estado de una instantánea (el bot no aplica los deltas, solo recuerda los seq)"""
+        if seq is not None:
+            self.instantaneas.append(seq)
+            self.enviar_mensaje("ack_estado", {"seq": seq})
+
+    async def recibir_datos(self, reader):
+        """Cuenta mensajes y bytes recibidos, confirma instantáneas y mide la latencia de los pong"""
+        decodificador = DecodificadorTramas(MODO_TRAMAS)
+        while True:
+            datos = await reader.read(65536)
+            if not datos:
+                break
+            self.estadisticas.bytes_recibidos += len(datos)
+            for carga in decodificador.alimentar(datos):
+                mensaje = decodificar_mensaje(carga)
+                tipo = mensaje.get("tipo")
+                self.estadisticas.mensajes_recibidos += 1
+                self.estadisticas.por_tipo[tipo] = self.estadisticas.por_tipo.get(tipo, 0) + 1
+                if tipo == "bienvenida":
+                    self.id_cliente = mensaje.get("id")
+                    self.formato = mensaje.get("codec", FORMATO_JSON)
+                    self.bienvenida.set()
+                    self.confirmar_instantanea(mensaje.get("seq_estado"))
+                elif tipo == "estado_juego":
+                    self.confirmar_instantanea(mensaje.get("seq"))
+                elif tipo == "estado_delta":
+                    if mensaje.get("base") in self.instantaneas:
+                        self.confirmar_instantanea(mensaje.get("seq"))
+                    else:
+                        self.enviar_mensaje("ack_estado", {"resync": True})  # Perdimos la base
+                elif tipo == "pong" and mensaje.get("t") is not None:
+                    self.estadisticas.latencias.append((time.perf_counter() - mensaje["t"]) * 1000)
+
+    async def ejecutar(self, fin):
+        """Ciclo de vida completo del bot hasta el instante `fin` (time.time())"""
+        try:
+            reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        except OSError:
+            self.estadisticas.errores += 1
+            return
+        receptor = asyncio.create_task(self.recibir_datos(reader))
+        try:
+            self.enviar_mensaje("conectar", {"codec": self.codec, **({"sala": self.sala} if self.sala else {})})
+            await asyncio.wait_for(self.bienvenida.wait(), timeout=10)
+            self.estadisticas.conectados += 1
+            self.enviar_mensaje("nuevo_jugador", {
+                "nombre": f"Bot{self.numero}",
+                "personaje": 1 + self.numero % 4,
+                "pos": self.posicion()
+            })
+
+            paso = 1 / TASA_MOVIMIENTO
+            siguiente = time.monotonic()
+            siguiente_ping = siguiente + random.uniform(0, INTERVALO_PING)
+            while time.time() < fin and not receptor.done():
+                self.distancia += VELOCIDAD_BOT
+                self.enviar_mensaje("movimiento", {"pos": self.posicion()})
+                if siguiente >= siguiente_ping:
+                    self.enviar_mensaje("ping", {"t": time.perf_counter()})
+                    siguiente_ping += INTERVALO_PING
+                await self.writer.drain()
+                siguiente += paso
+                await asyncio.sleep(max(0.0, siguiente - time.monotonic()))
+
+            self.enviar_mensaje("desconectar", {})
+            await self.writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            self.estadisticas.errores += 1
+        finally:
+            receptor.cancel()
+            self.writer.close()
+
+
+async def enjambre(indice, total, bots, host, port, inicio, duracion, tasa_conexion, sala, codec):
+    """Lanza los bots de un proceso escalonados para que la carga crezca de forma gradual"""
+    estadisticas = EstadisticasEnjambre()
+    rutas = MAPA.rutas_carriles
+    fin = inicio + duracion
+
+    async def lanzar(numero):
+        # Los bots de todos los procesos se intercalan: numero / tasa_conexion segundos tras el inicio
+        await asyncio.sleep(max(0.0, inicio + numero / tasa_conexion - time.time()))
+        if time.time() < fin:
+            await Bot(numero, host, port, rutas[numero % len(rutas)], estadisticas, sala,
+                      codec).ejecutar(fin)
+
+    await asyncio.gather(*(lanzar(indice + k * total) for k in range(bots)))
+    return estadisticas.resumen()
+
+
+def ejecutar_proceso(indice, total, bots, host, port, inicio, duracion, tasa_conexion, sala, codec, resultados):
+    """Punto de entrada de cada proceso del enjambre"""
+    try:
+        resultados.put(asyncio.run(enjambre(indice, total, bots, host, port, inicio, duracion, tasa_conexion,
+                                            sala, codec)))
+    except Exception as e:
+        print(f"Error en el proceso de bots {indice}: {e}")
+        resultados.put(EstadisticasEnjambre().resumen())
+
+
+async def monitorear(host, port, inicio, fin, intervalo=1.0):
+    """Pide las métricas del servidor cada `intervalo` y calcula el tick medio de cada intervalo"""
+    reader, writer = await asyncio.open_connection(host, port)
+    decodificador = DecodificadorTramas(MODO_TRAMAS)
+    muestras = []
+    anterior = None
+    try:
+        while time.time() < fin:
+            writer.write(empaquetar_trama(codificar_mensaje("metricas", {})))
+            await writer.drain()
+            metricas = None
+            while metricas is None:
+                datos = await reader.read(65536)
+                if not datos:
+                    return muestras
+                for carga in decodificador.alimentar(datos):
+                    mensaje = decodificar_mensaje(carga)
+                    if mensaje.get("tipo") == "metricas":
+                        metricas = mensaje
+
+            simulacion = metricas["simulacion"]
+            actual = (simulacion["tick"]["ejecuciones"], simulacion["tick"]["media_ms"] * simulacion["tick"]["ejecuciones"],
+                      simulacion["ticks_saltados"])
+            if anterior is not None and actual[0] > anterior[0]:
+                muestras.append({
+                    "t": round(time.time() - inicio, 3),
+                    "conexiones": metricas["conexiones"] - 1,  # Sin contar la del monitor
+                    "tick_ms": round((actual[1] - anterior[1]) / (actual[0] - anterior[0]), 3),
+                    "tick_max_ms": simulacion["tick"]["max_ms"],
+                    "ticks_saltados": actual[2] - anterior[2],
+                    "presupuesto_ms": round(1000 / simulacion["tasa"], 3)
+                })
+            anterior = actual
+            await asyncio.sleep(intervalo)
+    finally:
+        writer.close()
+    return muestras
+
+
+def conexiones_degradacion(muestras, umbral):
+    """Primer número de conexiones con el tick por encima de `umbral` x presupuesto o saltando ticks"""
+    for muestra in muestras:
+        if muestra["tick_ms"] > umbral * muestra["presupuesto_ms"] or muestra["ticks_saltados"]:
+            return muestra["conexiones"]
+    return None
+
+
+def generar_informe(resultados, muestras, duracion, umbral):
+    """Combina los resultados de todos los procesos y las muestras del servidor"""
+    latencias = [latencia for resultado in resultados for latencia in resultado["latencias"]]
+    total = {clave: sum(resultado[clave] for resultado in resultados)
+             for clave in ("conectados", "errores", "mensajes_recibidos", "bytes_recibidos",
+                           "mensajes_enviados", "bytes_enviados")}
+    por_tipo = {}
+    for resultado in resultados:
+        for tipo, cantidad in resultado["por_tipo"].items():
+            por_tipo[tipo] = por_tipo.get(tipo, 0) + cantidad
+    return {
+        **total,
+        "duracion": duracion,
+        "latencia_ms": {**{clave: round(valor, 3) if valor is not None else None
+                           for clave, valor in percentiles(latencias).items()},
+                        "max": round(max(latencias), 3) if latencias else None,
+                        "muestras": len(latencias)},
+        "mensajes_por_segundo": round(total["mensajes_recibidos"] / duracion, 1),
+        "bytes_por_segundo": round(total["bytes_recibidos"] / duracion, 1),
+        "mensajes_enviados_por_segundo": round(total["mensajes_enviados"] / duracion, 1),
+        "por_tipo": por_tipo,
+        "conexiones_degradacion": conexiones_degradacion(muestras, umbral),
+        "servidor": muestras
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga: enjambre de jugadores simulados")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--procesos", type=int, default=4, help="Procesos del enjambre")
+    parser.add_argument("--bots", type=int, default=50, help="Jugadores simulados por proceso")
+    parser.add_argument("--duracion", type=float, default=60, help="Segundos de prueba")
+    parser.add_argument("--tasa-conexion", type=float, default=10,
+                        help="Conexiones nuevas por segundo (rampa para encontrar la degradación)")
+    parser.add_argument("--umbral", type=float, default=0.5,
+                        help="Fracción del presupuesto del tick a partir de la cual se considera degradado")
+    parser.add_argument("--sala", default=None, help="Sala a la que se unen los bots")
+    parser.add_argument("--codec", choices=FORMATOS, default=FORMATO_JSON,
+                        help="Formato de los mensajes frecuentes (para comparar bytes por segundo)")
+    parser.add_argument("--salida", default=None, help="Archivo JSON para el informe")
+    args = parser.parse_args()
+
+    inicio = time.time() + 1  # Margen para que arranquen todos los procesos
+    resultados = multiprocessing.Queue()
+    procesos = [multiprocessing.Process(target=ejecutar_proceso, daemon=True,
+                                        args=(i, args.procesos, args.bots, args.host, args.port, inicio,
+                                              args.duracion, args.tasa_conexion, args.sala, args.codec, resultados))
+                for i in range(args.procesos)]
+    for proceso in procesos:
+        proceso.start()
+
+    muestras = asyncio.run(monitorear(args.host, args.port, inicio, inicio + args.duracion))
+    datos = [resultados.get() for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+
+    informe = generar_informe(datos, muestras, args.duracion, args.umbral)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    resumen = {clave: valor for clave, valor in informe.items() if clave != "servidor"}
+    print(json.dumps(resumen, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# colas.py - Colas de salida acotadas por cliente con políticas de desbordamiento
+import threading
+from collections import deque
+
+# Clases de mensaje: solo posiciones e instantáneas se pueden descartar o fusionar
+POSICION = "posicion"
+ESTADO = "estado"
+EVENTO = "evento"
+
+# Políticas al llenarse la cola
+DESCARTAR_POSICIONES = "descartar_posiciones"  # Tirar la actualización de posición más antigua
+FUSIONAR_ESTADO = "fusionar_estado"            # La instantánea nueva sustituye a la encolada
+DESCONECTAR = "desconectar"                    # Cerrar la conexión del cliente lento
+POLITICAS = (DESCARTAR_POSICIONES, FUSIONAR_ESTADO, DESCONECTAR)
+
+
+class ColaSalida:
+    """Cola de salida de un cliente, vaciada por su propio escritor (hilo o tarea).
+
+    Si la cola está llena y la política no puede hacer sitio, se cierra y el
+    escritor desconecta al cliente; así un cliente lento nunca frena al resto.
+    """
+
+    def __init__(self, capacidad=256, politica=DESCARTAR_POSICIONES, al_encolar=None):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de cola desconocida: {politica} (opciones: {', '.join(POLITICAS)})")
+        self.capacidad = capacidad
+        self.politica = politica
+        self.al_encolar = al_encolar  # Aviso para escritores asyncio (p. ej. Event.set)
+        self.elementos = deque()  # (clase, datos)
+        self.condicion = threading.Condition()
+        self.cerrada = False
+        self.desbordada = False
+
+        # Contadores
+        self.encolados = 0
+        self.enviados = 0
+        self.bytes_enviados = 0
+        self.descartados = 0
+        self.fusionados = 0
+        self.profundidad_maxima = 0
+
+    def poner(self, datos, clase=EVENTO):
+        """Encola datos ya empaquetados; devuelve False si la cola está cerrada"""
+        with self.condicion:
+            if self.cerrada:
+                return False
+            if clase == ESTADO and self.politica == FUSIONAR_ESTADO and self._fusionar_estado(datos):
+                encolado = True
+            elif len(self.elementos) >= self.capacidad and not self._hacer_sitio():
+                # Sin sitio posible: cerrar para que el escritor desconecte al cliente
+                self.desbordada = True
+                self._cerrar()
+                encolado = False
+            else:
+                self.elementos.append((clase, datos))
+                self.encolados += 1
+                self.profundidad_maxima = max(self.profundidad_maxima, len(self.elementos))
+                self.condicion.notify()
+                encolado = True
+        if self.al_encolar:
+            self.al_encolar()
+        return encolado
+
+    def _fusionar_estado(self, datos):
+        """Sustituye la instantánea pendiente más reciente por la nueva"""
+        for indice in range(len(self.elementos) - 1, -1, -1):
+            if self.elementos[indice][0] == ESTADO:
+                self.elementos[indice] = (ESTADO, datos)
+                self.fusionados += 1
+                return True
+        return False
+
+    def _hacer_sitio(self):
+        """Aplica la política para liberar un hueco; False si hay que desconectar"""
+        if self.politica == DESCARTAR_POSICIONES:
+            clases_descartables = (POSICION,)
+        elif self.politica == FUSIONAR_ESTADO:
+            clases_descartables = (ESTADO,)
+        else:
+            return False
+        for indice, (clase, _) in enumerate(self.elementos):
+            if clase in clases_descartables:
+                del self.elementos[indice]
+                self.descartados += 1
+                return True
+        return False
+
+    def obtener(self, timeout=None):
+        """Espera y devuelve los siguientes datos (escritor en hilo); None si se cerró"""
+        with self.condicion:
+            while not self.elementos and not self.cerrada:
+                if not self.condicion.wait(timeout):
+                    return None
+            if not self.elementos:
+                return None
+            _, datos = self.elementos.popleft()
+            self._contar_envio(datos)
+            return datos
+
+    def vaciar(self):
+        """Saca todos los datos pendientes sin bloquear (escritor asyncio)"""
+        with self.condicion:
+            pendientes = [datos for _, datos in self.elementos]
+            self.elementos.clear()
+            for datos in pendientes:
+                self._contar_envio(datos)
+            return pendientes
+
+    def _contar_envio(self, datos):
+        self.enviados += 1
+        self.bytes_enviados += len(datos)
+
+    def cerrar(self):
+        """Cierra la cola y despierta al escritor"""
+        with self.condicion:
+            self._cerrar()
+        if self.al_encolar:
+            self.al_encolar()
+
+    def _cerrar(self):
+        self.cerrada = True
+        self.condicion.notify_all()
+
+    def estadisticas(self):
+        """Contadores de la cola para las métricas del servidor"""
+        with self.condicion:
+            return {
+                "profundidad": len(self.elementos),
+                "profundidad_maxima": self.profundidad_maxima,
+                "encolados": self.encolados,
+                "enviados": self.enviados,
+                "bytes_enviados": self.bytes_enviados,
+                "descartados": self.descartados,
+                "fusionados": self.fusionados,
+                "desbordada": self.desbordada
+            }
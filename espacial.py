@@ -0,0 +1,143 @@
+# espacial.py - Índices espaciales de rejilla uniforme para consultas de rango
+import math
+
+import numpy as np
+
+
+class IndiceEspacial:
+    """Rejilla uniforme para entidades que se mueven (jugadores, minions...).
+
+    Cada entidad vive en una celda; al moverse solo cambia de celda si cruza un
+    borde. Una consulta de radio recorre las celdas que toca el círculo, así que
+    cuesta O(k) en lugar de recorrer todas las entidades.
+    """
+
+    def __init__(self, tamano_celda=100):
+        self.tamano_celda = tamano_celda
+        self.celdas = {}      # (cx, cy) -> {clave: None} (dict para mantener el orden de inserción)
+        self.posiciones = {}  # clave -> (x, y)
+        self.celda_de = {}    # clave -> (cx, cy)
+
+    def __len__(self):
+        return len(self.posiciones)
+
+    def __contains__(self, clave):
+        return clave in self.posiciones
+
+    def _celda(self, x, y):
+        return (math.floor(x / self.tamano_celda), math.floor(y / self.tamano_celda))
+
+    def actualizar(self, clave, x, y):
+        """Inserta la entidad o actualiza su posición (cambia de celda solo si hace falta)"""
+        celda = self._celda(x, y)
+        anterior = self.celda_de.get(clave)
+        if anterior != celda:
+            if anterior is not None:
+                self._sacar_de_celda(clave, anterior)
+            self.celdas.setdefault(celda, {})[clave] = None
+            self.celda_de[clave] = celda
+        self.posiciones[clave] = (x, y)
+
+    def quitar(self, clave):
+        celda = self.celda_de.pop(clave, None)
+        if celda is not None:
+            self._sacar_de_celda(clave, celda)
+        self.posiciones.pop(clave, None)
+
+    def _sacar_de_celda(self, clave, celda):
+        miembros = self.celdas.get(celda)
+        if miembros is not None:
+            miembros.pop(clave, None)
+            if not miembros:
+                del self.celdas[celda]
+
+    def en_rango(self, x, y, radio):
+        """Claves de las entidades a distancia <= radio de (x, y)"""
+        cx0, cy0 = self._celda(x - radio, y - radio)
+        cx1, cy1 = self._celda(x + radio, y + radio)
+        radio2 = radio * radio
+        encontradas = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for clave in self.celdas.get((cx, cy), ()):
+                    px, py = self.posiciones[clave]
+                    if (px - x) ** 2 + (py - y) ** 2 <= radio2:
+                        encontradas.append(clave)
+        return encontradas
+
+    def en_rectangulo(self, x0, y0, x1, y1):
+        """Claves de las entidades dentro del rectángulo [x0, x1] x [y0, y1]"""
+        cx0, cy0 = self._celda(x0, y0)
+        cx1, cy1 = self._celda(x1, y1)
+        encontradas = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for clave in self.celdas.get((cx, cy), ()):
+                    px, py = self.posiciones[clave]
+                    if x0 <= px <= x1 and y0 <= py <= y1:
+                        encontradas.append(clave)
+        return encontradas
+
+
+class IndiceEstatico:
+    """Índice de puntos fijos (torres, inhibidores, nexos) para consultas en lote.
+
+    Para cada celda se precalculan los puntos que pueden quedar a menos de
+    `radio_max` de algún punto de la celda, ordenados por prioridad (su índice).
+    Así una consulta solo compara contra unos pocos candidatos.
+    """
+
+    def __init__(self, puntos, radio_max, tamano_celda=None):
+        self.puntos = np.asarray(puntos, dtype=float).reshape(-1, 2)
+        self.radio_max = radio_max
+        self.tamano_celda = tamano_celda or max(radio_max, 1)
+        if len(self.puntos):
+            self.origen = self.puntos.min(axis=0) - radio_max
+            extremo = self.puntos.max(axis=0) + radio_max
+        else:
+            self.origen = np.zeros(2)
+            extremo = np.zeros(2)
+        self.columnas, self.filas = (np.floor((extremo - self.origen) / self.tamano_celda).astype(int) + 1)
+
+        candidatos = []
+        for fila in range(self.filas):
+            for columna in range(self.columnas):
+                x0 = self.origen[0] + columna * self.tamano_celda
+                y0 = self.origen[1] + fila * self.tamano_celda
+                # Distancia de cada punto al rectángulo de la celda
+                dx = np.maximum(np.maximum(x0 - self.puntos[:, 0], self.puntos[:, 0] - (x0 + self.tamano_celda)), 0)
+                dy = np.maximum(np.maximum(y0 - self.puntos[:, 1], self.puntos[:, 1] - (y0 + self.tamano_celda)), 0)
+                candidatos.append(np.flatnonzero(dx * dx + dy * dy <= radio_max * radio_max))
+        ancho = max([1] + [len(c) for c in candidatos])
+        self.tabla = np.full((len(candidatos), ancho), -1, dtype=np.int32)
+        for celda, indices in enumerate(candidatos):
+            self.tabla[celda, :len(indices)] = indices
+
+    def _celdas(self, posiciones):
+        relativas = np.floor((posiciones - self.origen) / self.tamano_celda).astype(int)
+        columnas = np.clip(relativas[:, 0], 0, self.columnas - 1)
+        filas = np.clip(relativas[:, 1], 0, self.filas - 1)
+        return filas * self.columnas + columnas
+
+    def primero_en_rango(self, posiciones, radios):
+        """Para cada posición, índice del primer punto a menos de su radio (-1 si ninguno).
+
+        Los radios no deben superar `radio_max`.
+        """
+        posiciones = np.asarray(posiciones, dtype=float).reshape(-1, 2)
+        if not len(posiciones) or not len(self.puntos):
+            return np.full(len(posiciones), -1, dtype=np.int32)
+        candidatos = self.tabla[self._celdas(posiciones)]
+        validos = candidatos >= 0
+        delta = posiciones[:, None, :] - self.puntos[np.maximum(candidatos, 0)]
+        en_rango = validos & (np.hypot(delta[..., 0], delta[..., 1]) < np.asarray(radios)[:, None])
+        # Los candidatos están ordenados por índice: argmax da el de mayor prioridad
+        primero = candidatos[np.arange(len(posiciones)), en_rango.argmax(axis=1)]
+        return np.where(en_rango.any(axis=1), primero, -1)
+
+    def en_rango(self, x, y, radio):
+        """Índices de los puntos a distancia <= radio de (x, y) (radio <= radio_max)"""
+        candidatos = self.tabla[self._celdas(np.array([[x, y]], dtype=float))[0]]
+        candidatos = candidatos[candidatos >= 0]
+        delta = self.puntos[candidatos] - (x, y)
+        return candidatos[np.hypot(delta[:, 0], delta[:, 1]) <= radio].tolist()
@@ -0,0 +1,10 @@
+# estadisticas.py - Utilidades de estadística para las mediciones (bots.py, bench_render.py)
+
+
+def percentiles(muestras, cuantiles=(50, 90, 99)):
+    """Percentiles (por el método del rango más cercano) de una lista de muestras"""
+    if not muestras:
+        return {f"p{q}": None for q in cuantiles}
+    ordenadas = sorted(muestras)
+    return {f"p{q}": ordenadas[min(len(ordenadas) - 1, max(0, round(q / 100 * len(ordenadas)) - 1))]
+            for q in cuantiles}
@@ -0,0 +1,115 @@
+# instantaneas.py - Instantáneas numeradas del estado del juego y compresión por deltas
+from collections import OrderedDict
+
+# Formato de un delta (serializable a JSON):
+#   None                                  -> sin cambios
+#   [REEMPLAZO, valor]                    -> el valor se sustituye entero
+#   [DICCIONARIO, {clave: delta}, [borradas]]
+#   [LISTA, longitud, {"indice": delta}, [elementos_nuevos]]
+REEMPLAZO = 0
+DICCIONARIO = 1
+LISTA = 2
+
+
+def copiar_estado(valor):
+    """Copia profunda del estado normalizada como JSON (las tuplas pasan a listas)"""
+    if isinstance(valor, dict):
+        return {clave: copiar_estado(v) for clave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [copiar_estado(v) for v in valor]
+    return valor
+
+
+def _es_contenedor(valor):
+    return isinstance(valor, (dict, list))
+
+
+def calcular_delta(anterior, actual):
+    """Calcula el delta que transforma `anterior` en `actual` (None si son iguales)"""
+    if type(anterior) is dict and type(actual) is dict:
+        cambios = {}
+        for clave, valor in actual.items():
+            if clave in anterior:
+                delta = calcular_delta(anterior[clave], valor)
+                if delta is not None:
+                    cambios[clave] = delta
+            else:
+                cambios[clave] = [REEMPLAZO, valor]
+        borradas = [clave for clave in anterior if clave not in actual]
+        if not cambios and not borradas:
+            return None
+        return [DICCIONARIO, cambios, borradas]
+
+    if type(anterior) is list and type(actual) is list:
+        # Listas de escalares (posiciones, colores...) se reemplazan enteras
+        if not any(_es_contenedor(v) for v in actual) and not any(_es_contenedor(v) for v in anterior):
+            return None if anterior == actual else [REEMPLAZO, actual]
+        cambios = {}
+        for indice, valor in enumerate(actual[:len(anterior)]):
+            delta = calcular_delta(anterior[indice], valor)
+            if delta is not None:
+                cambios[str(indice)] = delta
+        nuevos = actual[len(anterior):]
+        if not cambios and len(anterior) == len(actual):
+            return None
+        return [LISTA, len(actual), cambios, nuevos]
+
+    if type(anterior) is type(actual) and anterior == actual:
+        return None
+    return [REEMPLAZO, actual]
+
+
+def aplicar_delta(base, delta):
+    """Aplica un delta sobre `base` sin modificarla (comparte lo que no cambió)"""
+    if delta is None:
+        return base
+    etiqueta = delta[0]
+    if etiqueta == REEMPLAZO:
+        return delta[1]
+    if etiqueta == DICCIONARIO:
+        _, cambios, borradas = delta
+        nuevo = dict(base)
+        for clave, sub_delta in cambios.items():
+            nuevo[clave] = aplicar_delta(base.get(clave), sub_delta)
+        for clave in borradas:
+            nuevo.pop(clave, None)
+        return nuevo
+    if etiqueta == LISTA:
+        _, longitud, cambios, nuevos = delta
+        nuevo = base[:longitud]
+        for indice, sub_delta in cambios.items():
+            indice = int(indice)
+            nuevo[indice] = aplicar_delta(nuevo[indice], sub_delta)
+        nuevo.extend(nuevos)
+        return nuevo
+    raise ValueError(f"Etiqueta de delta desconocida: {etiqueta}")
+
+
+class HistorialInstantaneas:
+    """Guarda las últimas instantáneas del estado, indexadas por número de secuencia"""
+
+    def __init__(self, capacidad=32):
+        self.capacidad = capacidad
+        self.instantaneas = OrderedDict()  # seq -> estado (no se modifica una vez guardado)
+        self.ultima_seq = 0
+
+    def registrar(self, estado):
+        """Copia el estado actual como nueva instantánea y devuelve su número de secuencia"""
+        self.ultima_seq += 1
+        self.guardar(self.ultima_seq, copiar_estado(estado))
+        return self.ultima_seq
+
+    def guardar(self, seq, estado):
+        """Guarda una instantánea ya copiada (el cliente la recibe del servidor)"""
+        self.instantaneas[seq] = estado
+        self.ultima_seq = max(self.ultima_seq, seq)
+        while len(self.instantaneas) > self.capacidad:
+            self.instantaneas.popitem(last=False)
+
+    def obtener(self, seq):
+        """Devuelve la instantánea `seq` o None si no existe o ya se descartó"""
+        return self.instantaneas.get(seq)
+
+    def ultima(self):
+        """Devuelve (seq, estado) de la instantánea más reciente"""
+        return self.ultima_seq, self.instantaneas.get(self.ultima_seq)
@@ -0,0 +1,80 @@
+# interpolacion.py - Buffer de instantáneas del servidor para dibujar con interpolación
+from collections import deque
+
+RETRASO_INTERPOLACION = 0.1    # Segundos por detrás del servidor a los que se dibuja
+EXTRAPOLACION_MAXIMA = 0.25    # Segundos que se extrapola si faltan instantáneas
+CAPACIDAD_BUFFER = 32          # Instantáneas guardadas (a 20 Hz, 1.6 s)
+
+
+class BufferInterpolacion:
+    """Instantáneas con marca de tiempo de un conjunto de entidades (clave -> tupla de valores).
+
+    `muestrear(ahora)` devuelve el estado de hace `retraso` segundos interpolando
+    linealmente entre las dos instantáneas que lo rodean. Si todavía no ha llegado
+    la siguiente (paquete perdido o retrasado), extrapola con la última velocidad
+    durante como mucho `extrapolacion_maxima` segundos y después se queda quieto.
+
+    Las instantáneas guardadas no se modifican nunca (se sustituyen), así que el
+    hilo de red puede agregar mientras el bucle de dibujo muestrea.
+    """
+
+    def __init__(self, retraso=RETRASO_INTERPOLACION, extrapolacion_maxima=EXTRAPOLACION_MAXIMA,
+                 capacidad=CAPACIDAD_BUFFER, acumular=False):
+        self.retraso = retraso
+        self.extrapolacion_maxima = extrapolacion_maxima
+        # Con `acumular` cada instantánea conserva las entidades que no cambiaron
+        # (mensajes que solo traen lo que se movió, como actualizacion_posiciones)
+        self.acumular = acumular
+        self.instantaneas = deque(maxlen=capacidad)  # (tiempo, {clave: tupla})
+
+    def __len__(self):
+        return len(self.instantaneas)
+
+    def agregar(self, tiempo, entidades):
+        """Guarda la instantánea recibida en `tiempo` (segundos, reloj monotónico local)"""
+        if self.instantaneas:
+            ultimo, anteriores = self.instantaneas[-1]
+            if tiempo <= ultimo:
+                tiempo = ultimo + 1e-6  # Dos mensajes en el mismo recv: mantener el orden
+            if self.acumular:
+                entidades = {**anteriores, **entidades}
+        self.instantaneas.append((tiempo, entidades))
+
+    def olvidar(self, clave):
+        """Quita una entidad de todas las instantáneas (salió de la vista o se desconectó)"""
+        self.instantaneas = deque(((tiempo, {k: v for k, v in entidades.items() if k != clave})
+                                   for tiempo, entidades in self.instantaneas), maxlen=self.instantaneas.maxlen)
+
+    def limpiar(self):
+        self.instantaneas = deque(maxlen=self.instantaneas.maxlen)
+
+    def muestrear(self, ahora):
+        """Estado interpolado {clave: tupla} en `ahora - retraso`"""
+        instantaneas = list(self.instantaneas)
+        if not instantaneas:
+            return {}
+        objetivo = ahora - self.retraso
+        i = 0
+        while i < len(instantaneas) and instantaneas[i][0] <= objetivo:
+            i += 1
+        if i == 0:
+            return dict(instantaneas[0][1])  # Aún no hay nada tan antiguo
+        if i < len(instantaneas):
+            return self._interpolar(instantaneas[i - 1], instantaneas[i], objetivo)
+        if len(instantaneas) < 2:
+            return dict(instantaneas[-1][1])
+        # Sin instantánea posterior: extrapolar con las dos últimas, con límite
+        objetivo = min(objetivo, instantaneas[-1][0] + self.extrapolacion_maxima)
+        return self._interpolar(instantaneas[-2], instantaneas[-1], objetivo)
+
+    def _interpolar(self, anterior, siguiente, objetivo):
+        (t0, a), (t1, b) = anterior, siguiente
+        f = (objetivo - t0) / (t1 - t0)
+        resultado = {}
+        for clave, fin in b.items():
+            inicio = a.get(clave)
+            if inicio is None:
+                resultado[clave] = fin  # Entidad nueva: sin pasado con el que interpolar
+            else:
+                resultado[clave] = tuple(v0 + (v1 - v0) * f for v0, v1 in zip(inicio, fin))
+        return resultado
@@ -0,0 +1,184 @@
+# lockstep.py - Simulación determinista por ticks: servidor y clientes avanzan igual con las mismas entradas
+import copy
+import struct
+import zlib
+
+import numpy as np
+
+from almacen_minions import EQUIPOS, PASO_VELOCIDAD_MINIONS, AlmacenMinions
+from mapa import MAPA
+from movimiento import mover_por_rutas
+
+PRIMERA_OLEADA = 65       # Segundo de juego en que sale la primera oleada (1:05)
+ENFRIAMIENTO_TORRE = 10   # Segundos de juego entre dos ataques de una misma torre
+
+
+def avanzar_reloj(oleadas):
+    """Suma un segundo de juego. Devuelve el contenido de nueva_oleada si toca una, o None"""
+    oleadas["tiempo_juego"] += 1
+    tiempo = oleadas["tiempo_juego"]
+    if not oleadas["primer_oleada"] and tiempo >= PRIMERA_OLEADA:
+        oleadas["primer_oleada"] = True
+        limpiar = True  # Indicar que se deben limpiar minions anteriores
+    elif oleadas["primer_oleada"] and tiempo - oleadas["tiempo_ultima_oleada"] >= oleadas["intervalo"]:
+        limpiar = False  # No limpiar minions entre oleadas
+    else:
+        return None
+    oleadas["tiempo_ultima_oleada"] = tiempo
+    oleadas["contador_oleadas"] += 1
+    return {"contador": oleadas["contador_oleadas"], "tiempo": tiempo, "limpiar": limpiar}
+
+
+def destruir_estructura(estructuras, mensaje):
+    """Marca como destruida la estructura de un mensaje estructura_destruida si es válida"""
+    tipo_estructura = mensaje.get("estructura")
+    equipo = mensaje.get("equipo")
+    indice = mensaje.get("indice")
+    if (tipo_estructura in estructuras and equipo in estructuras[tipo_estructura] and
+            isinstance(indice, int) and 0 <= indice < len(estructuras[tipo_estructura][equipo])):
+        estructuras[tipo_estructura][equipo][indice]["destruida"] = True
+        return True
+    return False
+
+
+class SimulacionLockstep:
+    """Estado de una partida que avanza un tick con las entradas de todos los jugadores.
+
+    Todo depende solo del número de tick y de las entradas: el reloj va en ticks
+    enteros, los jugadores y las torres se recorren en orden de id, los minions se
+    mueven con el mismo factor en cada tick y no se usa azar. `huella()` resume el
+    estado para detectar desincronizaciones.
+    """
+
+    def __init__(self, estado_juego, minions, tasa_tick=10, tick=0):
+        self.estado_juego = estado_juego  # Estructuras y oleadas (los dicts de estado_juego)
+        self.minions = minions
+        self.jugadores = {}  # id -> {"pos", "vida", "velocidad"} (solo lo que simula)
+        self.tasa = tasa_tick
+        self.tick = tick
+        self.factor_minions = (1 / tasa_tick) / PASO_VELOCIDAD_MINIONS  # Como Sala.paso_minions
+        self.eventos = []  # (tipo, contenido) generados en el último tick
+
+    def paso(self, entradas, altas=None, bajas=(), comandos=()):
+        """Un tick: altas/bajas de jugadores, comandos, entradas, reloj, minions y torres"""
+        self.eventos = []
+        for id_jugador in bajas:
+            self.quitar_jugador(id_jugador)
+        for id_jugador, datos in sorted((altas or {}).items()):
+            self.poner_jugador(id_jugador, datos)
+        for comando in comandos:
+            self.aplicar_comando(comando)
+        for id_jugador in sorted(entradas):
+            self.mover_jugador(id_jugador, entradas[id_jugador])
+        self.avanzar()
+
+    def poner_jugador(self, id_jugador, datos):
+        """Alta de un jugador, o nueva posición, vida y velocidad si ya estaba"""
+        self.jugadores[id_jugador] = {"pos": list(datos["pos"]), "vida": datos["vida"],
+                                      "velocidad": datos["velocidad"]}
+
+    def quitar_jugador(self, id_jugador):
+        self.jugadores.pop(id_jugador, None)
+
+    def colocar_jugador(self, id_jugador, pos):
+        """Posición absoluta (mensajes movimiento del modo normal)"""
+        jugador = self.jugadores.get(id_jugador)
+        if jugador is not None:
+            jugador["pos"] = list(pos)
+
+    def aplicar_comando(self, comando):
+        if destruir_estructura(self.estado_juego["estructuras"], comando):
+            self.eventos.append(("estructura_destruida", comando))
+
+    def mover_jugador(self, id_jugador, mascaras):
+        """Aplica las entradas de un jugador con las reglas de las rutas"""
+        jugador = self.jugadores.get(id_jugador)
+        if jugador is None:
+            return
+        pos = jugador["pos"]
+        for mascara in mascaras:
+            pos, _ = mover_por_rutas(pos, int(mascara), jugador["velocidad"], MAPA.ancho, MAPA.alto)
+        jugador["pos"] = list(pos)
+
+    def avanzar(self):
+        """La parte del tick que no depende de las entradas: reloj, minions y torres"""
+        self.tick += 1
+        if self.tick % self.tasa == 0:
+            oleada = avanzar_reloj(self.estado_juego["oleadas"])
+            if oleada is not None:
+                for equipo in EQUIPOS:
+                    self.minions.agregar_varios(MAPA.oleada(equipo))
+                self.eventos.append(("nueva_oleada", oleada))
+        self.minions.mover(self.factor_minions)
+        self.paso_torres()
+
+    def paso_torres(self):
+        """Cada torre lista ataca al primer jugador en rango (por orden de id)"""
+        tiempo = self.estado_juego["oleadas"]["tiempo_juego"]
+        for equipo_torre in ("aliadas", "enemigas"):
+            for torre in self.estado_juego["estructuras"]["torres"][equipo_torre]:
+                if torre["destruida"]:
+                    continue
+                torre["puede_atacar"] = tiempo - torre["ultimo_ataque"] >= ENFRIAMIENTO_TORRE
+                if not torre["puede_atacar"]:
+                    continue
+                tx, ty = torre["pos"]
+                for id_jugador in sorted(self.jugadores):
+                    jugador = self.jugadores[id_jugador]
+                    x, y = jugador["pos"]
+                    if (x - tx) ** 2 + (y - ty) ** 2 <= torre["rango"] ** 2:
+                        jugador["vida"] -= torre["daño"]
+                        torre["ultimo_ataque"] = tiempo
+                        self.eventos.append(("jugador_dañado", {"id": id_jugador, "vida": jugador["vida"],
+                                                                "torre_pos": torre["pos"]}))
+                        break  # Ataca a un jugador a la vez
+
+    def huella(self):
+        """CRC32 del estado simulado (minions por id, jugadores, torres y reloj)"""
+        oleadas = self.estado_juego["oleadas"]
+        huella = zlib.crc32(struct.pack("!qqq", self.tick, int(oleadas["tiempo_juego"]),
+                                        int(oleadas["contador_oleadas"])))
+        n = self.minions.n
+        orden = np.argsort(self.minions.id[:n], kind="stable")
+        for columna in (self.minions.id, self.minions.distancia, self.minions.vida):
+            huella = zlib.crc32(np.ascontiguousarray(columna[:n][orden]).astype("<f8").tobytes(), huella)
+        for id_jugador in sorted(self.jugadores):
+            jugador = self.jugadores[id_jugador]
+            huella = zlib.crc32(id_jugador.encode("utf-8") + struct.pack("!ddd", *jugador["pos"], jugador["vida"]),
+                                huella)
+        for equipo_torre in ("aliadas", "enemigas"):
+            for torre in self.estado_juego["estructuras"]["torres"][equipo_torre]:
+                huella = zlib.crc32(struct.pack("!ddB", torre["vida"], torre["ultimo_ataque"],
+                                                bool(torre["destruida"])), huella)
+        return huella
+
+    def estado(self, con_minions=True):
+        """Todo lo necesario para que un cliente continúe la simulación desde este tick"""
+        estado = {
+            "tick": self.tick,
+            "tasa": self.tasa,
+            "estructuras": copy.deepcopy(self.estado_juego["estructuras"]),
+            "oleadas": dict(self.estado_juego["oleadas"]),
+            "siguiente_id": self.minions.siguiente_id,
+            "jugadores": copy.deepcopy(self.jugadores)
+        }
+        if con_minions:
+            estado["minions"] = self.minions.vista_completa()
+        return estado
+
+    @classmethod
+    def desde_estado(cls, estado, estado_juego=None, minions=None):
+        """Simulación a partir de `estado()`; puede rellenar el estado_juego y el almacén de una sala"""
+        estado_juego = {} if estado_juego is None else estado_juego
+        estado_juego["estructuras"] = estado["estructuras"]
+        estado_juego["oleadas"] = estado["oleadas"]
+        minions = AlmacenMinions() if minions is None else minions
+        minions.limpiar()
+        for equipo in EQUIPOS:
+            minions.agregar_varios(estado.get("minions", {}).get(equipo, []))
+        minions.siguiente_id = max(minions.siguiente_id, estado["siguiente_id"])
+        simulacion = cls(estado_juego, minions, estado["tasa"], tick=estado["tick"])
+        simulacion.jugadores = {id_jugador: {"pos": list(datos["pos"]), "vida": datos["vida"],
+                                             "velocidad": datos["velocidad"]}
+                                for id_jugador, datos in estado.get("jugadores", {}).items()}
+        return simulacion
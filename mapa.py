@@ -0,0 +1,229 @@
+# mapa.py - Mapa compartido por cliente y servidor: se lee de mapa.json y se compila una vez al importar
+import hashlib
+import json
+import math
+import os
+from types import MappingProxyType
+
+from espacial import IndiceEstatico
+from rutas import RutaCompilada
+
+ARCHIVO_MAPA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapa.json")
+
+TIPOS_ESTRUCTURA = ("torres", "inhibidores", "nexos")
+NOMBRES_OBJETIVO = {"torres": "torre", "inhibidores": "inhibidor", "nexos": "nexo"}
+RADIO_OBJETIVOS = 120  # Mayor rango de ataque de un minion (para el índice de objetivos)
+
+# Equipo de los minions -> nombre del equipo en cada tipo de estructura
+NOMBRES_EQUIPO = {
+    "aliados": {"torres": "aliadas", "inhibidores": "aliados", "nexos": "aliados"},
+    "enemigos": {"torres": "enemigas", "inhibidores": "enemigos", "nexos": "enemigos"}
+}
+RIVAL = {"aliados": "enemigos", "enemigos": "aliados"}
+
+
+def _congelar(valor):
+    """Copia de solo lectura: dicts -> MappingProxyType, listas -> tuplas"""
+    if isinstance(valor, dict):
+        return MappingProxyType({clave: _congelar(v) for clave, v in valor.items()})
+    if isinstance(valor, (list, tuple)):
+        return tuple(_congelar(v) for v in valor)
+    return valor
+
+
+def _distancia_segmento(punto, a, b):
+    """Distancia de `punto` al segmento ab"""
+    (px, py), (ax, ay), (bx, by) = punto, a, b
+    dx, dy = bx - ax, by - ay
+    largo2 = dx * dx + dy * dy
+    t = 0.0 if largo2 == 0 else min(max(((px - ax) * dx + (py - ay) * dy) / largo2, 0.0), 1.0)
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def intervalos_cobertura(ruta, centro, radio):
+    """Tramos [desde, hasta] de distancia sobre `ruta` a menos de `radio` de `centro`"""
+    intervalos = []
+    cx, cy = centro
+    for s in range(ruta.segmentos):
+        (ox, oy), (dx, dy) = ruta.puntos[s], ruta.direcciones[s]
+        # Punto del segmento más cercano al centro y semicuerda del círculo sobre la recta
+        t = (cx - ox) * dx + (cy - oy) * dy
+        cercania2 = (ox + dx * t - cx) ** 2 + (oy + dy * t - cy) ** 2
+        if cercania2 > radio * radio:
+            continue
+        semicuerda = math.sqrt(radio * radio - cercania2)
+        desde = max(t - semicuerda, 0.0)
+        hasta = min(t + semicuerda, float(ruta.longitudes[s]))
+        if desde >= hasta:
+            continue  # Solo toca la ruta en un punto
+        desde += float(ruta.acumulada[s])
+        hasta += float(ruta.acumulada[s])
+        if intervalos and desde <= intervalos[-1][1] + 1e-9:
+            intervalos[-1] = (intervalos[-1][0], max(intervalos[-1][1], hasta))  # Sigue en el segmento siguiente
+        else:
+            intervalos.append((desde, hasta))
+    return intervalos
+
+
+class Mapa:
+    """Mapa compilado e inmutable: carriles, rutas de los minions y estructuras.
+
+    Además de los datos de mapa.json guarda tablas precalculadas: el carril de
+    cada estructura, las estructuras de cada carril ordenadas por distancia, los
+    tramos de cada ruta de minions que cubre cada torre y el índice espacial de
+    los objetivos de cada equipo. `huella` resume el contenido para que cliente
+    y servidor comprueben que usan el mismo mapa.
+    """
+
+    def __init__(self, datos):
+        canonico = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        valores = {
+            "huella": hashlib.sha1(canonico.encode("utf-8")).hexdigest()[:16],
+            "ancho": datos["ancho"],
+            "alto": datos["alto"],
+            "carriles": _congelar([{"nombre": c["nombre"], "color": c["color"], "puntos": c["puntos"]}
+                                   for c in datos["carriles"]]),
+            "tipos_minions": _congelar(datos["tipos_minions"])
+        }
+        valores["rutas_carriles"] = tuple(RutaCompilada(i, carril["puntos"])
+                                          for i, carril in enumerate(valores["carriles"]))
+
+        # Estructuras: valores de su tipo + los propios, y su posición aparte para dibujar
+        estructuras = {}
+        posiciones = {}
+        for tipo in TIPOS_ESTRUCTURA:
+            base = datos["valores_estructuras"][tipo]
+            estructuras[tipo] = {equipo: [{**base, **e} for e in lista]
+                                 for equipo, lista in datos["estructuras"][tipo].items()}
+            posiciones[tipo] = {equipo: [tuple(e["pos"]) for e in lista]
+                                for equipo, lista in estructuras[tipo].items()}
+
+        # Carril de cada estructura (el más cercano) y estructuras de cada carril en orden
+        carril_de = {}
+        por_carril = [[] for _ in valores["carriles"]]
+        for tipo, equipos in posiciones.items():
+            for equipo, lista in equipos.items():
+                for indice, pos in enumerate(lista):
+                    carril = min(range(len(valores["carriles"])), key=lambda c: min(
+                        _distancia_segmento(pos, a, b)
+                        for a, b in zip(valores["carriles"][c]["puntos"], valores["carriles"][c]["puntos"][1:])))
+                    carril_de[(tipo, equipo, indice)] = carril
+                    por_carril[carril].append(
+                        (valores["rutas_carriles"][carril].proyectar(*pos), (tipo, equipo, indice)))
+        valores["estructuras"] = _congelar(estructuras)
+        valores["posiciones"] = _congelar(posiciones)
+        valores["carril_de"] = MappingProxyType(carril_de)
+        valores["estructuras_por_carril"] = tuple(tuple(clave for _, clave in sorted(lista))
+                                                  for lista in por_carril)
+
+        # Rutas de los minions: del nexo propio al nexo rival pasando por los puntos dados
+        # (compiladas igual que en AlmacenMinions.registrar_ruta)
+        rutas_minions = {}
+        oleadas = {}
+        for equipo, rutas in datos["rutas_minions"].items():
+            inicio = tuple(posiciones["nexos"][equipo][0])
+            destino = tuple(posiciones["nexos"][RIVAL[equipo]][0])
+            oleadas[equipo] = []
+            for ruta in rutas:
+                puntos = [tuple(p) for p in ruta["puntos"]]
+                rutas_minions[ruta["id"]] = RutaCompilada(ruta["id"], [inicio] + puntos + [destino])
+                oleadas[equipo].append((ruta["id"], tuple(puntos), inicio, destino))
+        valores["rutas_minions"] = MappingProxyType(rutas_minions)
+        valores["oleadas"] = _congelar(oleadas)
+
+        # Tramos de cada ruta de minions al alcance de cada torre: (desde, hasta, equipo, índice)
+        valores["cobertura_torres"] = MappingProxyType({
+            ruta_id: tuple(sorted(
+                (desde, hasta, equipo, indice)
+                for equipo, torres in estructuras["torres"].items()
+                for indice, torre in enumerate(torres)
+                for desde, hasta in intervalos_cobertura(ruta, torre["pos"], torre["rango"])))
+            for ruta_id, ruta in rutas_minions.items()
+        })
+
+        # Estructuras rivales que ataca cada equipo, en orden de prioridad, y su índice espacial
+        objetivos = {
+            equipo: [(x, y, NOMBRES_OBJETIVO[tipo]) for tipo in TIPOS_ESTRUCTURA
+                     for x, y in posiciones[tipo][NOMBRES_EQUIPO[RIVAL[equipo]][tipo]]]
+            for equipo in NOMBRES_EQUIPO
+        }
+        valores["objetivos"] = _congelar(objetivos)
+        valores["indices_objetivos"] = MappingProxyType({
+            equipo: IndiceEstatico([(x, y) for x, y, _ in lista], radio_max=RADIO_OBJETIVOS)
+            for equipo, lista in objetivos.items()
+        })
+
+        for nombre, valor in valores.items():
+            object.__setattr__(self, nombre, valor)
+
+    def __setattr__(self, nombre, valor):
+        raise AttributeError("El mapa compilado no se puede modificar")
+
+    def distancia_carriles(self, pos):
+        """Distancia de `pos` al carril más cercano"""
+        return min(_distancia_segmento(pos, a, b)
+                   for carril in self.carriles for a, b in zip(carril["puntos"], carril["puntos"][1:]))
+
+    def torres_en(self, ruta_id, distancia):
+        """(equipo, índice) de las torres que alcanzan el punto `distancia` de una ruta de minions"""
+        return [(equipo, indice) for desde, hasta, equipo, indice in self.cobertura_torres[ruta_id]
+                if desde <= distancia <= hasta]
+
+    def estado_estructuras(self):
+        """Estructuras con su estado inicial (dicts nuevos, modificables) como en estado_juego"""
+        estado = {}
+        for tipo, equipos in self.estructuras.items():
+            estado[tipo] = {}
+            for equipo, lista in equipos.items():
+                estado[tipo][equipo] = []
+                for indice, datos in enumerate(lista):
+                    estructura = {"pos": list(datos["pos"]), "vida": datos["vida"], "vida_max": datos["vida"],
+                                  "daño": datos["daño"], "rango": datos["rango"]}
+                    if tipo == "torres":
+                        estructura.update({"daño_base": datos["daño"], "reduccion_daño": datos["reduccion_daño"],
+                                           "ruta": self.carril_de[(tipo, equipo, indice)], "orden": datos["orden"],
+                                           "destruida": False, "ultimo_ataque": 0})
+                    elif tipo == "inhibidores":
+                        estructura.update({"ruta": self.carril_de[(tipo, equipo, indice)], "destruido": False,
+                                           "tiempo_reconstruccion": 0})
+                    else:
+                        estructura.update({"puede_atacar": False, "destruido": False})
+                    estado[tipo][equipo].append(estructura)
+        return estado
+
+    def estado_mapa(self):
+        """Rutas para dibujar, como en estado_juego["mapa"]"""
+        return {"rutas": [{"color": list(c["color"]), "puntos": [list(p) for p in c["puntos"]]}
+                          for c in self.carriles],
+                "scroll_y": 0}
+
+    def oleada(self, equipo):
+        """Minions nuevos de una oleada de `equipo` (uno de cada tipo por ruta) en el formato de los mensajes"""
+        minions = []
+        for ruta_id, puntos, inicio, destino in self.oleadas[equipo]:
+            for tipo, stats in self.tipos_minions.items():
+                minions.append({
+                    "tipo": tipo,
+                    "vida": stats["vida"],
+                    "vida_max": stats["vida"],
+                    "daño": stats["daño"],
+                    "velocidad": stats["velocidad"],
+                    "ruta_id": ruta_id,
+                    "pos": list(inicio),
+                    "objetivo": None,
+                    "equipo": equipo,
+                    "rango_ataque": stats["rango_ataque"],
+                    "destino": list(destino),
+                    "puntos_ruta": list(puntos),
+                    "indice_punto_actual": 0,
+                    "reduccion_daño": 0
+                })
+        return minions
+
+
+def cargar_mapa(archivo=ARCHIVO_MAPA):
+    with open(archivo, encoding="utf-8") as f:
+        return Mapa(json.load(f))
+
+
+MAPA = cargar_mapa()
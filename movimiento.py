@@ -0,0 +1,118 @@
+# movimiento.py - Reglas de movimiento del jugador por las rutas (compartidas por cliente y servidor)
+
+# Teclas de una entrada como máscara de bits (un byte por fotograma en los mensajes "entrada")
+TECLA_W = 1
+TECLA_A = 2
+TECLA_S = 4
+TECLA_D = 8
+TECLA_ESPACIO = 16
+
+TOLERANCIA = 5
+MAX_ENTRADAS_REENVIO = 16    # Entradas sin confirmar que se repiten en cada datagrama UDP
+MAX_ENTRADAS_PENDIENTES = 240  # 4 s a 60 FPS: si el servidor no confirma, se descartan las viejas
+
+
+def mover_por_rutas(pos, teclas, velocidad, ancho=800, alto=600):
+    """Aplica un fotograma de entrada a `pos` siguiendo las rutas fijas del mapa.
+
+    Devuelve (nueva_pos, hubo_movimiento). Es una función pura: el cliente la usa
+    para predecir y el servidor para validar, y ambos llegan a la misma posición
+    con las mismas entradas.
+    """
+    w, a, s, d = teclas & TECLA_W, teclas & TECLA_A, teclas & TECLA_S, teclas & TECLA_D
+    nueva = list(pos)
+    movimiento = False
+
+    x, y = nueva
+    vel = velocidad
+    tolerancia = TOLERANCIA
+
+    # Coordenadas exactas de las esquinas
+    esquinas = {
+        "izq_sup": (50, 100),
+        "der_sup": (ancho - 50, 100),
+        "izq_inf": (50, alto - 100),
+        "der_inf": (ancho - 50, alto - 100)
+    }
+
+    # Verificar si estamos en una esquina
+    esquina_actual = None
+    for nombre, (ex, ey) in esquinas.items():
+        if abs(x - ex) < tolerancia and abs(y - ey) < tolerancia:
+            esquina_actual = nombre
+            break
+
+    if esquina_actual is not None:
+        # Snap exacto a la esquina
+        nueva = list(esquinas[esquina_actual])
+
+        # Con ESPACIO en una esquina conectada a la ruta amarilla se entra en la diagonal
+        if teclas & TECLA_ESPACIO and esquina_actual in ["izq_inf", "der_sup"]:
+            if esquina_actual == "izq_inf":
+                nueva[0] += vel * 0.5  # Mitad de velocidad para ajuste fino
+                nueva[1] -= vel * 0.5
+            else:
+                nueva[0] -= vel * 0.5
+                nueva[1] += vel * 0.5
+            movimiento = True
+        else:
+            # Movimiento normal desde esquinas
+            if esquina_actual == "izq_sup":
+                if d:
+                    nueva[0] += vel
+                if s:
+                    nueva[1] += vel
+            elif esquina_actual == "der_sup":
+                if a:
+                    nueva[0] -= vel
+                if s:
+                    nueva[1] += vel
+            elif esquina_actual == "izq_inf":
+                if d:
+                    nueva[0] += vel
+                if w:
+                    nueva[1] -= vel
+            elif esquina_actual == "der_inf":
+                if a:
+                    nueva[0] -= vel
+                if w:
+                    nueva[1] -= vel
+            movimiento = bool(w or a or s or d)
+
+    # Rutas horizontales (azul/roja)
+    elif abs(y - 100) < tolerancia or abs(y - (alto - 100)) < tolerancia:
+        nueva[1] = 100 if abs(y - 100) < tolerancia else alto - 100  # Snap a la ruta
+        if a and x > 50:
+            nueva[0] -= vel
+        if d and x < ancho - 50:
+            nueva[0] += vel
+        movimiento = bool(a or d)
+
+    # Rutas verticales (blancas)
+    elif abs(x - 50) < tolerancia or abs(x - (ancho - 50)) < tolerancia:
+        nueva[0] = 50 if abs(x - 50) < tolerancia else ancho - 50  # Snap a la ruta
+        if w and y > 100:
+            nueva[1] -= vel
+        if s and y < alto - 100:
+            nueva[1] += vel
+        movimiento = bool(w or s)
+
+    # Ruta diagonal amarilla
+    else:
+        m = (100 - (alto - 100)) / ((ancho - 50) - 50)
+        b = (alto - 100) - m * 50
+        y_esperado = m * x + b
+
+        # Cerca de la diagonal: snap y movimiento con cualquier combinación de teclas
+        if abs(y - y_esperado) < tolerancia * 2:
+            nueva[1] = y_esperado
+            if (w or s) and (a or d):
+                if d and x < ancho - 50 and y > 100:  # Arriba-derecha
+                    nueva[0] += vel
+                    nueva[1] = m * (x + vel) + b
+                elif a and x > 50 and y < alto - 100:  # Abajo-izquierda
+                    nueva[0] -= vel
+                    nueva[1] = m * (x - vel) + b
+                movimiento = True
+
+    return nueva, movimiento
@@ -1,11 +1,27 @@
 # multijugador.py - Juego multijugador completo con rutas fijas, torres, inhibidores, nexos y minions
 import pygame
+import numpy as np
 import sys
-import json
 import socket
-import random
+import time
+from collections import deque
 from threading import Thread
 from datetime import datetime
+from almacen_minions import AlmacenMinions, EQUIPOS, TIPOS
+from atlas import cargar_atlas
+from instantaneas import HistorialInstantaneas, aplicar_delta
+from interpolacion import BufferInterpolacion
+from lockstep import SimulacionLockstep
+from mapa import MAPA
+from movimiento import (MAX_ENTRADAS_PENDIENTES, MAX_ENTRADAS_REENVIO, TECLA_A, TECLA_D, TECLA_ESPACIO, TECLA_S,
+                        TECLA_W, mover_por_rutas)
+from protocolo import (DecodificadorTramas, ErrorProtocolo, FORMATO_BINARIO, FORMATO_JSON, MODO_TRAMAS,
+                       codificar_mensaje, decodificar_mensaje, desempaquetar_datagrama, empaquetar_datagrama, empaquetar_trama)
+from textos import CacheTextos
+
+MAX_RECTS_SUCIOS = 200  # Con más rectángulos que esto sale más barato actualizar toda la pantalla
+ANCHO_BARRA_MINION = 40  # Píxeles de la barra de vida de un minion llena
+
 
 class Juego:
     def __init__(self):
@@ -31,6 +47,38 @@ class Juego:
         self.socket_cliente = None
         self.conectado = False
         self.id_cliente = None
+        self.sala = None  # Sala (partida) del servidor en la que está el jugador
+        self.ip_servidor = None
+
+        # Canal UDP opcional para posiciones e instantáneas (se negocia en conectar)
+        self.socket_udp = None
+        self.udp_listo = False
+        self.seq_udp = 0
+        self.formato = FORMATO_JSON  # Hasta que el servidor acepte el códec binario
+
+        # Estado recibido del servidor (keyframes + deltas numerados)
+        self.historial_estado = HistorialInstantaneas()
+        self.estado_servidor = None
+
+        # Conectado, los minions y los otros jugadores se dibujan a partir de las
+        # instantáneas del servidor, ~100 ms por detrás e interpolados (interpolacion.py)
+        self.buffer_minions = BufferInterpolacion()  # id del minion -> (distancia sobre su ruta,)
+        self.buffer_jugadores = BufferInterpolacion(acumular=True)  # id del jugador -> (x, y)
+        self.posiciones_jugadores = {}
+
+        # Predicción del movimiento propio: entradas numeradas pendientes de confirmar
+        self.seq_entrada = 0
+        self.entradas_pendientes = []  # [(seq, teclas)]
+        self.entrada_confirmada = None  # (seq, pos) de la última entrada_confirmada del servidor
+        self.seq_reconciliada = 0
+
+        # Sala lockstep: la partida se simula aquí con los marcos (entradas de todos) del servidor.
+        # El hilo de red solo encola; el bucle principal aplica los marcos en orden
+        self.lockstep = False
+        self.simulacion = None
+        self.marcos_lockstep = deque()  # ("estado" | "marco", contenido)
+        self.esperando_estado = False
+        self.desincronizaciones = 0
         
         # Configuración del mapa
         self.mapa = {
@@ -38,16 +86,10 @@ class Juego:
             "velocidad_scroll": 3,
             "rutas": []  # Almacenará las rutas fijas
         }
-        self.crear_rutas_fijas()  # Crear las rutas
-        self.configurar_torres()  # Configurar las torres
-        self.configurar_inhibidores()  # Configurar los inhibidores
-        self.configurar_nexos()  # Configurar los nexos
+        self.configurar_mapa()  # Rutas y estructuras del mapa compartido (mapa.json)
         
-        # Sistema de minions
-        self.minions = {
-            "aliados": [],
-            "enemigos": []
-        }
+        # Sistema de minions (arrays NumPy, ver almacen_minions.py)
+        self.minions = AlmacenMinions()
         self.oleadas = {
             "tiempo_ultima_oleada": 0,
             "intervalo": 30,  # segundos
@@ -56,9 +98,19 @@ class Juego:
             "primer_oleada": False
         }
         self.imagenes_minions = {}  # Para almacenar las imágenes de los minions
+        self.textos = CacheTextos()  # Textos renderizados (nombres, pie, menús)
+
+        # Capa estática del mapa (rocas, rutas y estructuras) compuesta una sola vez; cada
+        # fotograma solo se restauran y actualizan los rectángulos de lo que se mueve
+        self.fondo_mapa = None  # Se recompone cuando se destruye una estructura
+        self.estructuras_destruidas = set()  # (tipo, equipo, indice) como en estructura_destruida
+        self.redibujar_todo = True
+        self.rects_anteriores = []  # Rectángulos dibujados en el fotograma anterior
+        self.rects_sucios = []      # Rectángulos dibujados en este fotograma
         
         # Cargar recursos
         self.cargar_recursos()
+        self.preparar_sprites_minions()
     
     def cargar_recursos(self):
         """Cargar imágenes y fuentes"""
@@ -67,80 +119,19 @@ class Juego:
             self.fuente_normal = pygame.font.SysFont("Arial", 30)
             self.fuente_pequena = pygame.font.SysFont("Arial", 20)
             
-            # Cargar imágenes de personajes
-            try:
-                self.personaje1_img = pygame.image.load("assets/personaje1.png").convert_alpha()
-                self.personaje2_img = pygame.image.load("assets/personaje2.png").convert_alpha()
-            except:
-                # Crear imágenes por defecto si no se encuentran los archivos
-                self.personaje1_img = pygame.Surface((70, 70), pygame.SRCALPHA)
-                pygame.draw.circle(self.personaje1_img, (0, 0, 255), (35, 35), 35)
-                self.personaje2_img = pygame.Surface((70, 70), pygame.SRCALPHA)
-                pygame.draw.circle(self.personaje2_img, (255, 0, 0), (35, 35), 35)
-            
-            # Cargar imágenes de torres
-            try:
-                self.torre_aliada_img = pygame.image.load("assets/torre_aliada.png").convert_alpha()
-                self.torre_enemiga_img = pygame.image.load("assets/torre_enemiga.png").convert_alpha()
-            except:
-                # Crear imágenes por defecto
-                self.torre_aliada_img = pygame.Surface((60, 60), pygame.SRCALPHA)
-                pygame.draw.rect(self.torre_aliada_img, (0, 255, 0), (0, 0, 60, 60), 0, 10)
-                self.torre_enemiga_img = pygame.Surface((60, 60), pygame.SRCALPHA)
-                pygame.draw.rect(self.torre_enemiga_img, (255, 0, 0), (0, 0, 60, 60), 0, 10)
-            
-            # Cargar imágenes de inhibidores
-            try:
-                self.inhibidor_aliado_img = pygame.image.load("assets/inhibidor_aliado.png").convert_alpha()
-                self.inhibidor_enemigo_img = pygame.image.load("assets/inhibidor_enemigo.png").convert_alpha()
-            except:
-                # Crear imágenes por defecto
-                self.inhibidor_aliado_img = pygame.Surface((50, 50), pygame.SRCALPHA)
-                pygame.draw.polygon(self.inhibidor_aliado_img, (0, 255, 0), [(25, 0), (50, 50), (25, 40), (0, 50)])
-                self.inhibidor_enemigo_img = pygame.Surface((50, 50), pygame.SRCALPHA)
-                pygame.draw.polygon(self.inhibidor_enemigo_img, (255, 0, 0), [(25, 0), (50, 50), (25, 40), (0, 50)])
-            
-            # Cargar imágenes de nexos
-            try:
-                self.nexo_aliado_img = pygame.image.load("assets/nexo_aliado.png").convert_alpha()
-                self.nexo_enemigo_img = pygame.image.load("assets/nexo_enemigo.png").convert_alpha()
-            except:
-                # Crear imágenes por defecto
-                self.nexo_aliado_img = pygame.Surface((80, 80), pygame.SRCALPHA)
-                pygame.draw.circle(self.nexo_aliado_img, (0, 200, 0), (40, 40), 40)
-                pygame.draw.circle(self.nexo_aliado_img, (0, 255, 0), (40, 40), 30)
-                self.nexo_enemigo_img = pygame.Surface((80, 80), pygame.SRCALPHA)
-                pygame.draw.circle(self.nexo_enemigo_img, (200, 0, 0), (40, 40), 40)
-                pygame.draw.circle(self.nexo_enemigo_img, (255, 0, 0), (40, 40), 30)
-            
-            # Cargar imágenes de minions
-            try:
-                self.imagenes_minions["melee"] = pygame.image.load("assets/minion_mele.png").convert_alpha()
-                self.imagenes_minions["caster"] = pygame.image.load("assets/caster_minion.png").convert_alpha()
-                self.imagenes_minions["siege"] = pygame.image.load("assets/cañon_minion.png").convert_alpha()
-            except:
-                # Crear imágenes por defecto
-                self.imagenes_minions["melee"] = pygame.Surface((40, 40), pygame.SRCALPHA)
-                pygame.draw.rect(self.imagenes_minions["melee"], (200, 0, 0), (0, 0, 40, 40))
-                
-                self.imagenes_minions["caster"] = pygame.Surface((40, 40), pygame.SRCALPHA)
-                pygame.draw.rect(self.imagenes_minions["caster"], (0, 0, 200), (0, 0, 40, 40))
-                
-                self.imagenes_minions["siege"] = pygame.Surface((50, 50), pygame.SRCALPHA)
-                pygame.draw.rect(self.imagenes_minions["siege"], (150, 150, 0), (0, 0, 50, 50))
-            
-            # Escalar imágenes
-            self.personaje1_img = pygame.transform.scale(self.personaje1_img, (70, 70))
-            self.personaje2_img = pygame.transform.scale(self.personaje2_img, (70, 70))
-            self.torre_aliada_img = pygame.transform.scale(self.torre_aliada_img, (60, 60))
-            self.torre_enemiga_img = pygame.transform.scale(self.torre_enemiga_img, (60, 60))
-            self.inhibidor_aliado_img = pygame.transform.scale(self.inhibidor_aliado_img, (50, 50))
-            self.inhibidor_enemigo_img = pygame.transform.scale(self.inhibidor_enemigo_img, (50, 50))
-            self.nexo_aliado_img = pygame.transform.scale(self.nexo_aliado_img, (80, 80))
-            self.nexo_enemigo_img = pygame.transform.scale(self.nexo_enemigo_img, (80, 80))
-            self.imagenes_minions["melee"] = pygame.transform.scale(self.imagenes_minions["melee"], (40, 40))
-            self.imagenes_minions["caster"] = pygame.transform.scale(self.imagenes_minions["caster"], (40, 40))
-            self.imagenes_minions["siege"] = pygame.transform.scale(self.imagenes_minions["siege"], (50, 50))
+            # Sprites ya escalados desde el atlas en caché (atlas.py): un solo PNG que decodificar
+            self.sprites = cargar_atlas()
+            self.personaje1_img = self.sprites["personaje1"]
+            self.personaje2_img = self.sprites["personaje2"]
+            self.personaje_defecto_img = self.sprites["personaje_defecto"]
+            self.torre_aliada_img = self.sprites["torre_aliada"]
+            self.torre_enemiga_img = self.sprites["torre_enemiga"]
+            self.inhibidor_aliado_img = self.sprites["inhibidor_aliado"]
+            self.inhibidor_enemigo_img = self.sprites["inhibidor_enemigo"]
+            self.nexo_aliado_img = self.sprites["nexo_aliado"]
+            self.nexo_enemigo_img = self.sprites["nexo_enemigo"]
+            for tipo in TIPOS:
+                self.imagenes_minions[tipo] = self.sprites[tipo]
             
             # Fondos
             self.fondo_menu = pygame.Surface((self.ANCHO, self.ALTO))
@@ -156,139 +147,25 @@ class Juego:
             print(f"Error cargando recursos: {e}")
             sys.exit()
 
-    def configurar_torres(self):
-        """Configura las posiciones de las torres en las rutas con coordenadas exactas"""
-        self.torres = {
-            "aliadas": [],
-            "enemigas": []
-        }
-        
-        # Ruta azul (superior) - 3 torres enemigas
-        self.torres["enemigas"].extend([
-            (200, 80),  # Torre 1 ruta azul
-            (400, 80),  # Torre 2 ruta azul
-            (600, 80)   # Torre 3 ruta azul
-        ])
-        
-        # Ruta roja (inferior) - 3 torres aliadas
-        self.torres["aliadas"].extend([
-            (200, 480),  # Torre 1 ruta roja
-            (400, 480),  # Torre 2 ruta roja
-            (600, 480)   # Torre 3 ruta roja
-        ])
-        
-        # Ruta blanca izquierda - 3 torres aliadas
-        self.torres["aliadas"].extend([
-            (50, 170),   # Torre superior
-            (50, 300),   # Torre media
-            (50, 400)    # Torre inferior
-        ])
-        
-        # Ruta blanca derecha - 3 torres enemigas
-        self.torres["enemigas"].extend([
-            (750, 170),  # Torre superior
-            (750, 300),  # Torre media
-            (750, 400)   # Torre inferior
-        ])
-        
-        # Ruta amarilla (diagonal) - 3 aliadas y 3 enemigas
-        self.torres["aliadas"].extend([
-            (160, 415),  # Torre 1 aliada diagonal
-            (275, 355),  # Torre 2 aliada diagonal
-            (375, 300)   # Torre 3 aliada diagonal
-        ])
-        
-        self.torres["enemigas"].extend([
-            (495, 230),  # Torre 1 enemiga diagonal
-            (575, 180),  # Torre 2 enemiga diagonal
-            (655, 130)   # Torre 3 enemiga diagonal
-        ])
-
-    def configurar_inhibidores(self):
-        """Configura las posiciones de los inhibidores en las rutas"""
-        self.inhibidores = {
-            "aliados": [
-                (150, 480),  # Inhibidor aliado 1
-                (50, 435),   # Inhibidor aliado 2
-                (140, 435)   # Inhibidor aliado 3
-            ],
-            "enemigos": [
-                (685, 120),  # Inhibidor enemigo 1
-                (750, 145),  # Inhibidor enemigo 2
-                (655, 80)    # Inhibidor enemigo 3
-            ]
-        }
-
-    def configurar_nexos(self):
-        """Configura las posiciones de los nexos en las rutas"""
-        self.nexos = {
-            "aliados": [
-                (40, 490)  # Nexo aliado (base aliada)
-            ],
-            "enemigos": [
-                (750, 70)  # Nexo enemigo (base enemiga)
-            ]
-        }
-
-    def crear_rutas_fijas(self):
-        """Crea las rutas fijas en el mapa"""
-        # Ruta roja (superior)
-        ruta_roja = {
-            "color": (255, 0, 0),  # Rojo
-            "puntos": [
-                (49, 100),  # inicio
-                (self.ANCHO - 49, 100)  # fin
-            ]
-        }
-
-        # Ruta azul (inferior)
-        ruta_azul = {
-            "color": (0, 0, 255),  # Azul
-            "puntos": [
-                (49, self.ALTO - 100),
-                (self.ANCHO - 49, self.ALTO - 100)
-            ]
-        }
-
-        # Ruta roja izquierda (conecta arriba e abajo)
-        ruta_roja_izq = {
-            "color": (255, 0, 0),
-            "puntos": [
-                (49, 100),
-                (49, self.ALTO - 100)
-            ]
-        }
-
-        # Ruta blanca derecha (conecta arriba e abajo)
-        ruta_azul_der = {
-            "color": (0, 0, 255),
-            "puntos": [
-                (self.ANCHO - 49, 100),
-                (self.ANCHO - 49, self.ALTO - 100)
-            ]
-        }
-        
-        # Ruta diagonal amarilla (de abajo izquierda a arriba derecha)
-        ruta_amarilla = {
-            "color": (255, 255, 0),
-            "puntos": [
-                (49, self.ALTO - 100),
-                (self.ANCHO - 49, 100)
-            ]
-        }
-
-        self.mapa["rutas"] = [
-            ruta_azul, ruta_roja, ruta_roja_izq, ruta_azul_der, ruta_amarilla
-        ]
-
-    def dibujar_mapa(self):
+    def configurar_mapa(self):
+        """Rutas, torres, inhibidores, nexos y objetivos de cada equipo a partir del mapa compilado"""
+        self.mapa["rutas"] = MAPA.carriles
+        self.torres = MAPA.posiciones["torres"]
+        self.inhibidores = MAPA.posiciones["inhibidores"]
+        self.nexos = MAPA.posiciones["nexos"]
+        # Estructuras enemigas (x, y, tipo) de cada equipo en orden de prioridad, con su índice espacial
+        self.objetivos = MAPA.objetivos
+        self.indices_objetivos = MAPA.indices_objetivos
+
+    def dibujar_mapa(self, destino=None):
         """Dibuja las rutas fijas"""
-        self.pantalla.blit(self.textura_roca, (0, 0))  # Fondo de rocas
+        destino = destino or self.pantalla
+        destino.blit(self.textura_roca, (0, 0))  # Fondo de rocas
         
         # Dibujar cada ruta
         for ruta in self.mapa["rutas"]:
             if len(ruta["puntos"]) > 1:
-                pygame.draw.lines(self.pantalla, ruta["color"], False, 
+                pygame.draw.lines(destino, ruta["color"], False, 
                                 ruta["puntos"], 60)
             
             # Dibujar puntos de inicio/fin como cuadrados
@@ -297,34 +174,49 @@ class Juego:
             offset_y = 1  # Cantidad de píxeles hacia abajo
             for punto in [ruta["puntos"][0], ruta["puntos"][-1]]:
                 pygame.draw.rect(
-                    self.pantalla,
+                    destino,
                     ruta["color"],
                     (punto[0] - size // 2 + offset_x, punto[1] - size // 2 + offset_y, size, size)
                 )
 
-    def dibujar_torres(self):
-        """Dibuja todas las torres en el mapa"""
-        for x, y in self.torres["aliadas"]:
-            self.pantalla.blit(self.torre_aliada_img, (x - 30, y - 30))
-        
-        for x, y in self.torres["enemigas"]:
-            self.pantalla.blit(self.torre_enemiga_img, (x - 30, y - 30))
-
-    def dibujar_inhibidores(self):
-        """Dibuja todos los inhibidores en el mapa"""
-        for x, y in self.inhibidores["aliados"]:
-            self.pantalla.blit(self.inhibidor_aliado_img, (x - 25, y - 25))
-        
-        for x, y in self.inhibidores["enemigos"]:
-            self.pantalla.blit(self.inhibidor_enemigo_img, (x - 25, y - 25))
-
-    def dibujar_nexos(self):
-        """Dibuja todos los nexos en el mapa"""
-        for x, y in self.nexos["aliados"]:
-            self.pantalla.blit(self.nexo_aliado_img, (x - 40, y - 40))
-        
-        for x, y in self.nexos["enemigos"]:
-            self.pantalla.blit(self.nexo_enemigo_img, (x - 40, y - 40))
+    def dibujar_torres(self, destino=None):
+        """Dibuja todas las torres en el mapa (menos las destruidas)"""
+        destino = destino or self.pantalla
+        for equipo, imagen in (("aliadas", self.torre_aliada_img), ("enemigas", self.torre_enemiga_img)):
+            for indice, (x, y) in enumerate(self.torres[equipo]):
+                if ("torres", equipo, indice) not in self.estructuras_destruidas:
+                    destino.blit(imagen, (x - 30, y - 30))
+
+    def dibujar_inhibidores(self, destino=None):
+        """Dibuja todos los inhibidores en el mapa (menos los destruidos)"""
+        destino = destino or self.pantalla
+        for equipo, imagen in (("aliados", self.inhibidor_aliado_img), ("enemigos", self.inhibidor_enemigo_img)):
+            for indice, (x, y) in enumerate(self.inhibidores[equipo]):
+                if ("inhibidores", equipo, indice) not in self.estructuras_destruidas:
+                    destino.blit(imagen, (x - 25, y - 25))
+
+    def dibujar_nexos(self, destino=None):
+        """Dibuja todos los nexos en el mapa (menos los destruidos)"""
+        destino = destino or self.pantalla
+        for equipo, imagen in (("aliados", self.nexo_aliado_img), ("enemigos", self.nexo_enemigo_img)):
+            for indice, (x, y) in enumerate(self.nexos[equipo]):
+                if ("nexos", equipo, indice) not in self.estructuras_destruidas:
+                    destino.blit(imagen, (x - 40, y - 40))
+
+    def componer_fondo(self):
+        """Compone en una superficie la parte del mapa que no se mueve"""
+        fondo = pygame.Surface((self.ANCHO, self.ALTO)).convert()
+        self.dibujar_mapa(fondo)
+        self.dibujar_torres(fondo)
+        self.dibujar_inhibidores(fondo)
+        self.dibujar_nexos(fondo)
+        return fondo
+
+    def marcar_estructuras_destruidas(self, destruidas):
+        """Actualiza las estructuras destruidas; el fondo se recompone solo si cambian"""
+        if destruidas != self.estructuras_destruidas:
+            self.estructuras_destruidas = destruidas
+            self.fondo_mapa = None
 
     def dibujar_jugador(self):
         """Dibuja al jugador principal con su barra de vida"""
@@ -333,139 +225,54 @@ class Juego:
             imagen = self.personaje1_img
         else:
             imagen = self.personaje2_img
-        self.pantalla.blit(imagen, (self.jugador["pos"][0] - 35, self.jugador["pos"][1] - 35))
+        rect = self.pantalla.blit(imagen, (self.jugador["pos"][0] - 35, self.jugador["pos"][1] - 35))
 
         # Barra de vida (versión mejorada)
         vida_width = 70
         vida_actual = max(0, (self.jugador["vida"] / self.jugador["vida_max"])) * vida_width
 
         # Fondo rojo (vida perdida)
-        pygame.draw.rect(self.pantalla, (255, 0, 0), 
-                        (self.jugador["pos"][0] - vida_width//2, self.jugador["pos"][1] - 50, vida_width, 5))
+        rect.union_ip(pygame.draw.rect(self.pantalla, (255, 0, 0), 
+                        (self.jugador["pos"][0] - vida_width//2, self.jugador["pos"][1] - 50, vida_width, 5)))
 
         # Vida actual (verde)
         pygame.draw.rect(self.pantalla, (0, 255, 0), 
                         (self.jugador["pos"][0] - vida_width//2, self.jugador["pos"][1] - 50, vida_actual, 5))
+        self.rects_sucios.append(rect)
     
     def dibujar_otros_jugadores(self):
         """Dibuja a los otros jugadores conectados"""
-        for  datos in self.otros_jugadores.items():
-            # jugador_id, esto iria entre for y datos arriba
+        for id_jugador, datos in list(self.otros_jugadores.items()):
+            if not datos.get("visible"):
+                continue  # Fuera de nuestra zona de interés: su posición no está al día
+            x, y = self.posiciones_jugadores.get(id_jugador, datos["pos"])
             if datos["personaje"] == 1:
                 imagen = self.personaje1_img
             elif datos["personaje"] == 2:
                 imagen = self.personaje2_img
             else:
-                # Imagen por defecto si no hay personaje seleccionado
-                imagen = pygame.Surface((50, 50), pygame.SRCALPHA)
-                imagen.fill((0, 255, 0))
+                imagen = self.personaje_defecto_img  # Si no hay personaje seleccionado
             
             # Dibujar la imagen del personaje
-            self.pantalla.blit(imagen, (datos["pos"][0] - 35, datos["pos"][1] - 35))
+            rect = self.pantalla.blit(imagen, (x - 35, y - 35))
 
             # Nombre del jugador
-            nombre_texto = self.fuente_normal.render(datos["nombre"], True, (255, 255, 255))
-            self.pantalla.blit(nombre_texto, (datos["pos"][0] - nombre_texto.get_width() // 2, 
-                               datos["pos"][1] - 40))
+            nombre_texto = self.textos.render(self.fuente_normal, datos["nombre"], True, (255, 255, 255))
+            rect.union_ip(self.pantalla.blit(nombre_texto, (x - nombre_texto.get_width() // 2, 
+                               y - 40)))
             
             # Barra de vida
             vida_width = 70
             vida_actual = max(0, (datos["vida"] / datos["vida_max"])) * vida_width
-            pygame.draw.rect(self.pantalla, (255, 0, 0), 
-                            (datos["pos"][0] - vida_width//2, datos["pos"][1] - 50, vida_width, 5))
+            rect.union_ip(pygame.draw.rect(self.pantalla, (255, 0, 0), 
+                            (x - vida_width//2, y - 50, vida_width, 5)))
             pygame.draw.rect(self.pantalla, (0, 255, 0), 
-                            (datos["pos"][0] - vida_width//2, datos["pos"][1] - 50, vida_actual, 5))
+                            (x - vida_width//2, y - 50, vida_actual, 5))
+            self.rects_sucios.append(rect)
 
     def generar_oleada(self, equipo):
         """Genera una oleada de minions (melee, caster, cañón) con las rutas definidas"""
-        oleada = []
-        tipos_minions = ["melee", "caster", "siege"]  # 1 minion de cada tipo por ruta
-
-        # Configuración base según el equipo
-        if equipo == "aliados":
-            punto_inicio = self.nexos["aliados"][0]  # Base aliada (esquina inf. izquierda)
-            destino_final = self.nexos["enemigos"][0]  # Base enemiga (esquina sup. derecha)
-
-            # Rutas para aliados (3 rutas distintas)
-            rutas = [
-                {  # Ruta 1: Inferior Azul -> Derecha Azul -> Base Enemiga
-                    "id": "aliados_ruta_azul",
-                    "puntos": self.mapa["rutas"][0]["puntos"].copy() +  # Ruta azul inferior (0)
-                              self.mapa["rutas"][3]["puntos"][1:],      # Ruta derecha azul (3) (omitir primer punto para evitar duplicados)
-                    "destino": destino_final
-                },
-                {  # Ruta 2: Diagonal Amarilla directa
-                    "id": "aliados_ruta_amarilla",
-                    "puntos": self.mapa["rutas"][4]["puntos"].copy(),  # Ruta amarilla (4)
-                    "destino": destino_final
-                },
-                {  # Ruta 3: Izquierda Roja -> Superior Roja -> Base Enemiga
-                    "id": "aliados_ruta_roja",
-                    "puntos": [
-                        (40, 490),  # Base aliada (punto_inicio)
-                        (49, self.ALTO - 100),  # Inicio ruta izquierda roja (parte inferior)
-                        (49, 100),              # Fin ruta izquierda roja (parte superior)
-                        (self.ANCHO - 49, 100)  # Fin ruta superior roja (base enemiga)
-                    ],
-                    "destino": destino_final
-                }
-            ]
-        else:  # Enemigos
-            punto_inicio = self.nexos["enemigos"][0]  # Base enemiga (esquina sup. derecha)
-            destino_final = self.nexos["aliados"][0]   # Base aliada (esquina inf. izquierda)
-
-            # Rutas para enemigos (3 rutas distintas)
-            rutas = [
-                {  # Ruta 1: Superior Roja -> Izquierda Roja -> Base Aliada
-                    "id": "enemigos_ruta_roja",
-                    "puntos": [punto_inicio] +  # Base enemiga
-                              [(self.ANCHO - 49, 100), (49, 100)] +  # Ruta superior roja (invertida)
-                              [(49, self.ALTO - 100)],  # Ruta izquierda roja
-                    "destino": destino_final
-                },
-                {  # Ruta 2: Diagonal Amarilla directa (invertida)
-                    "id": "enemigos_ruta_amarilla",
-                    "puntos": [punto_inicio] +  # Base enemiga
-                              [(self.ANCHO - 49, 100), (49, self.ALTO - 100)],  # Ruta amarilla invertida
-                    "destino": destino_final
-                },
-                {  # Ruta 3: Derecha Azul -> Inferior Azul -> Base Aliada
-                    "id": "enemigos_ruta_azul",
-                    "puntos": [
-                        (750, 70),  # Base enemiga
-                        (self.ANCHO - 49, 100),  # Inicio ruta derecha azul (parte superior)
-                        (self.ANCHO - 49, self.ALTO - 100),  # Fin ruta derecha azul
-                        (49, self.ALTO - 100)  # Base aliada
-                    ],
-                    "destino": destino_final
-                }
-            ]
-
-        # Resto del código (generación de minions) permanece igual...
-        for ruta in rutas:
-            for tipo in tipos_minions:
-                stats = {
-                    "melee": {"vida": 100, "daño": 15, "velocidad": 2, "rango_ataque": 40},
-                    "caster": {"vida": 60, "daño": 25, "velocidad": 1.8, "rango_ataque": 80},
-                    "siege": {"vida": 150, "daño": 40, "velocidad": 1.5, "rango_ataque": 120}
-                }[tipo]
-
-                oleada.append({
-                    "tipo": tipo,
-                    "vida": stats["vida"],
-                    "daño": stats["daño"],
-                    "velocidad": stats["velocidad"],
-                    "ruta_id": ruta["id"],
-                    "pos": list(punto_inicio),
-                    "objetivo": None,
-                    "equipo": equipo,
-                    "rango_ataque": stats["rango_ataque"],
-                    "destino": ruta["destino"],
-                    "puntos_ruta": ruta["puntos"].copy(),
-                    "indice_punto_actual": 0
-                })
-
-        return oleada
+        return MAPA.oleada(equipo)  # Las mismas rutas y estadísticas que usa el servidor
     
     def calcular_velocidad(self, ruta, tiempo_objetivo_segundos):
         """Calcula la velocidad necesaria para llegar a la mitad de la ruta en el tiempo objetivo"""
@@ -496,8 +303,8 @@ class Juego:
             self.oleadas["contador_oleadas"] += 1
             
             # Generar oleadas para ambos equipos
-            self.minions["aliados"].extend(self.generar_oleada("aliados"))
-            self.minions["enemigos"].extend(self.generar_oleada("enemigos"))
+            self.minions.agregar_varios(self.generar_oleada("aliados"))
+            self.minions.agregar_varios(self.generar_oleada("enemigos"))
             
             if self.conectado:
                 self.enviar_mensaje("nueva_oleada", {
@@ -513,8 +320,8 @@ class Juego:
             self.oleadas["contador_oleadas"] += 1
             
             # Generar oleadas para ambos equipos
-            self.minions["aliados"].extend(self.generar_oleada("aliados"))
-            self.minions["enemigos"].extend(self.generar_oleada("enemigos"))
+            self.minions.agregar_varios(self.generar_oleada("aliados"))
+            self.minions.agregar_varios(self.generar_oleada("enemigos"))
             
             if self.conectado:
                 self.enviar_mensaje("nueva_oleada", {
@@ -523,271 +330,234 @@ class Juego:
                 })
 
     def actualizar_minions(self):
-        """Actualiza el movimiento de los minions según sus rutas asignadas"""
-        for equipo in ["aliados", "enemigos"]:
-            for minion in self.minions[equipo][:]:
-                # --- Movimiento ---
-                puntos_ruta = minion["puntos_ruta"]
-                indice_punto = minion["indice_punto_actual"]
-
-                # Si no quedan puntos, ir al destino final
-                if indice_punto >= len(puntos_ruta):
-                    destino = minion["destino"]
-                else:
-                    destino = puntos_ruta[indice_punto]
-
-                # Calcular dirección y mover
-                dx = destino[0] - minion["pos"][0]
-                dy = destino[1] - minion["pos"][1]
-                distancia = (dx**2 + dy**2)**0.5
-
-                if distancia > 5:  # Mover si no ha llegado al punto
-                    minion["pos"][0] += (dx / distancia) * minion["velocidad"]
-                    minion["pos"][1] += (dy / distancia) * minion["velocidad"]
-                else:
-                    minion["indice_punto_actual"] += 1  # Pasar al siguiente punto
-
-                # --- Verificar si llegó al final de la ruta ---
-                if indice_punto >= len(puntos_ruta):
-                    distancia_final = ((minion["pos"][0] - minion["destino"][0])**2 + 
-                                     (minion["pos"][1] - minion["destino"][1])**2)**0.5
-                    if distancia_final < 10:  # Si llegó a la base enemiga
-                        self.minions[equipo].remove(minion)
-                        # Aquí podrías añadir daño al nexo si es necesario
-
-                # --- Ataque a estructuras/enemigos (opcional) ---
-                self.verificar_ataque(minion)
-
-    def verificar_ataque(self, minion):
-        """Verifica si el minion está en rango de ataque de una estructura enemiga"""
-        estructuras_enemigas = []
-        if minion["equipo"] == "aliados":
-            # Aliados atacan torres, inhibidores y nexos enemigos
-            estructuras_enemigas = (
-                [(x, y, "torre") for x, y in self.torres["enemigas"]] +
-                [(x, y, "inhibidor") for x, y in self.inhibidores["enemigos"]] +
-                [(x, y, "nexo") for x, y in self.nexos["enemigos"]]
-            )
-        else:
-            # Enemigos atacan torres, inhibidores y nexos aliados
-            estructuras_enemigas = (
-                [(x, y, "torre") for x, y in self.torres["aliadas"]] +
-                [(x, y, "inhibidor") for x, y in self.inhibidores["aliados"]] +
-                [(x, y, "nexo") for x, y in self.nexos["aliados"]]
-            )
-
-        for ex, ey, tipo in estructuras_enemigas:
-            distancia = ((minion["pos"][0] - ex)**2 + (minion["pos"][1] - ey)**2)**0.5
-            if distancia < minion["rango_ataque"]:
-                minion["objetivo"] = (ex, ey, tipo)
-                # Aquí podrías agregar lógica para dañar la estructura
-                break
+        """Actualiza el movimiento de los minions según sus rutas asignadas (en lote)"""
+        # Velocidad en píxeles por frame; los que llegan a la base enemiga desaparecen
+        # Aquí podrías añadir daño al nexo si es necesario
+        self.minions.mover()
+
+        # --- Ataque a estructuras/enemigos (opcional) ---
+        self.verificar_ataque()
+
+    def interpolar_entidades(self):
+        """Coloca minions y otros jugadores donde estaban hace ~100 ms según el servidor"""
+        ahora = time.perf_counter()
+        minions = self.minions  # El hilo de red puede sustituirlo mientras tanto
+        n = minions.n
+        if n:
+            distancias = self.buffer_minions.muestrear(ahora)
+            for i, id_minion in enumerate(minions.id[:n].tolist()):
+                distancia = distancias.get(id_minion)
+                if distancia is not None:
+                    minions.distancia[i] = distancia[0]
+            minions.actualizar_posiciones()
+        self.posiciones_jugadores = self.buffer_jugadores.muestrear(ahora)
+
+    def avanzar_lockstep(self):
+        """Aplica los marcos recibidos a la simulación local y comprueba la huella de cada tick"""
+        while self.marcos_lockstep:
+            tipo, datos = self.marcos_lockstep.popleft()
+            if tipo == "estado":
+                self.simulacion = SimulacionLockstep.desde_estado(datos)
+                self.esperando_estado = False
+                continue
+            simulacion = self.simulacion
+            if simulacion is None or self.esperando_estado or datos["tick"] <= simulacion.tick:
+                continue  # Marcos anteriores al estado que esperamos
+            if datos["tick"] != simulacion.tick + 1:
+                self.pedir_estado_lockstep(datos["tick"])  # Falta algún marco
+                continue
+            simulacion.paso(datos.get("entradas", {}), datos.get("altas"), datos.get("bajas", ()),
+                            datos.get("comandos", ()))
+            if simulacion.huella() != datos["huella"]:
+                self.pedir_estado_lockstep(datos["tick"])
+        if self.simulacion is not None:
+            self.mostrar_simulacion()
+
+    def pedir_estado_lockstep(self, tick):
+        """Avisa al servidor de la desincronización y espera su estado completo"""
+        self.desincronizaciones += 1
+        self.esperando_estado = True
+        print(f"Desincronizado en el tick {tick}: pidiendo el estado al servidor")
+        self.enviar_mensaje("desincronizado", {"tick": tick, "huella": self.simulacion.huella()})
+
+    def mostrar_simulacion(self):
+        """Copia lo simulado (minions, reloj, jugadores, estructuras) a lo que se dibuja"""
+        simulacion = self.simulacion
+        self.minions = simulacion.minions
+        oleadas = simulacion.estado_juego["oleadas"]
+        self.oleadas["tiempo_juego"] = oleadas["tiempo_juego"]
+        self.oleadas["contador_oleadas"] = oleadas["contador_oleadas"]
+        posiciones = {}
+        for id_jugador, datos in simulacion.jugadores.items():
+            if id_jugador == self.id_cliente:
+                self.jugador["pos"] = list(datos["pos"])
+                self.jugador["vida"] = datos["vida"]
+            elif id_jugador in self.otros_jugadores:
+                self.otros_jugadores[id_jugador]["vida"] = datos["vida"]
+                posiciones[id_jugador] = tuple(datos["pos"])
+        self.posiciones_jugadores = posiciones
+        self.marcar_estructuras_destruidas({
+            (tipo, equipo, indice)
+            for tipo, equipos in simulacion.estado_juego["estructuras"].items()
+            for equipo, lista in equipos.items()
+            for indice, estructura in enumerate(lista)
+            if estructura.get("destruida") or estructura.get("destruido")})
+
+    def cargar_minions_servidor(self, minions_estado):
+        """Sustituye los minions locales por los de una instantánea y la añade al buffer"""
+        minions = AlmacenMinions()
+        for equipo in EQUIPOS:
+            minions.agregar_varios(minions_estado.get(equipo, []))
+        n = minions.n
+        self.buffer_minions.agregar(time.perf_counter(), {
+            id_minion: (distancia,)
+            for id_minion, distancia in zip(minions.id[:n].tolist(), minions.distancia[:n].tolist())})
+        self.minions = minions
+
+    def verificar_ataque(self):
+        """Marca en cada minion la primera estructura enemiga que tiene en rango de ataque"""
+        for equipo in EQUIPOS:
+            self.minions.asignar_objetivos(equipo, self.indices_objetivos[equipo])
+            # Aquí podrías agregar lógica para dañar la estructura
+
+    def preparar_sprites_minions(self):
+        """Imágenes por tipo con su desplazamiento al centro y barras de vida pre-renderizadas"""
+        # Copias con RLE: con transparencia por píxel se dibujan unas dos veces más rápido
+        self.sprites_minions = []
+        for tipo in TIPOS:
+            sprite = self.imagenes_minions[tipo].copy()
+            sprite.set_alpha(255, pygame.RLEACCEL)
+            self.sprites_minions.append(sprite)
+        self.medios_minions = np.array([(img.get_width() // 2, img.get_height() // 2)
+                                        for img in self.sprites_minions])
+        # Una barra por equipo y por cada ancho de vida posible (0..ANCHO_BARRA_MINION píxeles)
+        colores = {"aliados": (0, 100, 255), "enemigos": (255, 50, 50)}  # Vida de cada equipo
+        self.barras_minions = []
+        for equipo in EQUIPOS:
+            for ancho in range(ANCHO_BARRA_MINION + 1):
+                barra = pygame.Surface((ANCHO_BARRA_MINION, 5)).convert()
+                barra.fill((100, 0, 0))  # Fondo rojo oscuro (vida perdida)
+                barra.fill(colores[equipo], (0, 0, ancho, 5))
+                self.barras_minions.append(barra)
 
     def dibujar_minions(self):
-        """Dibuja minions con barras de vida y colores de equipo"""
-        for equipo in ["aliados", "enemigos"]:
-            for minion in self.minions[equipo]:
-                img = self.imagenes_minions.get(minion["tipo"], None)
-                if img:
-                    self.pantalla.blit(img, (minion["pos"][0] - img.get_width()//2, 
-                                        minion["pos"][1] - img.get_height()//2))
-                
-                # Barra de vida
-                vida_max = {
-                    "melee": 100,
-                    "caster": 60,
-                    "siege": 150
-                }[minion["tipo"]]
-                
-                vida_width = 40
-                vida_actual = max(0, (minion["vida"] / vida_max)) * vida_width
-                
-                # Fondo rojo oscuro
-                pygame.draw.rect(self.pantalla, (100, 0, 0), 
-                                (minion["pos"][0] - vida_width//2, minion["pos"][1] - 30, vida_width, 5))
-                
-                # Vida (azul para aliados, rojo para enemigos)
-                color_vida = (0, 100, 255) if equipo == "aliados" else (255, 50, 50)
-                pygame.draw.rect(self.pantalla, color_vida, 
-                                (minion["pos"][0] - vida_width//2, minion["pos"][1] - 30, vida_actual, 5))
+        """Dibuja minions con barras de vida y colores de equipo en un solo Surface.blits"""
+        minions = self.minions  # El hilo de red puede sustituirlo mientras tanto
+        n = minions.n
+        if not n:
+            return
+        x = minions.pos[:n, 0].astype(int)
+        y = minions.pos[:n, 1].astype(int)
+        tipos = minions.tipo[:n]
+        # Ancho de la barra de vida en píxeles y su sprite (equipo, ancho)
+        anchos = np.clip(minions.vida[:n] / minions.vida_max[:n] * ANCHO_BARRA_MINION, 0, ANCHO_BARRA_MINION)
+        barras = minions.equipo[:n] * (ANCHO_BARRA_MINION + 1) + anchos.astype(int)
+        medios = self.medios_minions[tipos]
+
+        # Primero todos los minions y encima todas las barras: una única llamada a blits
+        secuencia = list(zip([self.sprites_minions[t] for t in tipos.tolist()],
+                             zip((x - medios[:, 0]).tolist(), (y - medios[:, 1]).tolist())))
+        secuencia += zip([self.barras_minions[b] for b in barras.tolist()],
+                         zip((x - ANCHO_BARRA_MINION // 2).tolist(), (y - 30).tolist()))
+        if 2 * n > MAX_RECTS_SUCIOS:
+            # Demasiados rectángulos: se actualiza (y al siguiente fotograma se restaura) todo
+            self.pantalla.blits(secuencia, False)
+            self.rects_sucios.append(self.pantalla.get_rect())
+        else:
+            self.rects_sucios.extend(self.pantalla.blits(secuencia))
 
     def manejar_movimiento(self):
-        """Permite movimiento por todas las rutas fijas y centra al jugador en la ruta"""
+        """Mueve al jugador por las rutas fijas al instante (predicción) y envía la entrada al servidor"""
         keys = pygame.key.get_pressed()
-        movimiento = False
-    
-        x, y = self.jugador["pos"]
-        vel = self.jugador["velocidad"]
-        tolerancia = 5
-    
-        # Detección mejorada de esquinas
-        en_esquina = False
-        esquina_actual = None
-        
-        # Coordenadas exactas de las esquinas
-        esquinas = {
-            "izq_sup": (50, 100),
-            "der_sup": (self.ANCHO - 50, 100),
-            "izq_inf": (50, self.ALTO - 100),
-            "der_inf": (self.ANCHO - 50, self.ALTO - 100)
-        }
-    
-        # Verificar si estamos en una esquina
-        for nombre, (ex, ey) in esquinas.items():
-            if abs(x - ex) < tolerancia and abs(y - ey) < tolerancia:
-                en_esquina = True
-                esquina_actual = nombre
-                break
-    
-        # Si está en una esquina
-        if en_esquina:
-            # Snap exacto a la esquina
-            self.jugador["pos"] = list(esquinas[esquina_actual])
-            x, y = self.jugador["pos"]
-    
-            # Si presiona ESPACIO y está en una esquina conectada a la ruta amarilla
-            if keys[pygame.K_SPACE] and esquina_actual in ["izq_inf", "der_sup"]:
-                # Moverse un poco hacia la diagonal (entrar a la ruta amarilla)
-                if esquina_actual == "izq_inf":
-                    self.jugador["pos"][0] += vel * 0.5  # Mitad de velocidad para ajuste fino
-                    self.jugador["pos"][1] -= vel * 0.5
-                elif esquina_actual == "der_sup":
-                    self.jugador["pos"][0] -= vel * 0.5
-                    self.jugador["pos"][1] += vel * 0.5
-                movimiento = True
-            else:
-                # Movimiento normal desde esquinas
-                if esquina_actual == "izq_sup":
-                    if keys[pygame.K_d]:  # Derecha
-                        self.jugador["pos"][0] += vel
-                    if keys[pygame.K_s]:  # Abajo
-                        self.jugador["pos"][1] += vel
-                elif esquina_actual == "der_sup":
-                    if keys[pygame.K_a]:  # Izquierda
-                        self.jugador["pos"][0] -= vel
-                    if keys[pygame.K_s]:  # Abajo
-                        self.jugador["pos"][1] += vel
-                elif esquina_actual == "izq_inf":
-                    if keys[pygame.K_d]:  # Derecha
-                        self.jugador["pos"][0] += vel
-                    if keys[pygame.K_w]:  # Arriba
-                        self.jugador["pos"][1] -= vel
-                elif esquina_actual == "der_inf":
-                    if keys[pygame.K_a]:  # Izquierda
-                        self.jugador["pos"][0] -= vel
-                    if keys[pygame.K_w]:  # Arriba
-                        self.jugador["pos"][1] -= vel
-    
-                movimiento = any([keys[pygame.K_a], keys[pygame.K_d], keys[pygame.K_w], keys[pygame.K_s]])
-        else:
-            # Movimiento en rutas horizontales (azul/roja)
-            if abs(y - 100) < tolerancia:  # Ruta superior
-                self.jugador["pos"][1] = 100  # Snap a la ruta
-                if keys[pygame.K_a] and x > 50:
-                    self.jugador["pos"][0] -= vel
-                if keys[pygame.K_d] and x < self.ANCHO - 50:
-                    self.jugador["pos"][0] += vel
-                movimiento = keys[pygame.K_a] or keys[pygame.K_d]
-                
-            elif abs(y - (self.ALTO - 100)) < tolerancia:  # Ruta inferior
-                self.jugador["pos"][1] = self.ALTO - 100  # Snap a la ruta
-                if keys[pygame.K_a] and x > 50:
-                    self.jugador["pos"][0] -= vel
-                if keys[pygame.K_d] and x < self.ANCHO - 50:
-                    self.jugador["pos"][0] += vel
-                movimiento = keys[pygame.K_a] or keys[pygame.K_d]
-    
-            # Movimiento en rutas verticales (blancas)
-            elif abs(x - 50) < tolerancia:  # Ruta izquierda
-                self.jugador["pos"][0] = 50  # Snap a la ruta
-                if keys[pygame.K_w] and y > 100:
-                    self.jugador["pos"][1] -= vel
-                if keys[pygame.K_s] and y < self.ALTO - 100:
-                    self.jugador["pos"][1] += vel
-                movimiento = keys[pygame.K_w] or keys[pygame.K_s]
-                
-            elif abs(x - (self.ANCHO - 50)) < tolerancia:  # Ruta derecha
-                self.jugador["pos"][0] = self.ANCHO - 50  # Snap a la ruta
-                if keys[pygame.K_w] and y > 100:
-                    self.jugador["pos"][1] -= vel
-                if keys[pygame.K_s] and y < self.ALTO - 100:
-                    self.jugador["pos"][1] += vel
-                movimiento = keys[pygame.K_w] or keys[pygame.K_s]
-    
-            # Movimiento en ruta diagonal amarilla
-            else:
-                # Calculamos la posición esperada en la diagonal
-                m = (100 - (self.ALTO - 100)) / ((self.ANCHO - 50) - 50)
-                b = (self.ALTO - 100) - m * 50
-                y_esperado = m * x + b
-    
-                # Verificar si estamos cerca de la diagonal
-                if abs(y - y_esperado) < tolerancia * 2:
-                    # Snap a la diagonal
-                    self.jugador["pos"][1] = y_esperado
-                    
-                    # Movimiento en la diagonal con cualquier combinación de teclas
-                    if (keys[pygame.K_w] or keys[pygame.K_s]) and (keys[pygame.K_a] or keys[pygame.K_d]):
-                        if keys[pygame.K_d] and x < self.ANCHO - 50 and y > 100:  # Arriba-derecha
-                            self.jugador["pos"][0] += vel
-                            self.jugador["pos"][1] = m * (x + vel) + b
-                        elif keys[pygame.K_a] and x > 50 and y < self.ALTO - 100:  # Abajo-izquierda
-                            self.jugador["pos"][0] -= vel
-                            self.jugador["pos"][1] = m * (x - vel) + b
-                        movimiento = True
-    
-        # Enviar actualización si hubo movimiento
+        teclas = ((TECLA_W if keys[pygame.K_w] else 0) | (TECLA_A if keys[pygame.K_a] else 0) |
+                  (TECLA_S if keys[pygame.K_s] else 0) | (TECLA_D if keys[pygame.K_d] else 0) |
+                  (TECLA_ESPACIO if keys[pygame.K_SPACE] else 0))
+
+        if self.lockstep and self.conectado:
+            # Sin predicción: la posición sale de la simulación cuando llega el marco con la entrada
+            if teclas:
+                self.seq_entrada += 1
+                self.enviar_mensaje("entrada", {"seq": self.seq_entrada, "teclas": [teclas]})
+            return
+
+        self.reconciliar_movimiento()
+        self.jugador["pos"], movimiento = mover_por_rutas(self.jugador["pos"], teclas, self.jugador["velocidad"],
+                                                          self.ANCHO, self.ALTO)
+
+        # Enviar la entrada numerada si hubo movimiento: el servidor la valida con las mismas reglas
         if movimiento and self.conectado:
-            self.enviar_mensaje("movimiento", {
-                "pos": self.jugador["pos"],
+            self.seq_entrada += 1
+            self.entradas_pendientes.append((self.seq_entrada, teclas))
+            del self.entradas_pendientes[:-MAX_ENTRADAS_PENDIENTES]
+        elif not (self.udp_listo and self.entradas_pendientes):
+            return
+        # Por UDP se repiten las últimas entradas sin confirmar (también quieto, hasta que se
+        # confirmen) por si se pierde algún datagrama; el servidor ignora las ya aplicadas
+        if self.conectado:
+            reenvio = MAX_ENTRADAS_REENVIO if self.udp_listo else 1
+            self.enviar_mensaje("entrada", {
+                "seq": self.seq_entrada,
+                "teclas": [mascara for _, mascara in self.entradas_pendientes[-reenvio:]],
                 "scroll_y": self.mapa["scroll_y"]
             })
 
+    def reconciliar_movimiento(self):
+        """Parte de la última posición confirmada por el servidor y repite las entradas sin confirmar"""
+        confirmacion = self.entrada_confirmada  # La escribe el hilo de red
+        if confirmacion is None or confirmacion[0] <= self.seq_reconciliada:
+            return
+        seq, pos = confirmacion
+        self.seq_reconciliada = seq
+        self.entradas_pendientes = [(numero, teclas) for numero, teclas in self.entradas_pendientes if numero > seq]
+        for _, teclas in self.entradas_pendientes:
+            pos, _ = mover_por_rutas(pos, teclas, self.jugador["velocidad"], self.ANCHO, self.ALTO)
+        self.jugador["pos"] = list(pos)
+
     def dibujar_menu(self):
         """Dibujar el menú principal"""
         self.pantalla.blit(self.fondo_menu, (0, 0))
         
-        titulo = self.fuente_titulo.render("Mundo Infinito Multijugador", True, (255, 255, 255))
+        titulo = self.textos.render(self.fuente_titulo, "Mundo Infinito Multijugador", True, (255, 255, 255))
         self.pantalla.blit(titulo, (self.ANCHO//2 - titulo.get_width()//2, 100))
         
         # Botones
         pygame.draw.rect(self.pantalla, (70, 130, 180), (self.ANCHO//2 - 150, 250, 300, 60))
-        texto_jugar = self.fuente_normal.render("Jugar", True, (255, 255, 255))
+        texto_jugar = self.textos.render(self.fuente_normal, "Jugar", True, (255, 255, 255))
         self.pantalla.blit(texto_jugar, (self.ANCHO//2 - texto_jugar.get_width()//2, 265))
         
         pygame.draw.rect(self.pantalla, (180, 70, 70), (self.ANCHO//2 - 150, 350, 300, 60))
-        texto_salir = self.fuente_normal.render("Salir", True, (255, 255, 255))
+        texto_salir = self.textos.render(self.fuente_normal, "Salir", True, (255, 255, 255))
         self.pantalla.blit(texto_salir, (self.ANCHO//2 - texto_salir.get_width()//2, 365))
         
         if self.conectado:
-            estado = self.fuente_normal.render("Conectado al servidor", True, (0, 255, 0))
+            estado = self.textos.render(self.fuente_normal, "Conectado al servidor", True, (0, 255, 0))
         else:
-            estado = self.fuente_normal.render("No conectado", True, (255, 0, 0))
+            estado = self.textos.render(self.fuente_normal, "No conectado", True, (255, 0, 0))
         self.pantalla.blit(estado, (20, self.ALTO - 40))
 
     def dibujar_seleccion(self):
         """Pantalla de selección de personaje y nombre"""
         self.pantalla.blit(self.fondo, (0, 0))
         
-        titulo = self.fuente_titulo.render("Elige tu personaje", True, (255, 255, 255))
+        titulo = self.textos.render(self.fuente_titulo, "Elige tu personaje", True, (255, 255, 255))
         self.pantalla.blit(titulo, (self.ANCHO//2 - titulo.get_width()//2, 50))
         
         # Dibujar opciones de personaje (usando imágenes)
         pygame.draw.rect(self.pantalla, 
                          (255, 255, 0) if self.jugador["personaje"] == 1 else (200, 200, 200), 
                          (self.ANCHO//2 - 200, 150, 180, 200), 3)
-        self.pantalla.blit(pygame.transform.scale(self.personaje1_img, (150, 150)), 
+        self.pantalla.blit(self.sprites["personaje1_seleccion"], 
                            (self.ANCHO//2 - 200 + 15, 160))
         
         pygame.draw.rect(self.pantalla, 
                          (255, 255, 0) if self.jugador["personaje"] == 2 else (200, 200, 200), 
                          (self.ANCHO//2 + 20, 150, 180, 200), 3)
-        self.pantalla.blit(pygame.transform.scale(self.personaje2_img, (150, 150)), 
+        self.pantalla.blit(self.sprites["personaje2_seleccion"], 
                            (self.ANCHO//2 + 20 + 15, 160))
         
         # Campo de texto para nombre
         pygame.draw.rect(self.pantalla, (255, 255, 255), (self.ANCHO//2 - 150, 400, 300, 40))
-        texto_nombre = self.fuente_normal.render(self.jugador["nombre"] or "Tu nombre", True, 
+        texto_nombre = self.textos.render(self.fuente_normal, self.jugador["nombre"] or "Tu nombre", True, 
                                                 (100, 100, 100) if not self.jugador["nombre"] else (0, 0, 0))
         self.pantalla.blit(texto_nombre, (self.ANCHO//2 - 140, 405))
         
@@ -797,7 +567,7 @@ class Juego:
         else:
             pygame.draw.rect(self.pantalla, (150, 150, 150), (self.ANCHO//2 - 100, 470, 200, 50))
             
-        texto_empezar = self.fuente_normal.render("Empezar", True, (255, 255, 255))
+        texto_empezar = self.textos.render(self.fuente_normal, "Empezar", True, (255, 255, 255))
         self.pantalla.blit(texto_empezar, (self.ANCHO//2 - texto_empezar.get_width()//2, 480))
 
     def manejar_eventos(self):
@@ -809,6 +579,9 @@ class Juego:
                 pygame.quit()
                 sys.exit()
                 
+            if evento.type == pygame.VIDEOEXPOSE:
+                self.redibujar_todo = True  # La ventana se tapó: los rectángulos no bastan
+
             if evento.type == pygame.MOUSEBUTTONDOWN:
                 x, y = pygame.mouse.get_pos()
                 self.manejar_click(x, y)
@@ -858,10 +631,14 @@ class Juego:
         try:
             self.socket_cliente = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket_cliente.connect((ip_servidor, puerto))
+            self.ip_servidor = ip_servidor
             self.conectado = True
             
             # Hilo para recibir datos
             Thread(target=self.recibir_datos, daemon=True).start()
+
+            # Pedir al servidor un ID y el estado inicial (y el canal UDP y el códec binario si los ofrece)
+            self.enviar_mensaje("conectar", {"udp": True, "codec": FORMATO_BINARIO})
             return True
         except Exception as e:
             print(f"Error conectando al servidor: {e}")
@@ -869,19 +646,61 @@ class Juego:
 
     def recibir_datos(self):
         """Recibir datos del servidor"""
+        decodificador = DecodificadorTramas(MODO_TRAMAS)
         while self.conectado:
             try:
-                datos = self.socket_cliente.recv(4096).decode('utf-8')
-                if datos:
-                    mensajes = datos.split('|')  # Separar mensajes en caso de concatenación
-                    for msg in mensajes:
-                        if msg:
-                            self.procesar_mensaje(json.loads(msg))
+                datos = self.socket_cliente.recv(65536)
+                if not datos:
+                    print("El servidor cerró la conexión")
+                    self.conectado = False
+                    break
+                # Un recv puede traer varias tramas completas o solo parte de una
+                for carga in decodificador.alimentar(datos):
+                    self.procesar_mensaje(decodificar_mensaje(carga))
             except Exception as e:
                 print(f"Error recibiendo datos: {e}")
                 self.conectado = False
                 break
 
+    def iniciar_udp(self, puerto, token):
+        """Abre el canal UDP y lo registra en el servidor con el token de la bienvenida"""
+        try:
+            self.socket_udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket_udp.connect((self.ip_servidor, puerto))
+            self.socket_udp.settimeout(0.5)
+            Thread(target=self.recibir_udp, args=(token,), daemon=True).start()
+        except OSError as e:
+            print(f"Canal UDP no disponible, se usa solo TCP: {e}")
+            self.socket_udp = None
+
+    def recibir_udp(self, token):
+        """Recibe posiciones e instantáneas por UDP descartando las que llegan tarde"""
+        ultimos = {}  # canal -> última secuencia aceptada
+        while self.conectado:
+            try:
+                if not self.udp_listo:
+                    # Reintentar el registro hasta que el servidor lo confirme
+                    self.socket_udp.send(empaquetar_datagrama(0, codificar_mensaje("hola_udp", {"token": token})))
+                datos = self.socket_udp.recv(65536)
+                seq, carga = desempaquetar_datagrama(datos)
+                mensaje = decodificar_mensaje(carga)
+            except socket.timeout:
+                continue
+            except (OSError, ErrorProtocolo, ValueError) as e:
+                print(f"Error en el canal UDP: {e}")
+                break
+            tipo = mensaje.get("tipo")
+            if tipo == "hola_udp":
+                self.udp_listo = True
+                continue
+            # Las dos formas de instantánea comparten secuencia: un delta viejo no pisa un keyframe nuevo
+            canal = "estado" if tipo in ("estado_juego", "estado_delta") else tipo
+            if seq <= ultimos.get(canal, 0):
+                continue  # Llegó tarde: ya tenemos uno más reciente
+            ultimos[canal] = seq
+            self.procesar_mensaje(mensaje)
+        self.udp_listo = False
+
     def procesar_mensaje(self, mensaje):
         """Procesar mensajes recibidos del servidor"""
         tipo = mensaje.get("tipo")
@@ -889,40 +708,207 @@ class Juego:
         if tipo == "bienvenida":
             print(f"Conectado al servidor: {mensaje.get('mensaje')}")
             self.id_cliente = mensaje.get("id")
+            self.sala = mensaje.get("sala")
+            self.formato = mensaje.get("codec", FORMATO_JSON)
+            if mensaje.get("mapa") and mensaje["mapa"] != MAPA.huella:
+                print(f"Aviso: el servidor usa otro mapa ({mensaje['mapa']}, el local es {MAPA.huella})")
+            if mensaje.get("udp") and self.socket_udp is None:
+                self.iniciar_udp(mensaje["udp"]["puerto"], mensaje["udp"]["token"])
+            oleada = mensaje.get("oleada", {})  # La partida puede venir de un punto de control
+            self.oleadas["contador_oleadas"] = oleada.get("contador", self.oleadas["contador_oleadas"])
+            if mensaje.get("seq_estado") is not None:
+                self.recibir_instantanea(mensaje["seq_estado"], mensaje["estado_juego"])
+            self.entrar_lockstep(mensaje)
+        elif tipo == "sala_unida":
+            # Partida nueva: las instantáneas y minions de la sala anterior ya no sirven
+            print(f"Unido a la sala {mensaje.get('sala')}")
+            self.sala = mensaje.get("sala")
+            self.historial_estado = HistorialInstantaneas()
+            self.minions = AlmacenMinions()
+            self.buffer_minions.limpiar()
+            self.buffer_jugadores.limpiar()
+            self.otros_jugadores = {id_jugador: {**datos, "visible": False}
+                                    for id_jugador, datos in mensaje.get("jugadores", {}).items()
+                                    if id_jugador != self.id_cliente}
+            oleada = mensaje.get("oleada", {})
+            self.oleadas["contador_oleadas"] = oleada.get("contador", 0)
+            self.oleadas["tiempo_juego"] = oleada.get("tiempo", 0)
+            self.recibir_instantanea(mensaje.get("seq_estado"), mensaje.get("estado_juego"))
+            self.entrar_lockstep(mensaje)
+        elif tipo == "marco_lockstep":
+            self.marcos_lockstep.append(("marco", mensaje))
+        elif tipo == "estado_lockstep":
+            self.marcos_lockstep.append(("estado", mensaje))
+        elif tipo == "error_sala":
+            print(f"Error de sala: {mensaje.get('mensaje')}")
+        elif tipo == "estado_juego":
+            # Keyframe: el estado completo viene en el propio mensaje
+            estado = {clave: valor for clave, valor in mensaje.items() if clave not in ("tipo", "seq")}
+            self.recibir_instantanea(mensaje.get("seq"), estado)
+        elif tipo == "estado_delta":
+            base = self.historial_estado.obtener(mensaje.get("base"))
+            if base is None:
+                # Perdimos la instantánea base: pedir un keyframe
+                self.enviar_mensaje("ack_estado", {"resync": True})
+            else:
+                # Los minions llegan aparte: solo los de nuestra zona de interés
+                estado = {**aplicar_delta(base, mensaje["delta"]),
+                          "minions": aplicar_delta(base.get("minions"), mensaje.get("minions"))}
+                self.recibir_instantanea(mensaje["seq"], estado)
         elif tipo == "jugadores":
-            self.otros_jugadores = mensaje.get("jugadores", {})
+            # La visibilidad la deciden entra_en_vista / sale_de_vista
+            anteriores = self.otros_jugadores
+            self.otros_jugadores = {id_jugador: {**datos, "visible": anteriores.get(id_jugador, {}).get("visible", False)}
+                                    for id_jugador, datos in mensaje.get("jugadores", {}).items()}
         elif tipo == "nuevo_jugador":
-            self.otros_jugadores[mensaje["id"]] = mensaje
+            # En lockstep se simula a todos: siempre están a la vista
+            self.otros_jugadores[mensaje["id"]] = {**mensaje, "visible": self.lockstep}
+        elif tipo == "entra_en_vista":
+            for id_jugador, datos in mensaje.get("jugadores", {}).items():
+                self.otros_jugadores[id_jugador] = {**datos, "visible": True}
+                # Reaparece donde está ahora, sin interpolar desde donde lo vimos por última vez
+                self.buffer_jugadores.olvidar(id_jugador)
+        elif tipo == "sale_de_vista":
+            for id_jugador in mensaje.get("jugadores", []):
+                if id_jugador in self.otros_jugadores:
+                    self.otros_jugadores[id_jugador]["visible"] = False
+                self.buffer_jugadores.olvidar(id_jugador)
         elif tipo == "jugador_desconectado":
             if mensaje["id"] in self.otros_jugadores:
                 del self.otros_jugadores[mensaje["id"]]
+            self.buffer_jugadores.olvidar(mensaje["id"])
+        elif tipo == "estructura_destruida":
+            self.marcar_estructuras_destruidas(
+                self.estructuras_destruidas | {(mensaje.get("estructura"), mensaje.get("equipo"), mensaje.get("indice"))})
+        elif tipo == "entrada_confirmada":
+            self.entrada_confirmada = (mensaje["seq"], mensaje["pos"])
         elif tipo == "actualizacion_posicion":
             if mensaje["id"] in self.otros_jugadores:
                 self.otros_jugadores[mensaje["id"]]["pos"] = mensaje["pos"]
+                self.buffer_jugadores.agregar(time.perf_counter(), {mensaje["id"]: tuple(mensaje["pos"])})
+        elif tipo == "actualizacion_posiciones":
+            # Últimas posiciones de todos los jugadores que se movieron en el tick
+            posiciones = {}
+            for id_jugador, pos in mensaje.get("posiciones", {}).items():
+                if id_jugador != self.id_cliente and id_jugador in self.otros_jugadores:
+                    self.otros_jugadores[id_jugador]["pos"] = pos
+                    posiciones[id_jugador] = tuple(pos)
+            self.buffer_jugadores.agregar(time.perf_counter(), posiciones)
         elif tipo == "nueva_oleada":
+            # Los minions de la oleada llegan en las siguientes instantáneas
             self.oleadas["contador_oleadas"] = mensaje.get("contador", 0)
             self.oleadas["tiempo_juego"] = mensaje.get("tiempo", 0)
-            self.minions["aliados"].extend(self.generar_oleada("aliados"))
-            self.minions["enemigos"].extend(self.generar_oleada("enemigos"))
         elif tipo == "jugador_dañado":
             if mensaje["id"] == self.id_cliente:
                 self.jugador["vida"] = mensaje["vida"]
             elif mensaje["id"] in self.otros_jugadores:
                 self.otros_jugadores[mensaje["id"]]["vida"] = mensaje["vida"]
 
+    def entrar_lockstep(self, mensaje):
+        """bienvenida / sala_unida: si la sala es lockstep, la simulación parte de su estado"""
+        self.lockstep = mensaje.get("lockstep") is not None
+        # No se toca self.simulacion (la lee el bucle principal): avanzar_lockstep la sustituye
+        # de una vez al sacar de la cola el estado de la sala nueva
+        self.marcos_lockstep.clear()
+        if self.lockstep:
+            self.otros_jugadores = {id_jugador: {**datos, "visible": True}
+                                    for id_jugador, datos in mensaje.get("jugadores", {}).items()
+                                    if id_jugador != self.id_cliente}
+            self.marcos_lockstep.append(("estado", mensaje["lockstep"]))
+
+    def recibir_instantanea(self, seq, estado):
+        """Guarda una instantánea del servidor y confirma su recepción"""
+        self.estado_servidor = estado
+        if estado is not None:
+            self.oleadas["tiempo_juego"] = estado.get("oleadas", {}).get("tiempo_juego", self.oleadas["tiempo_juego"])
+            if estado.get("minions") is not None:
+                self.cargar_minions_servidor(estado["minions"])
+            if estado.get("estructuras") is not None:
+                self.marcar_estructuras_destruidas({
+                    (tipo, equipo, indice)
+                    for tipo, equipos in estado["estructuras"].items()
+                    for equipo, lista in equipos.items()
+                    for indice, estructura in enumerate(lista)
+                    if estructura.get("destruida") or estructura.get("destruido")})
+        if seq is not None:
+            self.historial_estado.guardar(seq, estado)
+            self.enviar_mensaje("ack_estado", {"seq": seq})
+
     def enviar_mensaje(self, tipo, contenido):
         """Enviar mensaje al servidor"""
         if self.conectado:
-            mensaje = json.dumps({
-                "tipo": tipo,
+            carga = codificar_mensaje(tipo, {
                 "id": self.id_cliente,
                 **contenido
-            })
+            }, self.formato)
+            if tipo in ("movimiento", "entrada") and self.udp_listo:
+                # Posiciones y entradas (que se repiten) no esperan a retransmisiones de TCP
+                self.seq_udp += 1
+                try:
+                    self.socket_udp.send(empaquetar_datagrama(self.seq_udp, carga))
+                    return
+                except OSError:
+                    self.udp_listo = False
             try:
-                self.socket_cliente.sendall((mensaje + '|').encode('utf-8'))  # Separador para múltiples mensajes
+                self.socket_cliente.sendall(empaquetar_trama(carga))  # Cabecera de longitud + JSON
             except:
                 self.conectado = False
 
+    def dibujar_footer(self):
+        """Coordenadas, oleada y tiempo en la parte inferior, y el aviso de desconexión"""
+        footer_y = self.ALTO - 30
+        coordenadas_texto = self.textos.render(self.fuente_normal, 
+            f"Posición: ({int(self.jugador['pos'][0])}, {int(self.jugador['pos'][1])})",
+            True,
+            (255, 255, 255)
+        )
+        self.rects_sucios.append(self.pantalla.blit(coordenadas_texto, (20, footer_y)))
+        
+        # Mostrar información de minions
+        tiempo_minutos = int(self.oleadas["tiempo_juego"] // 60)
+        tiempo_segundos = int(self.oleadas["tiempo_juego"] % 60)
+        minions_texto = self.textos.render(self.fuente_pequena, 
+            f"Oleada: {self.oleadas['contador_oleadas']} | Tiempo: {tiempo_minutos}:{tiempo_segundos:02d}",
+            True, 
+            (255, 255, 255)
+        )
+        self.rects_sucios.append(
+            self.pantalla.blit(minions_texto, (self.ANCHO // 2 - minions_texto.get_width() // 2, footer_y + 5)))
+        
+        # Mostrar estado de conexión
+        if not self.conectado:
+            error_texto = self.textos.render(self.fuente_normal, "DESCONECTADO", True, (255, 0, 0))
+            self.rects_sucios.append(self.pantalla.blit(error_texto, (self.ANCHO - error_texto.get_width() - 20, 20)))
+
+    def dibujar_juego(self):
+        """Dibuja un fotograma de juego y actualiza solo los rectángulos que cambiaron.
+
+        Se restaura el fondo en caché bajo lo dibujado el fotograma anterior, se dibuja
+        lo que se mueve y se pasan a pantalla los rectángulos de ambos fotogramas.
+        """
+        if self.fondo_mapa is None:
+            self.fondo_mapa = self.componer_fondo()
+            self.redibujar_todo = True
+        completo = self.redibujar_todo or len(self.rects_anteriores) > MAX_RECTS_SUCIOS
+        if completo:
+            self.pantalla.blit(self.fondo_mapa, (0, 0))
+        else:
+            for rect in self.rects_anteriores:
+                self.pantalla.blit(self.fondo_mapa, rect, rect)
+
+        self.rects_sucios = []
+        self.dibujar_minions()
+        self.dibujar_jugador()
+        self.dibujar_otros_jugadores()
+        self.dibujar_footer()
+
+        if completo or len(self.rects_sucios) > MAX_RECTS_SUCIOS:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self.rects_anteriores + self.rects_sucios)
+        self.rects_anteriores = self.rects_sucios
+        self.redibujar_todo = False
+
     def ejecutar(self):
         """Bucle principal del juego"""
         while True:
@@ -933,45 +919,21 @@ class Juego:
             elif self.estado == "seleccion":
                 self.dibujar_seleccion()
             elif self.estado == "juego":
-                self.pantalla.fill((0, 0, 0))  # Fondo negro
-                
                 dt = self.reloj.get_time()  # Obtener tiempo desde el último frame
-                self.actualizar_oleadas(dt)
-                self.manejar_movimiento()
-                self.dibujar_mapa()
-                self.dibujar_torres()
-                self.dibujar_inhibidores()
-                self.dibujar_nexos()
-                self.actualizar_minions()
-                self.dibujar_minions()
-                self.dibujar_jugador()
-                self.dibujar_otros_jugadores()
-                
-                # Footer: Mostrar coordenadas, oleada y tiempo en la parte inferior
-                footer_y = self.ALTO - 30
-                coordenadas_texto = self.fuente_normal.render(
-                    f"Posición: ({int(self.jugador['pos'][0])}, {int(self.jugador['pos'][1])})",
-                    True,
-                    (255, 255, 255)
-                )
-                self.pantalla.blit(coordenadas_texto, (20, footer_y))
-                
-                # Mostrar información de minions
-                tiempo_minutos = int(self.oleadas["tiempo_juego"] // 60)
-                tiempo_segundos = int(self.oleadas["tiempo_juego"] % 60)
-                minions_texto = self.fuente_pequena.render(
-                    f"Oleada: {self.oleadas['contador_oleadas']} | Tiempo: {tiempo_minutos}:{tiempo_segundos:02d}",
-                    True, 
-                    (255, 255, 255)
-                )
-                self.pantalla.blit(minions_texto, (self.ANCHO // 2 - minions_texto.get_width() // 2, footer_y + 5))
-                
-                # Mostrar estado de conexión
                 if not self.conectado:
-                    error_texto = self.fuente_normal.render("DESCONECTADO", True, (255, 0, 0))
-                    self.pantalla.blit(error_texto, (self.ANCHO - error_texto.get_width() - 20, 20))
+                    self.actualizar_oleadas(dt)  # Sin servidor: simulación local
+                self.manejar_movimiento()
+                if self.conectado and self.lockstep:
+                    self.avanzar_lockstep()
+                elif self.conectado:
+                    self.interpolar_entidades()
+                else:
+                    self.actualizar_minions()
+                self.dibujar_juego()  # Actualiza la pantalla por rectángulos
             
-            pygame.display.flip()
+            if self.estado != "juego":
+                pygame.display.flip()
+                self.redibujar_todo = True  # Al entrar en el juego se pinta todo una vez
             self.reloj.tick(60)
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+# planificador.py - Planificador de simulación a paso fijo con fases en orden determinista
+import asyncio
+import threading
+import time
+
+
+class EstadisticasFase:
+    """Duración de una fase del tick (en segundos, medida con perf_counter)"""
+
+    def __init__(self):
+        self.ejecuciones = 0
+        self.total = 0.0
+        self.maximo = 0.0
+        self.ultimo = 0.0
+
+    def registrar(self, duracion):
+        self.ejecuciones += 1
+        self.total += duracion
+        self.ultimo = duracion
+        if duracion > self.maximo:
+            self.maximo = duracion
+
+    def resumen(self):
+        media = self.total / self.ejecuciones if self.ejecuciones else 0.0
+        return {
+            "ejecuciones": self.ejecuciones,
+            "media_ms": round(media * 1000, 3),
+            "max_ms": round(self.maximo * 1000, 3),
+            "ultimo_ms": round(self.ultimo * 1000, 3)
+        }
+
+
+class PlanificadorTicks:
+    """Ejecuta las fases registradas a una tasa fija, siempre en el mismo orden.
+
+    Usa un acumulador de tiempo real: si el proceso se retrasa ejecuta ticks de
+    recuperación (hasta `max_recuperacion` seguidos) y, si aun así no alcanza,
+    salta los ticks restantes para no entrar en una espiral de retraso.
+    """
+
+    def __init__(self, tasa=10, max_recuperacion=5, lock=None):
+        if tasa <= 0:
+            raise ValueError("La tasa de ticks debe ser positiva")
+        self.tasa = tasa
+        self.dt = 1 / tasa
+        self.max_recuperacion = max_recuperacion
+        self.lock = lock  # Si se indica, cada tick se ejecuta con el lock tomado
+        self.fases = []  # (nombre, función(dt))
+        self.tick = 0
+        self.acumulado = 0.0
+        self.ultimo = None
+        self.detenido = False
+
+        # Estadísticas
+        self.estadisticas_fases = {}
+        self.estadisticas_tick = EstadisticasFase()
+        self.ticks_recuperados = 0
+        self.ticks_saltados = 0
+
+    def agregar_fase(self, nombre, funcion):
+        """Añade una fase al final del orden de ejecución"""
+        self.fases.append((nombre, funcion))
+        self.estadisticas_fases[nombre] = EstadisticasFase()
+
+    def cada(self, segundos):
+        """True en el tick que cierra cada intervalo de `segundos` de simulación"""
+        return self.tick % max(1, round(segundos * self.tasa)) == 0
+
+    def ejecutar_tick(self):
+        """Ejecuta un tick: todas las fases en orden, midiendo cuánto tarda cada una"""
+        if self.lock is not None:
+            with self.lock:
+                self._ejecutar_fases()
+        else:
+            self._ejecutar_fases()
+
+    def _ejecutar_fases(self):
+        self.tick += 1
+        inicio_tick = time.perf_counter()
+        for nombre, funcion in self.fases:
+            inicio = time.perf_counter()
+            try:
+                funcion(self.dt)
+            except Exception as e:
+                print(f"Error en la fase {nombre}: {e}")
+            self.estadisticas_fases[nombre].registrar(time.perf_counter() - inicio)
+        self.estadisticas_tick.registrar(time.perf_counter() - inicio_tick)
+
+    def avanzar(self, ahora):
+        """Ejecuta los ticks que tocan hasta `ahora` y devuelve cuántos se ejecutaron"""
+        if self.ultimo is None:
+            self.ultimo = ahora
+        self.acumulado += ahora - self.ultimo
+        self.ultimo = ahora
+
+        pasos = 0
+        while self.acumulado >= self.dt:
+            if pasos > self.max_recuperacion:
+                # Demasiado retraso: saltar ticks en lugar de intentar recuperarlos todos
+                saltados = int(self.acumulado // self.dt)
+                self.ticks_saltados += saltados
+                self.acumulado -= saltados * self.dt
+                break
+            self.ejecutar_tick()
+            self.acumulado -= self.dt
+            pasos += 1
+        if pasos > 1:
+            self.ticks_recuperados += pasos - 1
+        return pasos
+
+    def espera_hasta_siguiente(self):
+        """Segundos que faltan para el siguiente tick"""
+        return max(0.0, self.dt - self.acumulado)
+
+    def ejecutar(self):
+        """Bucle bloqueante para el motor de hilos"""
+        while not self.detenido:
+            self.avanzar(time.monotonic())
+            time.sleep(self.espera_hasta_siguiente())
+
+    async def ejecutar_asyncio(self):
+        """Bucle del planificador como tarea del motor asyncio"""
+        while not self.detenido:
+            self.avanzar(time.monotonic())
+            await asyncio.sleep(self.espera_hasta_siguiente())
+
+    def iniciar_hilo(self):
+        """Arranca el bucle en un hilo daemon"""
+        hilo = threading.Thread(target=self.ejecutar, daemon=True)
+        hilo.start()
+        return hilo
+
+    def detener(self):
+        self.detenido = True
+
+    def estadisticas(self):
+        """Resumen de duración por fase y de recuperación/salto de ticks"""
+        return {
+            "tasa": self.tasa,
+            "ticks": self.tick,
+            "ticks_recuperados": self.ticks_recuperados,
+            "ticks_saltados": self.ticks_saltados,
+            "tick": self.estadisticas_tick.resumen(),
+            "fases": {nombre: estadisticas.resumen()
+                      for nombre, estadisticas in self.estadisticas_fases.items()}
+        }
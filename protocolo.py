@@ -0,0 +1,163 @@
+# protocolo.py - Protocolo de red con tramas de longitud prefijada (cliente y servidor)
+import json
+import struct
+
+import binario
+
+# Cabecera de cada trama: longitud de la carga en 4 bytes big-endian
+CABECERA = struct.Struct("!I")
+TAMANO_MAXIMO_TRAMA = 16 * 1024 * 1024  # 16 MB, de sobra para el estado completo
+
+# Modos de conexión: tramas con longitud o el formato antiguo JSON separado por '|'
+MODO_TRAMAS = "tramas"
+MODO_LEGADO = "legado"
+SEPARADOR_LEGADO = b'|'
+
+# Datagramas del canal UDP opcional: número de secuencia (4 bytes) + carga JSON.
+# No se fragmentan: lo que no cabe en un datagrama va por TCP
+CABECERA_DATAGRAMA = struct.Struct("!I")
+TAMANO_MAXIMO_DATAGRAMA = 1400  # Cabe en un paquete incluso con la cabecera de una VPN
+
+
+# Formatos de carga: JSON siempre; el binario se negocia en conectar y cubre solo los
+# mensajes frecuentes (el resto sigue en JSON aunque el cliente lo haya pedido)
+FORMATO_JSON = "json"
+FORMATO_BINARIO = "binario"
+FORMATOS = (FORMATO_JSON, FORMATO_BINARIO)
+
+
+class ErrorProtocolo(Exception):
+    """Error de formato en los datos recibidos"""
+
+
+def codificar_mensaje(tipo, contenido, formato=FORMATO_JSON):
+    """Serializa un mensaje a bytes (sin cabecera): binario si hay esquema, si no JSON UTF-8"""
+    if formato == FORMATO_BINARIO:
+        try:
+            return binario.codificar(tipo, contenido)
+        except binario.ErrorCodec:
+            pass
+    return json.dumps({
+        "tipo": tipo,
+        **contenido
+    }).encode('utf-8')
+
+
+class CargaMensaje:
+    """Mensaje para varios destinatarios, serializado como mucho una vez por formato.
+
+    `contenido` puede ser un diccionario o una función que lo construye; `alternativas`
+    da un contenido propio para un formato y `cargas` bytes ya serializados (o funciones).
+    """
+
+    def __init__(self, tipo, contenido, alternativas=None, cargas=None):
+        self.tipo = tipo
+        self.contenido = contenido
+        self.alternativas = alternativas or {}
+        self.cargas = dict(cargas or {})
+
+    def codificar(self, formato=FORMATO_JSON):
+        carga = self.cargas.get(formato)
+        if carga is None:
+            contenido = self.alternativas.get(formato, self.contenido)
+            if callable(contenido):
+                contenido = contenido()
+            carga = codificar_mensaje(self.tipo, contenido, formato)
+        elif callable(carga):
+            carga = carga()
+        self.cargas[formato] = carga
+        return carga
+
+
+def codificar_fragmento(clave, valor):
+    """Serializa un par `"clave": valor` para reutilizarlo en mensajes de varios destinatarios"""
+    return json.dumps({clave: valor}).encode('utf-8')[1:-1]
+
+
+def codificar_con_fragmentos(tipo, campo, fragmentos):
+    """Mensaje {"tipo": tipo, campo: {...}} ensamblado a partir de fragmentos ya serializados"""
+    return b''.join((b'{"tipo": ', json.dumps(tipo).encode('utf-8'), b', ', json.dumps(campo).encode('utf-8'),
+                     b': {', b', '.join(fragmentos), b'}}'))
+
+
+def decodificar_mensaje(carga):
+    """Convierte la carga de una trama en el diccionario del mensaje (JSON o binario)"""
+    if binario.es_binario(carga):
+        return binario.decodificar(carga)
+    return json.loads(carga)
+
+
+def empaquetar_trama(carga, modo=MODO_TRAMAS):
+    """Añade la cabecera de longitud (o el separador '|' en modo legado) a una carga"""
+    if modo == MODO_LEGADO:
+        return carga + SEPARADOR_LEGADO
+    if len(carga) > TAMANO_MAXIMO_TRAMA:
+        raise ErrorProtocolo(f"Trama demasiado grande: {len(carga)} bytes")
+    return CABECERA.pack(len(carga)) + carga
+
+
+def empaquetar_datagrama(seq, carga):
+    """Antepone el número de secuencia a una carga para enviarla por UDP"""
+    return CABECERA_DATAGRAMA.pack(seq & 0xFFFFFFFF) + carga
+
+
+def desempaquetar_datagrama(datos):
+    """Separa un datagrama en (seq, carga)"""
+    if len(datos) < CABECERA_DATAGRAMA.size:
+        raise ErrorProtocolo("Datagrama demasiado corto")
+    return CABECERA_DATAGRAMA.unpack_from(datos)[0], datos[CABECERA_DATAGRAMA.size:]
+
+
+class DecodificadorTramas:
+    """Decodificador incremental: acumula bytes y devuelve todas las tramas completas.
+
+    Con modo=None detecta el formato con el primer byte recibido: un '{' indica
+    un cliente antiguo que envía JSON separado por '|', cualquier otro valor es
+    el primer byte de una cabecera de longitud.
+    """
+
+    def __init__(self, modo=None):
+        self.modo = modo
+        self.buffer = bytearray()
+
+    def alimentar(self, datos):
+        """Añade bytes recibidos y devuelve la lista de cargas completas"""
+        if not datos:
+            return []
+        self.buffer += datos
+        if self.modo is None:
+            self.modo = MODO_LEGADO if self.buffer[:1] == b'{' else MODO_TRAMAS
+
+        if self.modo == MODO_LEGADO:
+            return self._extraer_legado()
+        return self._extraer_tramas()
+
+    def _extraer_tramas(self):
+        """Recorre el buffer una sola vez y lo compacta al final"""
+        tramas = []
+        buffer = self.buffer
+        vista = memoryview(buffer)
+        inicio = 0
+        total = len(buffer)
+        try:
+            while total - inicio >= CABECERA.size:
+                (longitud,) = CABECERA.unpack_from(buffer, inicio)
+                if longitud > TAMANO_MAXIMO_TRAMA:
+                    raise ErrorProtocolo(f"Trama demasiado grande: {longitud} bytes")
+                fin = inicio + CABECERA.size + longitud
+                if fin > total:
+                    break  # Trama incompleta: esperar más datos
+                tramas.append(bytes(vista[inicio + CABECERA.size:fin]))
+                inicio = fin
+        finally:
+            vista.release()
+        if inicio:
+            del buffer[:inicio]
+        return tramas
+
+    def _extraer_legado(self):
+        """Separa por '|' a nivel de bytes para no partir caracteres UTF-8"""
+        partes = self.buffer.split(SEPARADOR_LEGADO)
+        # El último fragmento puede estar incompleto: se queda en el buffer
+        self.buffer = bytearray(partes.pop())
+        return [bytes(parte) for parte in partes if parte]
@@ -0,0 +1,407 @@
+# repeticion.py - Diario binario de una partida (comandos y eventos por tick) y reproductor sin ventana
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+
+from lockstep import SimulacionLockstep
+from mapa import MAPA, TIPOS_ESTRUCTURA
+
+MAGIA = b"GDMREP"
+VERSION = 1
+
+# Tipos de registro. Cada registro: tipo (1 byte) + longitud (varint) + contenido
+ALTA = 1          # id, x, y, vida, velocidad: entra un jugador o cambia (nuevo_jugador)
+BAJA = 2          # id
+POSICION = 3      # id, x, y: mensaje movimiento (posición absoluta)
+ENTRADA = 4       # id, máscaras de teclas (1 byte cada una)
+COMANDO = 5       # estructura_destruida enviado por un cliente
+FIN_TICK = 6      # tick: lo anterior se aplicó antes de este tick
+FOTO = 7          # tick, huella, estado completo (JSON comprimido): keyframe para buscar
+OLEADA = 8        # Evento nueva_oleada: contador, tiempo, limpiar
+DAÑO = 9          # Evento jugador_dañado: id, vida, posición de la torre
+DESTRUIDA = 10    # Evento estructura_destruida
+
+NOMBRES_EVENTO = {OLEADA: "nueva_oleada", DAÑO: "jugador_dañado", DESTRUIDA: "estructura_destruida"}
+EVENTOS = {nombre: tipo for tipo, nombre in NOMBRES_EVENTO.items()}
+
+PAR = struct.Struct("<dd")
+TRIO = struct.Struct("<ddd")
+CUATRO = struct.Struct("<dddd")
+HUELLA = struct.Struct("<I")
+
+
+class ErrorRepeticion(Exception):
+    """Archivo de repetición no válido o de otra versión"""
+
+
+def escribir_varint(buffer, valor):
+    """Entero no negativo en LEB128 (7 bits por byte)"""
+    while valor >= 0x80:
+        buffer.append((valor & 0x7F) | 0x80)
+        valor >>= 7
+    buffer.append(valor)
+
+
+def leer_varint(datos, pos):
+    """Devuelve (valor, posición siguiente)"""
+    valor = desplazamiento = 0
+    while True:
+        byte = datos[pos]
+        pos += 1
+        valor |= (byte & 0x7F) << desplazamiento
+        if byte < 0x80:
+            return valor, pos
+        desplazamiento += 7
+
+
+def escribir_texto(buffer, texto):
+    datos = str(texto).encode("utf-8")
+    escribir_varint(buffer, len(datos))
+    buffer += datos
+
+
+def leer_texto(datos, pos):
+    largo, pos = leer_varint(datos, pos)
+    return bytes(datos[pos:pos + largo]).decode("utf-8"), pos + largo
+
+
+def _estructura(buffer, comando):
+    """estructura (índice en TIPOS_ESTRUCTURA), equipo e índice"""
+    buffer.append(TIPOS_ESTRUCTURA.index(comando["estructura"]))
+    escribir_texto(buffer, comando["equipo"])
+    escribir_varint(buffer, comando["indice"])
+
+
+def _leer_estructura(datos, pos):
+    tipo_estructura = TIPOS_ESTRUCTURA[datos[pos]]
+    equipo, pos = leer_texto(datos, pos + 1)
+    indice, pos = leer_varint(datos, pos)
+    return {"estructura": tipo_estructura, "equipo": equipo, "indice": indice}
+
+
+def _comando_valido(comando):
+    indice = comando.get("indice")
+    return (comando.get("estructura") in TIPOS_ESTRUCTURA and isinstance(comando.get("equipo"), str) and
+            isinstance(indice, int) and indice >= 0)
+
+
+def ruta_grabacion(directorio, id_sala):
+    """Archivo nuevo para la partida de una sala: <fecha>-<sala>.rep"""
+    os.makedirs(directorio, exist_ok=True)
+    nombre = "".join(c if c.isalnum() or c in "-_" else "_" for c in id_sala)
+    base = os.path.join(directorio, f"{time.strftime('%Y%m%d-%H%M%S')}-{nombre}")
+    ruta, numero = base + ".rep", 1
+    while os.path.exists(ruta):
+        numero += 1
+        ruta = f"{base}-{numero}.rep"
+    return ruta
+
+
+class Grabador:
+    """Escribe el diario de una sala: solo se añade al final, un write por tick.
+
+    Los comandos se anotan en el orden en que la sala los aplica y cada tick se
+    cierra con FIN_TICK; cada `intervalo_fotos` segundos se añade una FOTO con el
+    estado completo para poder buscar sin reproducir desde el principio.
+    """
+
+    def __init__(self, ruta, tasa_tick, intervalo_fotos=10, sala=""):
+        self.ruta = ruta
+        self.tasa = tasa_tick
+        self.ticks_foto = max(1, round(intervalo_fotos * tasa_tick))
+        self.archivo = open(ruta, "ab")
+        self.pendiente = bytearray()  # Registros del tick en curso
+        self.bytes_escritos = 0
+        self.fotos = 0
+        if self.archivo.tell() == 0:
+            cabecera = bytearray(MAGIA)
+            cabecera.append(VERSION)
+            escribir_varint(cabecera, tasa_tick)
+            escribir_varint(cabecera, self.ticks_foto)
+            cabecera += MAPA.huella.encode("ascii")
+            escribir_texto(cabecera, sala)
+            self._escribir(cabecera)
+
+    def _registro(self, tipo, contenido):
+        self.pendiente.append(tipo)
+        escribir_varint(self.pendiente, len(contenido))
+        self.pendiente += contenido
+
+    def _escribir(self, datos):
+        self.archivo.write(datos)
+        self.bytes_escritos += len(datos)
+
+    def alta(self, id_jugador, datos):
+        contenido = bytearray()
+        escribir_texto(contenido, id_jugador)
+        contenido += CUATRO.pack(*datos["pos"], datos["vida"], datos["velocidad"])
+        self._registro(ALTA, contenido)
+
+    def baja(self, id_jugador):
+        contenido = bytearray()
+        escribir_texto(contenido, id_jugador)
+        self._registro(BAJA, contenido)
+
+    def posicion(self, id_jugador, pos):
+        contenido = bytearray()
+        escribir_texto(contenido, id_jugador)
+        contenido += PAR.pack(*pos)
+        self._registro(POSICION, contenido)
+
+    def entrada(self, id_jugador, mascaras):
+        contenido = bytearray()
+        escribir_texto(contenido, id_jugador)
+        contenido += bytes(int(mascara) & 0xFF for mascara in mascaras)
+        self._registro(ENTRADA, contenido)
+
+    def comando(self, comando):
+        if _comando_valido(comando):
+            contenido = bytearray()
+            _estructura(contenido, comando)
+            self._registro(COMANDO, contenido)
+
+    def evento(self, tipo, contenido_evento):
+        """nueva_oleada, jugador_dañado o estructura_destruida (los demás no se graban)"""
+        contenido = bytearray()
+        if tipo == "nueva_oleada":
+            escribir_varint(contenido, contenido_evento["contador"])
+            escribir_varint(contenido, int(contenido_evento["tiempo"]))
+            contenido.append(bool(contenido_evento["limpiar"]))
+        elif tipo == "jugador_dañado":
+            escribir_texto(contenido, contenido_evento["id"])
+            contenido += TRIO.pack(contenido_evento["vida"], *contenido_evento["torre_pos"])
+        elif tipo == "estructura_destruida" and _comando_valido(contenido_evento):
+            _estructura(contenido, contenido_evento)
+        else:
+            return
+        self._registro(EVENTOS[tipo], contenido)
+
+    def fin_tick(self, tick):
+        contenido = bytearray()
+        escribir_varint(contenido, tick)
+        self._registro(FIN_TICK, contenido)
+        self._escribir(self.pendiente)
+        self.pendiente = bytearray()
+
+    def toca_foto(self, tick):
+        return tick % self.ticks_foto == 0
+
+    def foto(self, tick, huella, estado):
+        """Keyframe: estado de SimulacionLockstep.estado() al final de `tick`"""
+        contenido = bytearray()
+        escribir_varint(contenido, tick)
+        contenido += HUELLA.pack(huella)
+        contenido += zlib.compress(json.dumps(estado, separators=(",", ":")).encode("utf-8"))
+        self._registro(FOTO, contenido)
+        self._escribir(self.pendiente)
+        self.pendiente = bytearray()
+        self.archivo.flush()  # Lo grabado hasta la foto sobrevive a una caída del proceso
+        self.fotos += 1
+
+    def estadisticas(self):
+        return {"archivo": self.ruta, "bytes": self.bytes_escritos, "fotos": self.fotos}
+
+    def cerrar(self):
+        if not self.archivo.closed:
+            self._escribir(self.pendiente)
+            self.pendiente = bytearray()
+            self.archivo.close()
+
+
+class Reproductor:
+    """Vuelve a simular una partida grabada, sin ventana ni red.
+
+    Se parte de una FOTO y se aplican los registros en orden con la misma
+    SimulacionLockstep que usan las salas lockstep; al llegar a cada FOTO se
+    compara la huella con la grabada. Un registro cortado al final (el servidor
+    cayó mientras escribía) se ignora.
+    """
+
+    def __init__(self, ruta):
+        with open(ruta, "rb") as f:
+            self.datos = memoryview(f.read())
+        datos = self.datos
+        if bytes(datos[:len(MAGIA)]) != MAGIA:
+            raise ErrorRepeticion(f"{ruta} no es un archivo de repetición")
+        pos = len(MAGIA)
+        if datos[pos] != VERSION:
+            raise ErrorRepeticion(f"Versión de repetición {datos[pos]} no soportada (se espera {VERSION})")
+        self.tasa, pos = leer_varint(datos, pos + 1)
+        self.ticks_foto, pos = leer_varint(datos, pos)
+        self.mapa = bytes(datos[pos:pos + 16]).decode("ascii")
+        self.sala, pos = leer_texto(datos, pos + 16)
+        if self.mapa != MAPA.huella:
+            print(f"Aviso: la partida se grabó con otro mapa ({self.mapa}, el local es {MAPA.huella})")
+        self.inicio = pos
+
+        # Índice de fotos para buscar: (tick, posición del registro)
+        self.fotos = []
+        self.ultimo_tick = 0
+        for tipo, contenido, inicio, _ in self.registros(self.inicio):
+            if tipo == FOTO:
+                tick, _ = leer_varint(contenido, 0)
+                self.fotos.append((tick, inicio))
+            elif tipo == FIN_TICK:
+                self.ultimo_tick, _ = leer_varint(contenido, 0)
+        if not self.fotos:
+            raise ErrorRepeticion(f"{ruta} no tiene ninguna foto de estado")
+
+    def registros(self, pos):
+        """(tipo, contenido, posición del registro, posición siguiente) desde `pos`"""
+        datos = self.datos
+        fin = len(datos)
+        while pos < fin:
+            try:
+                largo, inicio = leer_varint(datos, pos + 1)
+            except IndexError:
+                return
+            if inicio + largo > fin:
+                return  # Registro a medio escribir
+            yield datos[pos], datos[inicio:inicio + largo], pos, inicio + largo
+            pos = inicio + largo
+
+    @staticmethod
+    def leer_foto(contenido):
+        tick, pos = leer_varint(contenido, 0)
+        huella, = HUELLA.unpack_from(contenido, pos)
+        estado = json.loads(zlib.decompress(contenido[pos + HUELLA.size:]))
+        return tick, huella, estado
+
+    def foto_anterior(self, tick):
+        """Última foto en o antes de `tick`"""
+        anterior = self.fotos[0]
+        for foto in self.fotos:
+            if foto[0] > tick:
+                break
+            anterior = foto
+        return anterior
+
+    def ir_a(self, tick):
+        """Simulación en `tick` (o en el último tick grabado): desde la foto anterior, sin empezar de cero"""
+        _, inicio = self.foto_anterior(tick)
+        simulacion = None
+        for simulacion, _ in self.reproducir_desde(inicio, hasta=tick):
+            pass
+        return simulacion
+
+    def reproducir_desde(self, inicio, hasta=None, informe=None, eventos=None):
+        """Generador: (simulación, tick) tras cada tick desde la foto en `inicio` hasta `hasta`"""
+        simulacion = None
+        for tipo, contenido, _, _ in self.registros(inicio):
+            if tipo == FOTO:
+                tick, huella, estado = self.leer_foto(contenido)
+                if simulacion is None:
+                    simulacion = SimulacionLockstep.desde_estado(estado)
+                    yield simulacion, tick
+                else:
+                    if informe is not None:
+                        informe["fotos_verificadas"] += 1
+                    if simulacion.tick != tick or simulacion.huella() != huella:
+                        # Divergencia: se anota y se sigue desde el estado grabado
+                        if informe is not None:
+                            informe["divergencias"].append(tick)
+                        simulacion = SimulacionLockstep.desde_estado(estado)
+                if hasta is not None and simulacion.tick >= hasta:
+                    return
+                continue
+            if simulacion is None:
+                continue
+            if tipo == FIN_TICK:
+                simulacion.avanzar()
+                simulacion.eventos = []
+                yield simulacion, simulacion.tick
+                if hasta is not None and simulacion.tick >= hasta:
+                    return
+            elif tipo == ENTRADA:
+                id_jugador, pos = leer_texto(contenido, 0)
+                simulacion.mover_jugador(id_jugador, contenido[pos:])
+            elif tipo == POSICION:
+                id_jugador, pos = leer_texto(contenido, 0)
+                simulacion.colocar_jugador(id_jugador, PAR.unpack_from(contenido, pos))
+            elif tipo == ALTA:
+                id_jugador, pos = leer_texto(contenido, 0)
+                x, y, vida, velocidad = CUATRO.unpack_from(contenido, pos)
+                simulacion.poner_jugador(id_jugador, {"pos": [x, y], "vida": vida, "velocidad": velocidad})
+            elif tipo == BAJA:
+                simulacion.quitar_jugador(leer_texto(contenido, 0)[0])
+            elif tipo == COMANDO:
+                simulacion.aplicar_comando(_leer_estructura(contenido, 0))
+            elif tipo in NOMBRES_EVENTO:
+                if informe is not None:
+                    nombre = NOMBRES_EVENTO[tipo]
+                    informe["eventos"][nombre] = informe["eventos"].get(nombre, 0) + 1
+                if eventos is not None:
+                    eventos.append({"tick": simulacion.tick + 1, "tipo": NOMBRES_EVENTO[tipo],
+                                    **self.leer_evento(tipo, contenido)})
+
+    @staticmethod
+    def leer_evento(tipo, contenido):
+        if tipo == OLEADA:
+            contador, pos = leer_varint(contenido, 0)
+            tiempo, pos = leer_varint(contenido, pos)
+            return {"contador": contador, "tiempo": tiempo, "limpiar": bool(contenido[pos])}
+        if tipo == DAÑO:
+            id_jugador, pos = leer_texto(contenido, 0)
+            vida, x, y = TRIO.unpack_from(contenido, pos)
+            return {"id": id_jugador, "vida": vida, "torre_pos": [x, y]}
+        return _leer_estructura(contenido, 0)
+
+    def reproducir(self, desde=0, hasta=None, eventos=None):
+        """Reproduce lo más rápido posible y devuelve un informe (velocidad y divergencias)"""
+        tick_inicio, inicio = self.foto_anterior(desde)
+        informe = {"sala": self.sala, "tasa": self.tasa, "fotos_verificadas": 0, "divergencias": [],
+                   "eventos": {}}
+        ticks = 0
+        comienzo = time.perf_counter()
+        simulacion = None
+        for simulacion, _ in self.reproducir_desde(inicio, hasta, informe, eventos):
+            ticks += 1
+        segundos = time.perf_counter() - comienzo
+        ticks -= 1  # El primero es la foto de partida
+        segundos_partida = ticks / self.tasa
+        informe.update({
+            "desde_tick": tick_inicio,
+            "hasta_tick": simulacion.tick if simulacion is not None else tick_inicio,
+            "ticks": ticks,
+            "segundos_partida": round(segundos_partida, 3),
+            "segundos_reales": round(segundos, 4),
+            "velocidad": round(segundos_partida / segundos, 1) if segundos > 0 else None,
+            "minions": simulacion.minions.n if simulacion is not None else 0,
+            "bytes": len(self.datos),
+            "fotos": len(self.fotos)
+        })
+        return informe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce sin ventana una partida grabada con --grabar")
+    parser.add_argument("archivo", help="Archivo .rep del servidor")
+    parser.add_argument("--desde", type=float, default=0,
+                        help="Segundo de partida desde el que reproducir (se busca la foto anterior)")
+    parser.add_argument("--hasta", type=float, default=None, help="Segundo de partida en el que parar")
+    parser.add_argument("--eventos", action="store_true", help="Listar los eventos grabados")
+    parser.add_argument("--salida", default=None, help="Archivo JSON para el informe")
+    args = parser.parse_args()
+
+    reproductor = Reproductor(args.archivo)
+    eventos = [] if args.eventos else None
+    informe = reproductor.reproducir(round(args.desde * reproductor.tasa),
+                                     None if args.hasta is None else round(args.hasta * reproductor.tasa),
+                                     eventos)
+    if eventos is not None:
+        for evento in eventos:
+            print(json.dumps(evento, ensure_ascii=False))
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    print(json.dumps(informe, ensure_ascii=False))
+    if informe["divergencias"]:
+        print(f"La reproducción divergió de la grabación en {len(informe['divergencias'])} fotos")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
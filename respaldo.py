@@ -0,0 +1,123 @@
+# respaldo.py - Puntos de control del estado del servidor en un archivo mapeado en memoria (dos copias)
+import json
+import mmap
+import os
+import struct
+import zlib
+
+MAGIA = b"GDMRSP"
+VERSION = 1
+PAGINA = mmap.ALLOCATIONGRANULARITY  # Cada copia empieza en su propia página (flush por rangos)
+
+CABECERA = struct.Struct("<6sBxQ")  # magia, versión, capacidad de cada copia
+RANURA = struct.Struct("<QII")      # secuencia, largo, crc32 (de secuencia + datos)
+
+
+class ErrorRespaldo(Exception):
+    """El punto de control no cabe en el archivo"""
+
+
+def empaquetar(documento, anexos):
+    """Documento JSON y bloques binarios: largos (JSON, nº de anexos, cada anexo), JSON y anexos"""
+    json_bytes = json.dumps(documento, separators=(",", ":")).encode("utf-8")
+    cabecera = struct.pack(f"<II{len(anexos)}Q", len(json_bytes), len(anexos), *(len(a) for a in anexos))
+    return b"".join([cabecera, json_bytes, *anexos])
+
+
+def desempaquetar(datos):
+    """(documento, [anexos]) de empaquetar(); los anexos son vistas de `datos`, sin copiar"""
+    datos = memoryview(datos)
+    largo_json, n = struct.unpack_from("<II", datos)
+    largos = struct.unpack_from(f"<{n}Q", datos, 8)
+    pos = 8 + 8 * n
+    documento = json.loads(bytes(datos[pos:pos + largo_json]))
+    pos += largo_json
+    anexos = []
+    for largo in largos:
+        anexos.append(datos[pos:pos + largo])
+        pos += largo
+    return documento, anexos
+
+
+def _redondear(valor):
+    return -(-valor // PAGINA) * PAGINA
+
+
+class ArchivoRespaldo:
+    """Archivo preasignado con dos copias del último estado guardado.
+
+    Cada guardado escribe en la copia más antigua: primero los datos y después la
+    cabecera de la copia con una secuencia nueva y el CRC de ambos. Si el proceso
+    muere a medio escribir, esa copia no pasa la comprobación y `cargar()` devuelve
+    la otra, que no se ha tocado.
+    """
+
+    def __init__(self, ruta, capacidad=8 * 1024 * 1024):
+        self.ruta = ruta
+        existe = os.path.exists(ruta) and os.path.getsize(ruta) >= PAGINA
+        self.archivo = open(ruta, "r+b" if existe else "w+b")
+        if existe:
+            magia, version, capacidad_archivo = CABECERA.unpack(self.archivo.read(CABECERA.size))
+            if magia == MAGIA and version == VERSION:
+                capacidad = capacidad_archivo  # El formato lo fija el archivo existente
+            else:
+                print(f"Aviso: {ruta} no es un archivo de respaldo válido; se reinicia")
+                existe = False
+        self.capacidad = capacidad
+        self.tamaño_ranura = _redondear(RANURA.size + capacidad)
+        tamaño = PAGINA + 2 * self.tamaño_ranura
+        if os.path.getsize(ruta) < tamaño:
+            self.archivo.truncate(tamaño)  # Preasignado: guardar nunca cambia el tamaño del archivo
+        self.mapa = mmap.mmap(self.archivo.fileno(), tamaño)
+        if not existe:
+            self.mapa[:CABECERA.size] = CABECERA.pack(MAGIA, VERSION, capacidad)
+            self.mapa.flush(0, PAGINA)
+        self.secuencia = 0
+        self.ranura_actual = None  # Copia con el último estado bueno
+        self.bytes_guardados = 0
+        for ranura in (0, 1):
+            secuencia, _ = self._leer_ranura(ranura)
+            if secuencia > self.secuencia:
+                self.secuencia, self.ranura_actual = secuencia, ranura
+
+    def _inicio(self, ranura):
+        return PAGINA + ranura * self.tamaño_ranura
+
+    def _leer_ranura(self, ranura):
+        """(secuencia, datos) de una copia válida; (0, None) si está vacía o a medio escribir"""
+        inicio = self._inicio(ranura)
+        secuencia, largo, crc = RANURA.unpack_from(self.mapa, inicio)
+        if secuencia == 0 or largo > self.capacidad:
+            return 0, None
+        datos = self.mapa[inicio + RANURA.size:inicio + RANURA.size + largo]
+        if zlib.crc32(datos, zlib.crc32(struct.pack("<Q", secuencia))) != crc:
+            return 0, None
+        return secuencia, datos
+
+    def cargar(self):
+        """Datos del último punto de control completo, o None si no hay ninguno"""
+        if self.ranura_actual is None:
+            return None
+        return self._leer_ranura(self.ranura_actual)[1]
+
+    def guardar(self, datos):
+        """Escribe `datos` en la copia que no tiene el último estado bueno"""
+        if len(datos) > self.capacidad:
+            raise ErrorRespaldo(f"El punto de control ({len(datos)} bytes) no cabe en {self.capacidad} bytes")
+        ranura = 1 if self.ranura_actual == 0 else 0
+        inicio = self._inicio(ranura)
+        secuencia = self.secuencia + 1
+        self.mapa[inicio + RANURA.size:inicio + RANURA.size + len(datos)] = datos
+        crc = zlib.crc32(datos, zlib.crc32(struct.pack("<Q", secuencia)))
+        self.mapa[inicio:inicio + RANURA.size] = RANURA.pack(secuencia, len(datos), crc)
+        self.mapa.flush(inicio, _redondear(RANURA.size + len(datos)))
+        self.secuencia, self.ranura_actual = secuencia, ranura
+        self.bytes_guardados = len(datos)
+
+    def estadisticas(self):
+        return {"archivo": self.ruta, "secuencia": self.secuencia, "bytes": self.bytes_guardados,
+                "capacidad": self.capacidad}
+
+    def cerrar(self):
+        self.mapa.close()
+        self.archivo.close()
@@ -0,0 +1,66 @@
+# rutas.py - Rutas de minions precompiladas por longitud de arco
+from bisect import bisect_right
+
+import numpy as np
+
+
+class RutaCompilada:
+    """Ruta poligonal con longitudes de segmento, longitud acumulada y direcciones unitarias.
+
+    El estado de un minion sobre la ruta es un único número: la distancia
+    recorrida. La posición se obtiene en O(log n) con una búsqueda binaria, y
+    es la misma en cualquier máquina que compile la misma lista de puntos.
+    """
+
+    def __init__(self, ruta_id, puntos):
+        if len(puntos) < 2:
+            raise ValueError(f"La ruta {ruta_id} necesita al menos dos puntos")
+        self.ruta_id = ruta_id
+        self.puntos = np.asarray(puntos, dtype=float)
+        segmentos = np.diff(self.puntos, axis=0)
+        self.longitudes = np.hypot(segmentos[:, 0], segmentos[:, 1])
+        self.acumulada = np.concatenate(([0.0], np.cumsum(self.longitudes)))
+        self.longitud_total = float(self.acumulada[-1])
+        self.direcciones = np.divide(segmentos, self.longitudes[:, None],
+                                     out=np.zeros_like(segmentos), where=self.longitudes[:, None] > 0)
+        self._acumulada_lista = self.acumulada.tolist()
+
+    @property
+    def segmentos(self):
+        return len(self.longitudes)
+
+    def segmento(self, distancia):
+        """Índice del segmento en el que está la distancia dada"""
+        return min(max(bisect_right(self._acumulada_lista, distancia) - 1, 0), self.segmentos - 1)
+
+    def posicion(self, distancia):
+        """Posición (x, y) a `distancia` del inicio de la ruta"""
+        distancia = min(max(distancia, 0.0), self.longitud_total)
+        s = self.segmento(distancia)
+        x, y = self.puntos[s] + self.direcciones[s] * (distancia - self.acumulada[s])
+        return float(x), float(y)
+
+    def segmentos_de(self, distancias):
+        """Versión vectorizada de `segmento`"""
+        indices = np.searchsorted(self.acumulada, distancias, side="right") - 1
+        return np.clip(indices, 0, self.segmentos - 1)
+
+    def posiciones(self, distancias):
+        """Posiciones (N, 2) para un array de distancias"""
+        distancias = np.clip(distancias, 0.0, self.longitud_total)
+        s = self.segmentos_de(distancias)
+        return self.puntos[s] + self.direcciones[s] * (distancias - self.acumulada[s])[:, None]
+
+    def proyectar(self, x, y, segmento=None):
+        """Distancia sobre la ruta del punto más cercano a (x, y) (en un segmento o en todos)"""
+        candidatos = range(self.segmentos) if segmento is None else [min(segmento, self.segmentos - 1)]
+        mejor, mejor_distancia2 = 0.0, float("inf")
+        for s in candidatos:
+            origen = self.puntos[s]
+            t = float(np.dot((x, y) - origen, self.direcciones[s]))
+            t = min(max(t, 0.0), float(self.longitudes[s]))
+            px, py = origen + self.direcciones[s] * t
+            distancia2 = (px - x) ** 2 + (py - y) ** 2
+            if distancia2 < mejor_distancia2:
+                mejor, mejor_distancia2 = float(self.acumulada[s]) + t, distancia2
+        return mejor
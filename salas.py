@@ -0,0 +1,809 @@
+# salas.py - Salas de juego: muchas partidas independientes en un mismo servidor
+import math
+from collections import OrderedDict
+
+from almacen_minions import PASO_VELOCIDAD_MINIONS, AlmacenMinions
+from colas import ESTADO, EVENTO, POSICION
+from espacial import IndiceEspacial
+from instantaneas import HistorialInstantaneas, calcular_delta
+from lockstep import SimulacionLockstep, avanzar_reloj, destruir_estructura
+from repeticion import Grabador, ruta_grabacion
+from mapa import MAPA
+from movimiento import MAX_ENTRADAS_REENVIO, TOLERANCIA, mover_por_rutas
+from planificador import PlanificadorTicks
+from protocolo import (FORMATO_BINARIO, FORMATO_JSON, CargaMensaje, codificar_con_fragmentos,
+                       codificar_fragmento)
+
+SALA_POR_DEFECTO = "principal"
+
+# Zona de interés de cada jugador: un cuadrado de lado 2 * RADIO_INTERES centrado en su
+# posición, ampliado con la pantalla del cliente (ANCHO_VISTA x ALTO_VISTA desde scroll_y)
+# si el cliente la indica en sus mensajes de movimiento
+RADIO_INTERES = 300
+ANCHO_VISTA = 800
+ALTO_VISTA = 600
+# Mensajes movimiento (posición absoluta): la posición tiene que estar en un carril y a un
+# recorrido alcanzable desde la anterior con la velocidad del jugador a 60 fotogramas por segundo
+FOTOGRAMAS_CLIENTE = 60
+MARGEN_MOVIMIENTO = 1.5       # Holgura para la diagonal y fotogramas que llegan juntos
+PRESUPUESTO_ACUMULADO_MAX = 1.0  # Segundos de movimiento sin usar que se guardan (ráfagas tras un retraso)
+DISTANCIA_MAX_CARRIL = 2 * TOLERANCIA
+INTERVALO_KEYFRAME = 2.0  # Segundos mínimos entre keyframes de difusión a un cliente sin base confirmada
+MINIONS_ENVIADOS = 8  # Vistas de minions recordadas por jugador como base de los deltas
+
+# Clase de cada tipo de mensaje en la cola de salida (el resto son eventos que no se descartan)
+CLASES_MENSAJE = {
+    "actualizacion_posicion": POSICION,
+    "actualizacion_posiciones": POSICION,
+    "entrada_confirmada": POSICION,
+    "estado_juego": ESTADO,
+    "estado_delta": ESTADO
+}
+
+
+class ErrorSala(Exception):
+    """Operación de sala no válida (nombre repetido, sala inexistente, límite alcanzado)"""
+
+
+def crear_estado_inicial():
+    """Estado completo de una partida nueva"""
+    return {
+        "mapa": MAPA.estado_mapa(),
+        "estructuras": MAPA.estado_estructuras(),
+        "minions": {
+            "aliados": [],
+            "enemigos": []
+        },
+        "oleadas": {
+            "tiempo_ultima_oleada": 0,
+            "intervalo": 30,
+            "contador_oleadas": 0,
+            "tiempo_juego": 0,
+            "primer_oleada": False
+        }
+    }
+
+
+class Sala:
+    """Una partida: su propio estado, minions, reloj de oleadas y jugadores.
+
+    La sala no tiene bucle propio: el GestorSalas llama a `planificador.ejecutar_tick()`
+    de cada sala activa desde el bucle de ticks compartido del servidor.
+
+    Con `lockstep` la sala no difunde estado: cada tick reparte las entradas de todos
+    los jugadores (marco_lockstep) y cada cliente avanza la misma SimulacionLockstep.
+    Con un `grabador` (repeticion.py) se anotan los comandos y eventos de cada tick.
+    """
+
+    def __init__(self, id_sala, servidor, tasa_tick=10, intervalo_estado=0.1, tasa_posiciones=None,
+                 lockstep=False, grabador=None, estado=None):
+        self.id = id_sala
+        self.servidor = servidor
+        self.lock = servidor.lock  # Un solo lock para todo el servidor
+        self.jugadores = {}  # id -> datos del jugador (los mismos dicts que Servidor.clientes)
+
+        # Simulación a paso fijo: oleadas -> minions -> estructuras -> posiciones -> difusión
+        self.intervalo_estado = intervalo_estado
+        # Posiciones de jugadores: se difunden juntas a `tasa_posiciones` Hz (None = cada tick)
+        self.intervalo_posiciones = 1 / tasa_posiciones if tasa_posiciones else 0
+        self.posiciones_pendientes = {}  # id -> última posición recibida desde la última difusión
+        self.planificador = PlanificadorTicks(tasa_tick)
+        self.lockstep = lockstep
+        if lockstep:
+            self.planificador.agregar_fase("lockstep", self.fase_lockstep)
+        else:
+            self.planificador.agregar_fase("oleadas", self.fase_oleadas)
+            self.planificador.agregar_fase("minions", self.paso_minions)
+            self.planificador.agregar_fase("estructuras", self.paso_estructuras)
+            self.planificador.agregar_fase("posiciones", self.fase_posiciones)
+            self.planificador.agregar_fase("difusion", self.fase_difusion)
+
+        # Posiciones de jugadores en una rejilla para las consultas de rango de las torres
+        self.indice_jugadores = IndiceEspacial(tamano_celda=200)
+
+        # Minions en arrays NumPy; estado_juego["minions"] es una vista que se
+        # reconstruye solo al registrar una instantánea
+        self.minions = AlmacenMinions(capacidad=128)
+
+        # Instantáneas numeradas para enviar a cada cliente solo lo que cambió
+        self.historial = HistorialInstantaneas()
+
+        # Estado completo del juego compartido por los jugadores de la sala
+        self.estado_juego = crear_estado_inicial()
+
+        # Lockstep: la simulación comparte estructuras, oleadas y minions con la sala;
+        # altas, bajas y comandos esperan al siguiente tick para ir en su marco
+        self.simulacion = None
+        self.altas_lockstep = {}
+        self.bajas_lockstep = []
+        self.comandos_lockstep = []
+        self.desincronizaciones = 0
+        self.movimientos_rechazados = 0  # Mensajes movimiento fuera de carril o demasiado lejos
+        if lockstep:
+            self.simulacion = SimulacionLockstep(self.estado_juego, self.minions, tasa_tick)
+
+        # Partida recuperada de un punto de control (respaldo.py)
+        if estado is not None:
+            self.restaurar(estado)
+
+        # Diario de la partida: la última fase de cada tick lo cierra; empieza con una foto
+        self.grabador = grabador
+        if grabador is not None:
+            self.planificador.agregar_fase("grabacion", self.fase_grabacion)
+            grabador.foto(self.planificador.tick, *self.estado_simulacion())  # No es 0 si se restauró
+
+    @property
+    def activa(self):
+        """Una sala sin jugadores queda suspendida: no avanza ni consume tiempo de tick"""
+        return bool(self.jugadores)
+
+    def agregar_jugador(self, id_jugador, jugador):
+        """Mete a un jugador en la sala y avisa al resto"""
+        with self.lock:
+            jugador["sala"] = self.id
+            jugador["ack_estado"] = None  # Las instantáneas de otra sala no sirven de base
+            jugador["interes"] = set()  # Jugadores dentro de su zona de interés
+            jugador["minions_enviados"] = OrderedDict()  # seq -> minions visibles enviados
+            jugador.pop("tick_keyframe", None)
+            jugador.pop("presupuestos", None)  # El movimiento permitido se cuenta con los ticks de esta sala
+            self.jugadores[id_jugador] = jugador
+            self.actualizar_posicion_jugador(id_jugador, jugador["pos"])
+            self.registrar_alta(id_jugador)
+
+        # Notificar a otros jugadores (sin el socket, que no es serializable)
+        self.enviar_a_todos_excepto(id_jugador, "nuevo_jugador", {
+            "id": id_jugador,
+            **self.obtener_datos_jugadores()[id_jugador]
+        })
+
+    def quitar_jugador(self, id_jugador):
+        """Saca a un jugador de la sala y avisa al resto"""
+        with self.lock:
+            jugador = self.jugadores.pop(id_jugador, None)
+            self.indice_jugadores.quitar(id_jugador)
+            self.posiciones_pendientes.pop(id_jugador, None)
+            for otro in self.jugadores.values():
+                otro["interes"].discard(id_jugador)
+            if jugador is not None:
+                jugador["sala"] = None
+                if self.lockstep:
+                    self.altas_lockstep.pop(id_jugador, None)
+                    self.bajas_lockstep.append(id_jugador)
+                elif self.grabador is not None:
+                    self.grabador.baja(id_jugador)
+        if jugador is not None:
+            self.enviar_a_todos("jugador_desconectado", {
+                "id": id_jugador
+            })
+
+    def registrar_alta(self, id_jugador):
+        """El jugador entra o cambia de posición, vida o velocidad (en lockstep, en el próximo tick)"""
+        with self.lock:
+            jugador = self.jugadores[id_jugador]
+            datos = {"pos": list(jugador["pos"]), "vida": jugador["vida"], "velocidad": jugador["velocidad"]}
+            if self.lockstep:
+                self.altas_lockstep[id_jugador] = datos
+            elif self.grabador is not None:
+                self.grabador.alta(id_jugador, datos)
+
+    def datos_bienvenida(self, id_jugador):
+        """Contenido para un jugador que entra: jugadores y estado completo (keyframe)"""
+        with self.lock:
+            if self.lockstep:
+                # El cliente simula desde este tick con los marcos siguientes
+                return {
+                    "sala": self.id,
+                    "jugadores": self.obtener_datos_jugadores(),
+                    "lockstep": self.simulacion.estado(),
+                    "oleada": {
+                        "contador": self.estado_juego["oleadas"]["contador_oleadas"],
+                        "tiempo": self.estado_juego["oleadas"]["tiempo_juego"]
+                    }
+                }
+            seq_estado = self.registrar_instantanea()
+            self.jugadores[id_jugador]["tick_keyframe"] = self.planificador.tick
+            minions = self.minions_visibles(self.jugadores[id_jugador], seq_estado, {})
+            return {
+                "sala": self.id,
+                "jugadores": self.obtener_datos_jugadores(),
+                "estado_juego": {**self.historial.obtener(seq_estado), "minions": minions},
+                "seq_estado": seq_estado,
+                "oleada": {
+                    "contador": self.estado_juego["oleadas"]["contador_oleadas"],
+                    "tiempo": self.estado_juego["oleadas"]["tiempo_juego"]
+                }
+            }
+
+    def confirmar_instantanea(self, id_jugador, mensaje):
+        """Procesa un ack_estado: nueva base para los deltas o petición de keyframe"""
+        with self.lock:
+            jugador = self.jugadores.get(id_jugador)
+            if jugador is None:
+                return
+            if mensaje.get("resync"):
+                # El cliente perdió la base: reenviar la última instantánea completa
+                jugador["ack_estado"] = None
+                seq, estado = self.historial.ultima()
+                if estado is not None:
+                    jugador["tick_keyframe"] = self.planificador.tick
+                    minions = self.minions_visibles(jugador, seq, {})
+                    self.servidor.enviar_mensaje(jugador["socket"], "estado_juego",
+                                                 {"seq": seq, **estado, "minions": minions})
+            elif self.historial.obtener(mensaje.get("seq")) is not None:
+                jugador["ack_estado"] = mensaje["seq"]
+
+    def destruir_estructura(self, mensaje):
+        """Marca una estructura como destruida y lo comunica a la sala"""
+        with self.lock:
+            # "tipo" es el del mensaje: la clase de estructura (torres, inhibidores, nexos) va en "estructura"
+            comando = {"estructura": mensaje.get("estructura"), "equipo": mensaje.get("equipo"),
+                       "indice": mensaje.get("indice")}
+            if self.lockstep:
+                self.comandos_lockstep.append(comando)  # Se aplica en el próximo tick, en todos a la vez
+            elif destruir_estructura(self.estado_juego["estructuras"], comando):
+                if self.grabador is not None:
+                    self.grabador.comando(comando)
+                    self.grabador.evento("estructura_destruida", comando)
+                self.enviar_a_todos("estructura_destruida", comando)
+
+    def fase_oleadas(self, dt):
+        """Fase 1 del tick: el reloj de juego avanza en segundos enteros"""
+        if self.planificador.cada(1):
+            self.paso_tiempo_juego()
+
+    def mover_jugador(self, id_jugador, pos, scroll_y=None):
+        """Registra la nueva posición (mensaje movimiento) si es alcanzable; solo se difunde la última de cada tick"""
+        with self.lock:
+            jugador = self.jugadores.get(id_jugador)
+            if jugador is None or self.lockstep:
+                return
+            pos = self.validar_movimiento(jugador, pos)
+            if pos is None:
+                self.movimientos_rechazados += 1
+                return
+            if self.grabador is not None:
+                self.grabador.posicion(id_jugador, pos)
+            self.colocar_jugador(id_jugador, pos, scroll_y)
+
+    def validar_movimiento(self, jugador, pos):
+        """La posición como [x, y] si está en un carril y al alcance del jugador; None si no.
+
+        El recorrido permitido se acumula por ticks desde el último movimiento
+        (velocidad x fotogramas del cliente, con margen) y cada movimiento gasta
+        la distancia desde la posición que tiene el servidor.
+        """
+        try:
+            x, y = float(pos[0]), float(pos[1])
+        except (TypeError, ValueError, IndexError):
+            return None
+        if MAPA.distancia_carriles((x, y)) > DISTANCIA_MAX_CARRIL:
+            return None
+        disponible = self.presupuesto(jugador, "recorrido", jugador.get("velocidad", 5) * FOTOGRAMAS_CLIENTE *
+                                      MARGEN_MOVIMIENTO / self.planificador.tasa)
+        recorrido = math.hypot(x - jugador["pos"][0], y - jugador["pos"][1])
+        if recorrido > disponible:
+            self.gastar_presupuesto(jugador, "recorrido", disponible, 0)
+            return None
+        self.gastar_presupuesto(jugador, "recorrido", disponible, recorrido)
+        return [x, y]
+
+    def presupuesto(self, jugador, nombre, por_tick):
+        """Movimiento permitido (`nombre`: recorrido o entradas) acumulado por ticks desde el último uso"""
+        tick = self.planificador.tick
+        disponible, ultimo = jugador.get("presupuestos", {}).get(nombre, (por_tick, tick))
+        return min(disponible + (tick - ultimo) * por_tick,
+                   por_tick * self.planificador.tasa * PRESUPUESTO_ACUMULADO_MAX)
+
+    def gastar_presupuesto(self, jugador, nombre, disponible, gasto):
+        jugador.setdefault("presupuestos", {})[nombre] = (disponible - gasto, self.planificador.tick)
+
+    def colocar_jugador(self, id_jugador, pos, scroll_y=None):
+        with self.lock:
+            jugador = self.jugadores.get(id_jugador)
+            if jugador is not None and not self.lockstep:  # En lockstep solo cuentan las entradas
+                jugador["pos"] = pos
+                if scroll_y is not None:
+                    jugador["scroll_y"] = scroll_y
+                self.actualizar_posicion_jugador(id_jugador, pos)
+                self.posiciones_pendientes[id_jugador] = pos  # Sustituye a la anterior sin enviar
+
+    def aplicar_entradas(self, id_jugador, seq, teclas, scroll_y=None):
+        """Mueve al jugador con sus entradas numeradas siguiendo las reglas de las rutas.
+
+        `teclas` son las máscaras de las entradas seq - len(teclas) + 1 ... seq; las que
+        ya se aplicaron (llegan repetidas por UDP) se ignoran. Como mucho se aplican
+        las entradas de FOTOGRAMAS_CLIENTE por segundo (con margen): las demás no se
+        confirman, y por UDP el cliente las repite y se aplican en ticks siguientes.
+        """
+        with self.lock:
+            jugador = self.jugadores.get(id_jugador)
+            if jugador is None:
+                return
+            ultima = jugador.get("ultima_entrada", 0)
+            if seq <= ultima:
+                return
+            teclas = teclas[-MAX_ENTRADAS_REENVIO:]  # Nunca más fotogramas de los que el cliente repite
+            primera = max(seq - len(teclas) + 1, ultima + 1)
+            nuevas = [int(mascara) for mascara in teclas[len(teclas) - (seq - primera + 1):]]
+            disponible = self.presupuesto(jugador, "entradas",
+                                          FOTOGRAMAS_CLIENTE * MARGEN_MOVIMIENTO / self.planificador.tasa)
+            nuevas = nuevas[:int(disponible)]
+            self.gastar_presupuesto(jugador, "entradas", disponible, len(nuevas))
+            if not nuevas:
+                return
+            jugador["ultima_entrada"] = primera + len(nuevas) - 1
+            if self.lockstep:
+                # Se guardan para el próximo marco; las mueve la simulación
+                jugador.setdefault("entradas_lockstep", []).extend(nuevas)
+                return
+            pos = jugador["pos"]
+            for mascara in nuevas:
+                pos, _ = mover_por_rutas(pos, mascara, jugador.get("velocidad", 5), ANCHO_VISTA, ALTO_VISTA)
+            if self.grabador is not None:
+                self.grabador.entrada(id_jugador, nuevas)
+            self.colocar_jugador(id_jugador, pos, scroll_y)
+
+    def fase_posiciones(self, dt):
+        """Fase 4 del tick: zonas de interés y un actualizacion_posiciones por jugador"""
+        if self.planificador.cada(self.intervalo_posiciones):
+            self.enviar_posiciones()
+
+    def region_interes(self, jugador):
+        """Rectángulo (x0, y0, x1, y1) de lo que le interesa al jugador"""
+        x, y = jugador["pos"]
+        x0, y0 = x - RADIO_INTERES, y - RADIO_INTERES
+        x1, y1 = x + RADIO_INTERES, y + RADIO_INTERES
+        scroll_y = jugador.get("scroll_y")
+        if scroll_y is not None:
+            # Ampliar con la pantalla del cliente: todo lo que puede dibujar
+            x0, x1 = min(x0, 0), max(x1, ANCHO_VISTA)
+            y0, y1 = min(y0, scroll_y), max(y1, scroll_y + ALTO_VISTA)
+        return x0, y0, x1, y1
+
+    def enviar_posiciones(self):
+        """Actualiza la zona de interés de cada jugador y le envía solo lo que hay en ella.
+
+        Los jugadores que entran o salen de la zona llegan en entra_en_vista /
+        sale_de_vista; de los que siguen dentro solo se envía la última posición.
+        """
+        with self.lock:
+            posiciones, self.posiciones_pendientes = self.posiciones_pendientes, {}
+            # Cada posición y cada jugador se serializan una sola vez; el mensaje de
+            # cada destinatario se ensambla con los fragmentos de lo que tiene a la vista
+            fragmentos_posiciones = {i: codificar_fragmento(i, pos) for i, pos in posiciones.items()}
+            fragmentos_jugadores = {}
+            datos_jugadores = None
+            cargas = {}  # ids incluidos -> carga: jugadores con la misma vista la comparten
+            for id_jugador, jugador in self.jugadores.items():
+                visibles = set(self.indice_jugadores.en_rectangulo(*self.region_interes(jugador)))
+                visibles.discard(id_jugador)
+                entran = visibles - jugador["interes"]
+                salen = jugador["interes"] - visibles
+                jugador["interes"] = visibles
+                try:
+                    if jugador.get("ultima_entrada", 0) > jugador.get("entrada_confirmada", 0):
+                        # Al propio jugador: posición autoritativa y última entrada aplicada
+                        jugador["entrada_confirmada"] = jugador["ultima_entrada"]
+                        self.servidor.enviar_mensaje(jugador["socket"], "entrada_confirmada", {
+                            "seq": jugador["ultima_entrada"],
+                            "pos": jugador["pos"]
+                        })
+                    if entran:
+                        if datos_jugadores is None:
+                            datos_jugadores = self.obtener_datos_jugadores()
+                        for i in entran:
+                            if i not in fragmentos_jugadores:
+                                fragmentos_jugadores[i] = codificar_fragmento(i, datos_jugadores[i])
+                        self.servidor.enviar_carga(jugador["socket"], codificar_con_fragmentos(
+                            "entra_en_vista", "jugadores", [fragmentos_jugadores[i] for i in entran]))
+                    if salen:
+                        self.servidor.enviar_mensaje(jugador["socket"], "sale_de_vista", {
+                            "jugadores": sorted(salen)
+                        })
+                    incluidos = tuple(sorted(i for i in posiciones if i in visibles and i not in entran))
+                    if incluidos:
+                        if incluidos not in cargas:
+                            cargas[incluidos] = CargaMensaje(
+                                "actualizacion_posiciones", {"posiciones": {i: posiciones[i] for i in incluidos}},
+                                cargas={FORMATO_JSON: lambda incluidos=incluidos: codificar_con_fragmentos(
+                                    "actualizacion_posiciones", "posiciones",
+                                    [fragmentos_posiciones[i] for i in incluidos])})
+                        self.servidor.enviar_carga(jugador["socket"], cargas[incluidos], POSICION)
+                except:
+                    print(f"Error enviando posiciones a jugador {id_jugador}")
+
+    def interesados(self, id_entidad):
+        """Jugadores a los que les interesa un jugador: él mismo y quienes lo tienen en su zona"""
+        return [jugador for id_jugador, jugador in self.jugadores.items()
+                if id_jugador == id_entidad or id_entidad in jugador["interes"]]
+
+    def minions_visibles(self, jugador, seq, vistas):
+        """Minions dentro de la zona del jugador; se recuerdan como base de sus próximos deltas.
+
+        `vistas` cachea la vista por máscara para que jugadores con la misma zona la compartan.
+        """
+        mascara = self.minions.mascara_rectangulo(*self.region_interes(jugador))
+        clave = "todos" if mascara.all() else mascara.tobytes()
+        if clave not in vistas:
+            vistas[clave] = self.minions.vista_completa(None if clave == "todos" else mascara)
+        enviados = jugador["minions_enviados"]
+        enviados[seq] = vistas[clave]
+        while len(enviados) > MINIONS_ENVIADOS:
+            enviados.popitem(last=False)
+        return vistas[clave]
+
+    def fase_difusion(self, dt):
+        """Fase 5 del tick: envía el estado a los clientes cada `intervalo_estado` segundos"""
+        if self.planificador.cada(self.intervalo_estado):
+            self.enviar_estado_juego()
+
+    def paso_tiempo_juego(self):
+        """Avanza un segundo de juego y genera oleadas cuando corresponde"""
+        with self.lock:
+            # Primera oleada a los 65 segundos (1:05), después cada `intervalo`
+            oleada = avanzar_reloj(self.estado_juego["oleadas"])
+            if oleada is not None:
+                self.generar_oleada("aliados")
+                self.generar_oleada("enemigos")
+                if self.grabador is not None:
+                    self.grabador.evento("nueva_oleada", oleada)
+                self.enviar_a_todos("nueva_oleada", oleada)
+
+    def fase_lockstep(self, dt):
+        """Único paso de una sala lockstep: avanza la simulación y reparte el marco del tick"""
+        with self.lock:
+            entradas = {}
+            for id_jugador, jugador in self.jugadores.items():
+                if jugador.get("entradas_lockstep"):
+                    entradas[id_jugador], jugador["entradas_lockstep"] = jugador["entradas_lockstep"], []
+            altas, self.altas_lockstep = self.altas_lockstep, {}
+            bajas, self.bajas_lockstep = self.bajas_lockstep, []
+            comandos, self.comandos_lockstep = self.comandos_lockstep, []
+            simulacion = self.simulacion
+            simulacion.paso(entradas, altas, bajas, comandos)
+            if self.grabador is not None:
+                # En el mismo orden en que los aplica la simulación
+                for id_jugador in bajas:
+                    self.grabador.baja(id_jugador)
+                for id_jugador, datos in sorted(altas.items()):
+                    self.grabador.alta(id_jugador, datos)
+                for comando in comandos:
+                    self.grabador.comando(comando)
+                for id_jugador in sorted(entradas):
+                    self.grabador.entrada(id_jugador, entradas[id_jugador])
+                for tipo, contenido in simulacion.eventos:
+                    self.grabador.evento(tipo, contenido)
+
+            # Posición y vida simuladas de vuelta en los datos de los jugadores
+            for id_jugador, datos in simulacion.jugadores.items():
+                jugador = self.jugadores.get(id_jugador)
+                if jugador is not None:
+                    jugador["pos"] = datos["pos"]
+                    jugador["vida"] = datos["vida"]
+                    self.actualizar_posicion_jugador(id_jugador, datos["pos"])
+            for tipo, contenido in simulacion.eventos:
+                if tipo == "jugador_dañado":
+                    print(f"Torre {contenido['torre_pos']} atacó a {contenido['id']} (Vida restante: {contenido['vida']})")
+
+            # Solo entradas y cambios de jugadores: el tamaño no depende de cuántos minions haya
+            self.enviar_a_todos("marco_lockstep", {
+                "tick": simulacion.tick,
+                "entradas": entradas,
+                "altas": altas,
+                "bajas": bajas,
+                "comandos": comandos,
+                "huella": simulacion.huella()
+            })
+
+    def fase_grabacion(self, dt):
+        """Última fase del tick: cierra el tick en el diario y cada pocos segundos añade una foto"""
+        tick = self.planificador.tick
+        self.grabador.fin_tick(tick)
+        if self.grabador.toca_foto(tick):
+            self.grabador.foto(tick, *self.estado_simulacion())
+
+    def simulacion_actual(self):
+        """La sala como SimulacionLockstep (en el modo normal, una vista de su estado)"""
+        if self.simulacion is not None:
+            return self.simulacion
+        simulacion = SimulacionLockstep(self.estado_juego, self.minions, self.planificador.tasa,
+                                        tick=self.planificador.tick)
+        simulacion.jugadores = {id_jugador: {"pos": list(jugador["pos"]), "vida": jugador["vida"],
+                                             "velocidad": jugador["velocidad"]}
+                                for id_jugador, jugador in self.jugadores.items()}
+        return simulacion
+
+    def estado_simulacion(self):
+        """(huella, estado) de la sala como SimulacionLockstep, también en el modo normal"""
+        with self.lock:
+            simulacion = self.simulacion_actual()
+            return simulacion.huella(), simulacion.estado()
+
+    def estado_respaldo(self):
+        """Estado para un punto de control: sin jugadores y con los minions en columnas (exportar)"""
+        with self.lock:
+            estado = self.simulacion_actual().estado(con_minions=False)
+            del estado["jugadores"]
+            estado["minions"] = self.minions.exportar()
+            return estado
+
+    def restaurar(self, estado):
+        """Sigue la partida desde un estado de estado_respaldo(), sin jugadores (volverán a entrar)"""
+        with self.lock:
+            simulacion = SimulacionLockstep.desde_estado({**estado, "tasa": self.planificador.tasa, "minions": {}},
+                                                         self.estado_juego, self.minions)
+            self.minions.importar(estado["minions"])
+            self.planificador.tick = simulacion.tick  # Oleadas y difusión siguen en el mismo compás
+            if self.lockstep:
+                self.simulacion = simulacion
+
+    def cerrar(self):
+        """La sala se elimina: se cierra su diario"""
+        if self.grabador is not None:
+            self.grabador.cerrar()
+
+    def resincronizar(self, id_jugador, mensaje):
+        """Un cliente lockstep se desincronizó (o perdió un marco): recibe el estado completo"""
+        with self.lock:
+            jugador = self.jugadores.get(id_jugador)
+            if jugador is None or not self.lockstep:
+                return
+            self.desincronizaciones += 1
+            print(f"Jugador {id_jugador} desincronizado en el tick {mensaje.get('tick')} "
+                  f"(huella {mensaje.get('huella')})")
+            self.servidor.enviar_mensaje(jugador["socket"], "estado_lockstep", self.simulacion.estado())
+
+    def paso_minions(self, dt=PASO_VELOCIDAD_MINIONS):
+        """Mueve los minions lo que recorren en `dt` segundos por su ruta (en lote)"""
+        with self.lock:
+            # Los que llegan a la base enemiga desaparecen
+            # Aquí podrías añadir lógica para dañar el nexo
+            self.minions.mover(dt / PASO_VELOCIDAD_MINIONS)
+
+    def paso_estructuras(self, dt=1):
+        """Resuelve los ataques de las torres a los jugadores en rango"""
+        with self.lock:
+            # 1. Verificar ataques de torres a jugadores
+            for equipo_torre in ["aliadas", "enemigas"]:
+                for torre in self.estado_juego["estructuras"]["torres"][equipo_torre]:
+                    if not torre["destruida"]:
+                        # Torre puede atacar si ha pasado el tiempo de enfriamiento
+                        puede_atacar = (self.estado_juego["oleadas"]["tiempo_juego"] - torre["ultimo_ataque"] >= 10)
+                        torre["puede_atacar"] = puede_atacar
+
+                        if not puede_atacar:
+                            continue
+
+                        # Buscar jugadores en rango (solo las celdas cercanas a la torre), por orden
+                        # de id como en la simulación lockstep para que las repeticiones coincidan
+                        for jugador_id in sorted(self.indice_jugadores.en_rango(torre["pos"][0], torre["pos"][1],
+                                                                               torre["rango"])):
+                            jugador = self.jugadores.get(jugador_id)
+                            if jugador is not None:
+                                # Aplicar daño al jugador
+                                jugador["vida"] -= torre["daño"]
+                                torre["ultimo_ataque"] = self.estado_juego["oleadas"]["tiempo_juego"]
+                                print(f"Torre {torre['pos']} atacó a {jugador_id} (Vida restante: {jugador['vida']})")
+                                if self.grabador is not None:
+                                    self.grabador.evento("jugador_dañado", {"id": jugador_id, "vida": jugador["vida"],
+                                                                             "torre_pos": torre["pos"]})
+                                # Enviar actualización a quienes ven al jugador
+                                self.enviar_a_interesados(jugador_id, "jugador_dañado", {
+                                    "id": jugador_id,
+                                    "vida": jugador["vida"],
+                                    "torre_pos": torre["pos"]
+                                })
+                                break  # Ataca a un jugador a la vez
+
+    def generar_oleada(self, equipo):
+        """Genera una oleada de minions para un equipo (rutas y estadísticas de mapa.json)"""
+        self.minions.agregar_varios(MAPA.oleada(equipo))
+
+    def actualizar_posicion_jugador(self, id_jugador, pos):
+        """Mueve al jugador en el índice espacial (solo cambia de celda si cruza un borde)"""
+        self.indice_jugadores.actualizar(id_jugador, pos[0], pos[1])
+
+    def obtener_datos_jugadores(self):
+        """Devuelve los datos de todos los jugadores para sincronización"""
+        datos = {}
+        for id_jugador, jugador in self.jugadores.items():
+            datos[id_jugador] = {
+                "nombre": jugador["nombre"],
+                "personaje": jugador["personaje"],
+                "pos": jugador["pos"],
+                "vida": jugador["vida"],
+                "vida_max": jugador["vida_max"],
+                "velocidad": jugador["velocidad"],
+                "daño": jugador["daño"],
+                "nivel": jugador["nivel"],
+                "experiencia": jugador["experiencia"],
+                "reduccion_daño": jugador["reduccion_daño"]
+            }
+        return datos
+
+    def registrar_instantanea(self):
+        """Guarda estado_juego como instantánea (sin minions: cada jugador recibe los de su zona)"""
+        with self.lock:
+            return self.historial.registrar(self.estado_juego)
+
+    def enviar_estado_juego(self):
+        """Registra una instantánea y envía a cada cliente el delta desde la que confirmó"""
+        with self.lock:
+            seq = self.registrar_instantanea()
+            vistas = {}  # máscara de zona -> minions visibles
+            cargas = {}  # (base, minions, minions base) -> carga: se comparte la serialización
+            for id_jugador, datos in self.jugadores.items():
+                base = datos.get("ack_estado")
+                base_minions = datos["minions_enviados"].get(base)
+                if (self.historial.obtener(base) is None or base_minions is None) and not self.toca_keyframe(datos):
+                    continue  # Sin base confirmada: un keyframe cada INTERVALO_KEYFRAME, no en cada difusión
+                minions = self.minions_visibles(datos, seq, vistas)
+                clave = (base, id(minions), id(base_minions))
+                if clave not in cargas:
+                    cargas[clave] = self.codificar_instantanea(seq, base, minions, base_minions)
+                try:
+                    self.servidor.enviar_carga(datos["socket"], cargas[clave], ESTADO)
+                except:
+                    print(f"Error enviando estado a jugador {id_jugador}")
+
+    def toca_keyframe(self, jugador):
+        """Si a un jugador sin base se le puede enviar ya otro keyframe (y lo anota)"""
+        tick = self.planificador.tick
+        ultimo = jugador.get("tick_keyframe")
+        if ultimo is not None and tick - ultimo < INTERVALO_KEYFRAME * self.planificador.tasa:
+            return False
+        jugador["tick_keyframe"] = tick
+        return True
+
+    def codificar_instantanea(self, seq, base, minions, base_minions=None):
+        """Serializa la instantánea `seq` como delta sobre `base`, o completa si no hay base.
+
+        Los minions van aparte porque dependen de la zona de interés de cada jugador.
+        """
+        actual = self.historial.obtener(seq)
+        anterior = self.historial.obtener(base)
+        if anterior is None or base_minions is None:
+            # Cliente nuevo, sin confirmaciones o desincronizado: keyframe
+            return CargaMensaje("estado_juego", {"seq": seq, **actual, "minions": minions})
+        delta = calcular_delta(anterior, actual)
+        # En binario los minions de la zona van completos: la tabla empaquetada ocupa
+        # menos que el delta en JSON y el cliente no necesita la base
+        return CargaMensaje("estado_delta", lambda: {
+            "seq": seq,
+            "base": base,
+            "delta": delta,
+            "minions": calcular_delta(base_minions, minions)
+        }, alternativas={FORMATO_BINARIO: {
+            "seq": seq,
+            "base": base,
+            "delta": delta,
+            "minions_completos": minions
+        }})
+
+    def enviar_a_interesados(self, id_entidad, tipo, contenido):
+        """Envía un mensaje solo a los jugadores que tienen a `id_entidad` en su zona de interés"""
+        with self.lock:
+            carga = CargaMensaje(tipo, contenido)  # Una serialización por formato
+            clase = CLASES_MENSAJE.get(tipo, EVENTO)
+            for datos in self.interesados(id_entidad):
+                try:
+                    self.servidor.enviar_carga(datos["socket"], carga, clase)
+                except:
+                    print(f"Error enviando mensaje a jugador {id_entidad}")
+
+    def enviar_a_todos(self, tipo, contenido):
+        """Envía un mensaje a todos los clientes conectados"""
+        with self.lock:
+            carga = CargaMensaje(tipo, contenido)  # Una serialización por formato
+            clase = CLASES_MENSAJE.get(tipo, EVENTO)
+            for id_jugador, datos in self.jugadores.items():
+                try:
+                    self.servidor.enviar_carga(datos["socket"], carga, clase)
+                except:
+                    print(f"Error enviando mensaje a jugador {id_jugador}")
+
+    def enviar_a_todos_excepto(self, id_excluido, tipo, contenido):
+        """Envía un mensaje a todos los clientes excepto al especificado"""
+        with self.lock:
+            carga = CargaMensaje(tipo, contenido)  # Una serialización por formato
+            clase = CLASES_MENSAJE.get(tipo, EVENTO)
+            for id_jugador, datos in self.jugadores.items():
+                if id_jugador != id_excluido:
+                    try:
+                        self.servidor.enviar_carga(datos["socket"], carga, clase)
+                    except:
+                        print(f"Error enviando mensaje a jugador {id_jugador}")
+
+
+class GestorSalas:
+    """Crea y busca salas, y las avanza todas desde un único bucle de ticks"""
+
+    def __init__(self, servidor, tasa_tick=10, intervalo_estado=0.1, tasa_posiciones=None, max_salas=500,
+                 lockstep=False, directorio_grabaciones=None, intervalo_fotos=10, estados=None):
+        self.servidor = servidor
+        self.lockstep = lockstep
+        self.directorio_grabaciones = directorio_grabaciones  # None = no se graban las partidas
+        self.intervalo_fotos = intervalo_fotos
+        self.tasa_tick = tasa_tick
+        self.intervalo_estado = intervalo_estado
+        self.tasa_posiciones = tasa_posiciones
+        self.max_salas = max_salas
+        self.salas = {}  # id -> Sala
+        self.contador = 0
+        # Salas recuperadas de un punto de control (id -> estado); la sala por defecto siempre existe
+        estados = estados or {}
+        self.crear(SALA_POR_DEFECTO, estados.get(SALA_POR_DEFECTO))
+        for id_sala, estado in estados.items():
+            if id_sala != SALA_POR_DEFECTO:
+                self.crear(id_sala, estado)
+
+    def __len__(self):
+        return len(self.salas)
+
+    def crear(self, id_sala=None, estado=None):
+        """Crea una sala (con el nombre pedido o uno generado) y la devuelve"""
+        with self.servidor.lock:
+            if len(self.salas) >= self.max_salas:
+                raise ErrorSala(f"Se alcanzó el máximo de {self.max_salas} salas")
+            if id_sala is None:
+                while True:
+                    self.contador += 1
+                    id_sala = f"sala{self.contador}"
+                    if id_sala not in self.salas:
+                        break
+            else:
+                id_sala = str(id_sala)[:32]
+                if not id_sala:
+                    raise ErrorSala("El nombre de la sala no puede estar vacío")
+                if id_sala in self.salas:
+                    raise ErrorSala(f"La sala {id_sala} ya existe")
+            grabador = None
+            if self.directorio_grabaciones:
+                grabador = Grabador(ruta_grabacion(self.directorio_grabaciones, id_sala), self.tasa_tick,
+                                    self.intervalo_fotos, id_sala)
+            sala = Sala(id_sala, self.servidor, self.tasa_tick, self.intervalo_estado,
+                        self.tasa_posiciones, self.lockstep, grabador, estado)
+            self.salas[sala.id] = sala
+            return sala
+
+    def obtener(self, id_sala):
+        return self.salas.get(id_sala)
+
+    def eliminar(self, id_sala):
+        """Elimina una sala vacía (la sala por defecto no se elimina)"""
+        with self.servidor.lock:
+            sala = self.salas.get(id_sala)
+            if sala is None or sala.activa or id_sala == SALA_POR_DEFECTO:
+                return False
+            del self.salas[id_sala]
+            sala.cerrar()
+            return True
+
+    def paso(self, dt):
+        """Un tick de todas las salas activas; las vacías están suspendidas"""
+        for sala in list(self.salas.values()):
+            if sala.activa:
+                sala.planificador.ejecutar_tick()
+
+    def estados(self):
+        """Estado de cada sala para un punto de control (ver Sala.estado_respaldo)"""
+        return {sala.id: sala.estado_respaldo() for sala in self.salas.values()}
+
+    def resumen(self):
+        """Lista de salas para los clientes"""
+        return [{"sala": sala.id, "jugadores": len(sala.jugadores)} for sala in self.salas.values()]
+
+    def estadisticas(self):
+        """Coste de tick de cada sala (total y por fase) para las métricas del servidor"""
+        return {
+            sala.id: {
+                "jugadores": len(sala.jugadores),
+                "activa": sala.activa,
+                "movimientos_rechazados": sala.movimientos_rechazados,
+                "simulacion": sala.planificador.estadisticas(),
+                **({"lockstep": {"tick": sala.simulacion.tick, "desincronizaciones": sala.desincronizaciones}}
+                   if sala.lockstep else {}),
+                **({"grabacion": sala.grabador.estadisticas()} if sala.grabador is not None else {})
+            }
+            for sala in self.salas.values()
+        }
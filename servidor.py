@@ -1,470 +1,673 @@
 # servidor.py - Servidor para el juego multijugador (versión completa mejorada)
+import argparse
+import asyncio
 import socket
 import json
+import secrets
+import struct
 import threading
 import time
 from datetime import datetime
+from colas import ColaSalida, DESCARTAR_POSICIONES, ESTADO, EVENTO, POLITICAS, POSICION
+from mapa import MAPA
+from planificador import EstadisticasFase, PlanificadorTicks
+from respaldo import ArchivoRespaldo, ErrorRespaldo, desempaquetar, empaquetar
+from protocolo import (CABECERA_DATAGRAMA, CargaMensaje, DecodificadorTramas, ErrorProtocolo,
+                       FORMATO_JSON, FORMATOS, MODO_TRAMAS, TAMANO_MAXIMO_DATAGRAMA, codificar_mensaje,
+                       decodificar_mensaje, desempaquetar_datagrama, empaquetar_datagrama, empaquetar_trama)
+from salas import CLASES_MENSAJE, DISTANCIA_MAX_CARRIL, ErrorSala, GestorSalas, SALA_POR_DEFECTO
+
+MOTORES = ("threads", "asyncio")
+
+# Canal UDP: solo datos en los que vale el último valor (se pueden perder o llegar tarde)
+CLASES_UDP = (POSICION, ESTADO)
+MENSAJES_UDP_ENTRANTES = ("movimiento", "entrada")
+ESPERA_ESCRITOR = 1.0  # Segundos que se espera al escritor para enviar lo pendiente antes de cerrar
+
+# Estadísticas de cada personaje: las decide el servidor, no el mensaje nuevo_jugador
+ESTADISTICAS_BASE = {"vida_max": 100, "velocidad": 5, "daño": 20, "reduccion_daño": 0}
+PERSONAJES = {1: ESTADISTICAS_BASE, 2: ESTADISTICAS_BASE}
+POS_INICIAL = [400, 500]  # En el carril azul, como la posición inicial del cliente
+
+
+def posicion_inicial(pos):
+    """La posición pedida si está en un carril; si no, POS_INICIAL"""
+    try:
+        x, y = float(pos[0]), float(pos[1])
+    except (TypeError, ValueError, IndexError):
+        return list(POS_INICIAL)
+    if MAPA.distancia_carriles((x, y)) > DISTANCIA_MAX_CARRIL:
+        return list(POS_INICIAL)
+    return [x, y]
+
+
+class ProtocoloUDP(asyncio.DatagramProtocol):
+    """Recibe los datagramas del canal UDP en el motor asyncio"""
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+
+    def datagram_received(self, datos, direccion):
+        self.servidor.procesar_datagrama(datos, direccion)
+
 
 class Servidor:
-    def __init__(self, host='localhost', port=5555):
+    def __init__(self, host='localhost', port=5555, engine="threads",
+                 politica_cola=DESCARTAR_POSICIONES, capacidad_cola=256,
+                 tasa_tick=10, intervalo_estado=0.1, tasa_posiciones=None, udp=False,
+                 lockstep=False, directorio_grabaciones=None, intervalo_fotos=10,
+                 archivo_respaldo=None, intervalo_respaldo=1.0, capacidad_respaldo=8 * 1024 * 1024):
+        if engine not in MOTORES:
+            raise ValueError(f"Motor desconocido: {engine} (opciones: {', '.join(MOTORES)})")
         self.host = host
         self.port = port
+        self.engine = engine
+        self.politica_cola = politica_cola
+        self.capacidad_cola = capacidad_cola
         self.server = None
         self.clientes = {}
-        self.lock = threading.Lock()
-        
-        # Estado completo del juego compartido
-        self.estado_juego = {
-            "mapa": {
-                "rutas": [
-                    # Ruta azul (inferior)
-                    {"color": [0, 0, 255], "puntos": [(49, 500), (751, 500)]},
-                    # Ruta roja (superior)
-                    {"color": [255, 0, 0], "puntos": [(49, 100), (751, 100)]},
-                    # Ruta izquierda (vertical)
-                    {"color": [255, 0, 0], "puntos": [(49, 100), (49, 500)]},
-                    # Ruta derecha (vertical)
-                    {"color": [0, 0, 255], "puntos": [(751, 100), (751, 500)]},
-                    # Ruta diagonal amarilla
-                    {"color": [255, 255, 0], "puntos": [(49, 500), (751, 100)]}
-                ],
-                "scroll_y": 0
-            },
-            "estructuras": {
-                "torres": {
-                    "aliadas": [
-                        {"pos": [200, 480], "vida": 2000, "vida_max": 2000, "daño": 15, "daño_base": 15, 
-                         "reduccion_daño": 20, "rango": 200, "ruta": 1, "orden": 3, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [400, 480], "vida": 2000, "vida_max": 2000, "daño": 10, "daño_base": 10, 
-                         "reduccion_daño": 10, "rango": 200, "ruta": 1, "orden": 2, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [600, 480], "vida": 2000, "vida_max": 2000, "daño": 5, "daño_base": 5, 
-                         "reduccion_daño": 0, "rango": 200, "ruta": 1, "orden": 1, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [50, 170], "vida": 2000, "vida_max": 2000, "daño": 5, "daño_base": 5, 
-                         "reduccion_daño": 0, "rango": 200, "ruta": 2, "orden": 1, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [50, 300], "vida": 2000, "vida_max": 2000, "daño": 10, "daño_base": 10, 
-                         "reduccion_daño": 10, "rango": 200, "ruta": 2, "orden": 2, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [50, 400], "vida": 2000, "vida_max": 2000, "daño": 15, "daño_base": 15, 
-                         "reduccion_daño": 20, "rango": 200, "ruta": 2, "orden": 3, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [160, 415], "vida": 2000, "vida_max": 2000, "daño": 15, "daño_base": 15, 
-                         "reduccion_daño": 20, "rango": 200, "ruta": 4, "orden": 3, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [275, 355], "vida": 2000, "vida_max": 2000, "daño": 10, "daño_base": 10, 
-                         "reduccion_daño": 10, "rango": 200, "ruta": 4, "orden": 2, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [375, 300], "vida": 2000, "vida_max": 2000, "daño": 5, "daño_base": 5, 
-                         "reduccion_daño": 0, "rango": 200, "ruta": 4, "orden": 1, "destruida": False, "ultimo_ataque": 0}
-                    ],
-                    "enemigas": [
-                        {"pos": [200, 80], "vida": 2000, "vida_max": 2000, "daño": 5, "daño_base": 5, 
-                         "reduccion_daño": 0, "rango": 200, "ruta": 0, "orden": 1, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [400, 80], "vida": 2000, "vida_max": 2000, "daño": 10, "daño_base": 10, 
-                         "reduccion_daño": 10, "rango": 200, "ruta": 0, "orden": 2, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [600, 80], "vida": 2000, "vida_max": 2000, "daño": 15, "daño_base": 15, 
-                         "reduccion_daño": 20, "rango": 200, "ruta": 0, "orden": 3, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [750, 170], "vida": 2000, "vida_max": 2000, "daño": 15, "daño_base": 15, 
-                         "reduccion_daño": 20, "rango": 200, "ruta": 3, "orden": 3, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [750, 300], "vida": 2000, "vida_max": 2000, "daño": 10, "daño_base": 10, 
-                         "reduccion_daño": 10, "rango": 200, "ruta": 3, "orden": 2, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [750, 400], "vida": 2000, "vida_max": 2000, "daño": 5, "daño_base": 5, 
-                         "reduccion_daño": 0, "rango": 200, "ruta": 3, "orden": 1, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [495, 230], "vida": 2000, "vida_max": 2000, "daño": 5, "daño_base": 5, 
-                         "reduccion_daño": 0, "rango": 200, "ruta": 0, "orden": 1, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [575, 180], "vida": 2000, "vida_max": 2000, "daño": 10, "daño_base": 10, 
-                         "reduccion_daño": 10, "rango": 200, "ruta": 0, "orden": 2, "destruida": False, "ultimo_ataque": 0},
-                        {"pos": [655, 130], "vida": 2000, "vida_max": 2000, "daño": 15, "daño_base": 15, 
-                         "reduccion_daño": 20, "rango": 200, "ruta": 0, "orden": 3, "destruida": False, "ultimo_ataque": 0}
-                    ]
-                },
-                "inhibidores": {
-                    "aliados": [
-                        {"pos": [150, 480], "vida": 2500, "vida_max": 2500, "daño": 0, "rango": 0, 
-                         "ruta": 1, "destruido": False, "tiempo_reconstruccion": 0},
-                        {"pos": [50, 435], "vida": 2500, "vida_max": 2500, "daño": 0, "rango": 0, 
-                         "ruta": 2, "destruido": False, "tiempo_reconstruccion": 0},
-                        {"pos": [140, 435], "vida": 2500, "vida_max": 2500, "daño": 0, "rango": 0, 
-                         "ruta": 4, "destruido": False, "tiempo_reconstruccion": 0}
-                    ],
-                    "enemigos": [
-                        {"pos": [685, 120], "vida": 2500, "vida_max": 2500, "daño": 0, "rango": 0, 
-                         "ruta": 0, "destruido": False, "tiempo_reconstruccion": 0},
-                        {"pos": [750, 145], "vida": 2500, "vida_max": 2500, "daño": 0, "rango": 0, 
-                         "ruta": 3, "destruido": False, "tiempo_reconstruccion": 0},
-                        {"pos": [655, 80], "vida": 2500, "vida_max": 2500, "daño": 0, "rango": 0, 
-                         "ruta": 4, "destruido": False, "tiempo_reconstruccion": 0}
-                    ]
-                },
-                "nexos": {
-                    "aliados": [
-                        {"pos": [40, 490], "vida": 5000, "vida_max": 5000, "daño": 30, "rango": 250, 
-                         "puede_atacar": False, "destruido": False}
-                    ],
-                    "enemigos": [
-                        {"pos": [750, 70], "vida": 5000, "vida_max": 5000, "daño": 30, "rango": 250, 
-                         "puede_atacar": False, "destruido": False}
-                    ]
-                }
-            },
-            "minions": {
-                "aliados": [],
-                "enemigos": []
-            },
-            "oleadas": {
-                "tiempo_ultima_oleada": 0,
-                "intervalo": 30,
-                "contador_oleadas": 0,
-                "tiempo_juego": 0,
-                "primer_oleada": False
-            }
-        }
+        self.modos_conexion = {}  # conexión -> formato de tramas que usa ese cliente
+        self.formatos = {}  # conexión -> formato de carga negociado (JSON o binario)
+        self.colas = {}  # conexión -> ColaSalida vaciada por el escritor de ese cliente
+
+        # Canal UDP opcional (mismo puerto que TCP), negociado en conectar
+        self.udp = udp and not lockstep  # En lockstep no se puede perder ningún marco
+        self.socket_udp = None
+        self.transporte_udp = None
+        self.tokens_udp = {}  # token -> id del jugador (hasta que llega su hola_udp)
+        self.canales_udp = {}  # conexión TCP -> {"id", "direccion", "seq", "seq_recibido"}
+        self.conexiones_udp = {}  # dirección UDP -> conexión TCP
+        self.datagramas_enviados = 0
+        self.bytes_udp_enviados = 0
+        # RLock: los pasos de simulación envían mensajes mientras tienen el lock tomado
+        self.lock = threading.RLock()
+        self.contador_ids = 0  # IDs de jugador únicos en todo el servidor
+
+        # Puntos de control: si el archivo tiene uno, las partidas siguen desde él
+        self.respaldo = None
+        self.intervalo_respaldo = intervalo_respaldo
+        self.respaldo_pendiente = None  # Última foto tomada en el tick, a la espera del escritor
+        self.hay_respaldo = threading.Event()
+        self.lock_respaldo = threading.Lock()  # Un solo escritor a la vez en el archivo
+        self.estadisticas_escritura_respaldo = EstadisticasFase()
+        estados = None
+        inicio = time.perf_counter()
+        if archivo_respaldo:
+            self.respaldo = ArchivoRespaldo(archivo_respaldo, capacidad_respaldo)
+            datos = self.respaldo.cargar()
+            if datos is not None:
+                try:
+                    restaurado, anexos = desempaquetar(datos)
+                    estados = restaurado["salas"]
+                    for estado in estados.values():
+                        estado["minions"]["datos"] = anexos[estado["minions"]["datos"]]
+                    self.contador_ids = restaurado["contador_ids"]
+                except (ValueError, KeyError, IndexError, struct.error) as e:
+                    print(f"No se pudo leer el punto de control de {archivo_respaldo}: {e}")
+                    estados = None
+
+        # Partidas independientes; un único bucle de ticks avanza todas las salas activas
+        self.salas = GestorSalas(self, tasa_tick=tasa_tick, intervalo_estado=intervalo_estado,
+                                 tasa_posiciones=tasa_posiciones, lockstep=lockstep,
+                                 directorio_grabaciones=directorio_grabaciones, intervalo_fotos=intervalo_fotos,
+                                 estados=estados)
+        if estados is not None:
+            print(f"Partidas restauradas de {archivo_respaldo}: {len(estados)} salas "
+                  f"(punto de control {self.respaldo.secuencia}, {(time.perf_counter() - inicio) * 1000:.1f} ms)")
+        self.planificador = PlanificadorTicks(tasa_tick, lock=self.lock)
+        self.planificador.agregar_fase("salas", self.salas.paso)
+        if self.respaldo is not None:
+            self.planificador.agregar_fase("respaldo", self.fase_respaldo)
+            threading.Thread(target=self.escritor_respaldo, daemon=True).start()
 
-        # Iniciar hilos de actualización
         self.iniciar_servidor()
-        threading.Thread(target=self.actualizar_tiempo_juego, daemon=True).start()
-        threading.Thread(target=self.actualizar_minions, daemon=True).start()
-        threading.Thread(target=self.actualizar_estructuras, daemon=True).start()
 
     def iniciar_servidor(self):
-        """Inicia el servidor y acepta conexiones entrantes"""
+        """Inicia el servidor con el motor elegido (hilos o asyncio)"""
+        if self.engine == "asyncio":
+            asyncio.run(self.iniciar_servidor_asyncio())
+        else:
+            self.iniciar_servidor_hilos()
+
+    def iniciar_servidor_hilos(self):
+        """Inicia el servidor y acepta conexiones entrantes (un hilo por cliente)"""
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Igual que asyncio
         self.server.bind((self.host, self.port))
         self.server.listen(5)
         print(f"Servidor iniciado en {self.host}:{self.port}")
 
+        if self.udp:
+            self.socket_udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket_udp.bind((self.host, self.port))
+            threading.Thread(target=self.escuchar_udp, daemon=True).start()
+            print(f"Canal UDP en {self.host}:{self.port}")
+
+        # Iniciar la simulación antes del bucle de aceptación
+        self.planificador.iniciar_hilo()
+
         # Aceptar conexiones entrantes
         while True:
             cliente, direccion = self.server.accept()
             print(f"Nueva conexión desde {direccion}")
             threading.Thread(target=self.manejar_cliente, args=(cliente,), daemon=True).start()
 
-    def actualizar_tiempo_juego(self):
-        """Actualiza el tiempo del juego y gestiona las oleadas"""
-        while True:
-            time.sleep(1)  # Actualizar cada segundo
-            with self.lock:
-                self.estado_juego["oleadas"]["tiempo_juego"] += 1
-                tiempo = self.estado_juego["oleadas"]["tiempo_juego"]
-
-                # Primera oleada a los 65 segundos (1:05)
-                if not self.estado_juego["oleadas"]["primer_oleada"] and tiempo >= 65:
-                    self.estado_juego["oleadas"]["primer_oleada"] = True
-                    self.estado_juego["oleadas"]["tiempo_ultima_oleada"] = tiempo
-                    self.estado_juego["oleadas"]["contador_oleadas"] += 1
-                    self.generar_oleada("aliados")
-                    self.generar_oleada("enemigos")
-                    self.enviar_a_todos("nueva_oleada", {
-                        "contador": self.estado_juego["oleadas"]["contador_oleadas"],
-                        "tiempo": tiempo,
-                        "limpiar": True  # Indicar que se deben limpiar minions anteriores
-                    })
-                
-                # Oleadas posteriores cada 30 segundos
-                tiempo_desde_ultima = tiempo - self.estado_juego["oleadas"]["tiempo_ultima_oleada"]
-                if (tiempo_desde_ultima >= self.estado_juego["oleadas"]["intervalo"] and 
-                    self.estado_juego["oleadas"]["primer_oleada"]):
-                    self.estado_juego["oleadas"]["tiempo_ultima_oleada"] = tiempo
-                    self.estado_juego["oleadas"]["contador_oleadas"] += 1
-                    self.generar_oleada("aliados")
-                    self.generar_oleada("enemigos")
-                    self.enviar_a_todos("nueva_oleada", {
-                        "contador": self.estado_juego["oleadas"]["contador_oleadas"],
-                        "tiempo": tiempo,
-                        "limpiar": False  # No limpiar minions entre oleadas
-                    })
-
-                # Enviar estado completo cada 2 segundos
-                if tiempo % 2 == 0:
-                    self.enviar_a_todos("estado_juego", self.estado_juego)
+    async def iniciar_servidor_asyncio(self):
+        """Inicia el servidor con asyncio: conexiones y simulación en el mismo bucle de eventos"""
+        self.server = await asyncio.start_server(self.manejar_cliente_asyncio, self.host, self.port)
+        print(f"Servidor (asyncio) iniciado en {self.host}:{self.port}")
 
-    def actualizar_minions(self):
-        """Actualiza el movimiento y estado de los minions"""
-        while True:
-            time.sleep(0.1)  # Actualizar 10 veces por segundo
-            with self.lock:
-                for equipo in ["aliados", "enemigos"]:
-                    for minion in self.estado_juego["minions"][equipo][:]:
-                        # Actualizar posición
-                        puntos_ruta = minion["puntos_ruta"]
-                        indice_punto = minion["indice_punto_actual"]
-
-                        if indice_punto >= len(puntos_ruta):
-                            destino = minion["destino"]
-                        else:
-                            destino = puntos_ruta[indice_punto]
-
-                        dx = destino[0] - minion["pos"][0]
-                        dy = destino[1] - minion["pos"][1]
-                        distancia = (dx**2 + dy**2)**0.5
+        if self.udp:
+            self.transporte_udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: ProtocoloUDP(self), local_addr=(self.host, self.port))
+            print(f"Canal UDP en {self.host}:{self.port}")
 
-                        if distancia > 5:
-                            minion["pos"][0] += (dx / distancia) * minion["velocidad"]
-                            minion["pos"][1] += (dy / distancia) * minion["velocidad"]
-                        else:
-                            minion["indice_punto_actual"] += 1
+        simulacion = asyncio.create_task(self.planificador.ejecutar_asyncio())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            simulacion.cancel()
 
-                        # Verificar si llegó a la base enemiga
-                        if indice_punto >= len(puntos_ruta):
-                            distancia_final = ((minion["pos"][0] - minion["destino"][0])**2 + 
-                                           (minion["pos"][1] - minion["destino"][1])**2)**0.5
-                            if distancia_final < 10:
-                                self.estado_juego["minions"][equipo].remove(minion)
-                                # Aquí podrías añadir lógica para dañar el nexo
+    def fase_respaldo(self, dt):
+        """Cada `intervalo_respaldo` segundos toma la foto del estado; la escribe el hilo escritor_respaldo"""
+        if self.planificador.cada(self.intervalo_respaldo):
+            self.respaldo_pendiente = self.foto_respaldo()  # Si el escritor va atrasado, se queda la última
+            self.hay_respaldo.set()
 
-    def actualizar_estructuras(self):
+    def escritor_respaldo(self):
+        """Escribe las fotos pendientes fuera del lock: un disco lento no frena los ticks"""
         while True:
-            time.sleep(1)  # Actualizar cada segundo
-            with self.lock:
-                # 1. Verificar ataques de torres a jugadores
-                for equipo_torre in ["aliadas", "enemigas"]:
-                    for torre in self.estado_juego["estructuras"]["torres"][equipo_torre]:
-                        if not torre["destruida"]:
-                            # Torre puede atacar si ha pasado el tiempo de enfriamiento
-                            puede_atacar = (self.estado_juego["oleadas"]["tiempo_juego"] - torre["ultimo_ataque"] >= 10)
-                            torre["puede_atacar"] = puede_atacar
-
-                            # Buscar jugadores en rango
-                            for jugador_id, jugador in self.clientes.items():
-                                distancia = ((jugador["pos"][0] - torre["pos"][0])**2 + \
-                                            (jugador["pos"][1] - torre["pos"][1])**2)
-                                distancia = distancia**0.5
-
-                                if distancia <= torre["rango"] and puede_atacar:
-                                    # Aplicar daño al jugador
-                                    jugador["vida"] -= torre["daño"]
-                                    torre["ultimo_ataque"] = self.estado_juego["oleadas"]["tiempo_juego"]
-                                    print(f"Torre {torre['pos']} atacó a {jugador_id} (Vida restante: {jugador['vida']})")
-                                    # Enviar actualización a todos los clientes
-                                    self.enviar_a_todos("jugador_dañado", {
-                                        "id": jugador_id,
-                                        "vida": jugador["vida"],
-                                        "torre_pos": torre["pos"]
-                                    })
-                                    break  # Ataca a un jugador a la vez
-
-    def generar_oleada(self, equipo):
-        """Genera una oleada de minions para un equipo"""
-        tipos_minions = ["melee", "caster", "siege"]
-        punto_inicio = [40, 490] if equipo == "aliados" else [750, 70]
-        destino_final = [750, 70] if equipo == "aliados" else [40, 490]
-
-        for ruta_id in range(3):  # 3 rutas diferentes
-            for tipo in tipos_minions:
-                stats = {
-                    "melee": {"vida": 100, "daño": 15, "velocidad": 2, "rango_ataque": 40},
-                    "caster": {"vida": 60, "daño": 25, "velocidad": 1.8, "rango_ataque": 80},
-                    "siege": {"vida": 150, "daño": 40, "velocidad": 1.5, "rango_ataque": 120}
-                }.get(tipo, {"vida": 100, "daño": 15, "velocidad": 2, "rango_ataque": 40})
-
-                minion = {
-                    "tipo": tipo,
-                    "vida": stats["vida"],
-                    "vida_max": stats["vida"],
-                    "daño": stats["daño"],
-                    "velocidad": stats["velocidad"],
-                    "ruta_id": f"{equipo}_ruta_{ruta_id}",
-                    "pos": list(punto_inicio),
-                    "objetivo": None,
-                    "equipo": equipo,
-                    "rango_ataque": stats["rango_ataque"],
-                    "destino": destino_final,
-                    "puntos_ruta": self.generar_ruta_minion(equipo, ruta_id),
-                    "indice_punto_actual": 0,
-                    "reduccion_daño": 0
-                }
-                self.estado_juego["minions"][equipo].append(minion)
-
-    def generar_ruta_minion(self, equipo, ruta_id):
-        """Genera los puntos de ruta para los minions según el equipo y ruta"""
-        if equipo == "aliados":
-            if ruta_id == 0:  # Ruta inferior -> derecha -> base enemiga
-                return [(49, 500), (751, 500), (751, 100)]
-            elif ruta_id == 1:  # Ruta diagonal directa
-                return [(49, 500), (751, 100)]
-            else:  # Ruta izquierda -> superior -> base enemiga
-                return [(49, 500), (49, 100), (751, 100)]
-        else:  # enemigos
-            if ruta_id == 0:  # Ruta superior -> izquierda -> base aliada
-                return [(751, 100), (49, 100), (49, 500)]
-            elif ruta_id == 1:  # Ruta diagonal directa
-                return [(751, 100), (49, 500)]
-            else:  # Ruta derecha -> inferior -> base aliada
-                return [(751, 100), (751, 500), (49, 500)]
+            self.hay_respaldo.wait()
+            self.hay_respaldo.clear()
+            documento, self.respaldo_pendiente = self.respaldo_pendiente, None
+            if documento is not None:
+                self.escribir_respaldo(documento)
+
+    def foto_respaldo(self):
+        """Estado de todas las salas (sin jugadores); copias independientes de la partida"""
+        with self.lock:
+            return {"contador_ids": self.contador_ids, "salas": self.salas.estados()}
+
+    def escribir_respaldo(self, documento):
+        """Empaqueta una foto y la escribe en la copia libre del archivo (incluido el flush)"""
+        with self.lock_respaldo:
+            inicio = time.perf_counter()
+            anexos = []
+            for estado in documento["salas"].values():
+                anexos.append(estado["minions"]["datos"])
+                estado["minions"]["datos"] = len(anexos) - 1  # En el JSON, el número de anexo
+            try:
+                self.respaldo.guardar(empaquetar(documento, anexos))
+            except ErrorRespaldo as e:
+                print(f"Error guardando el punto de control: {e}")
+            self.estadisticas_escritura_respaldo.registrar(time.perf_counter() - inicio)
+
+    def guardar_respaldo(self):
+        """Punto de control inmediato: foto y escritura en este hilo"""
+        self.escribir_respaldo(self.foto_respaldo())
+
+    def metricas(self):
+        """Métricas del servidor: duración del tick, coste por sala y colas de salida"""
+        with self.lock:
+            return {
+                "conexiones": len(self.colas),
+                "simulacion": self.planificador.estadisticas(),
+                "salas": self.salas.estadisticas(),
+                "colas": self.estadisticas_colas(),
+                "udp": {
+                    "canales": len(self.canales_udp),
+                    "datagramas_enviados": self.datagramas_enviados,
+                    "bytes_enviados": self.bytes_udp_enviados
+                },
+                **({"respaldo": {**self.respaldo.estadisticas(),
+                                 "escritura": self.estadisticas_escritura_respaldo.resumen()}}
+                   if self.respaldo is not None else {})
+            }
 
     def manejar_cliente(self, cliente):
         """Maneja la comunicación con un cliente conectado"""
         id_cliente = None
+        decodificador = DecodificadorTramas()
+        cola = self.crear_cola(cliente)
+        escritor = threading.Thread(target=self.escritor_hilo, args=(cliente, cola), daemon=True)
+        escritor.start()
         try:
             while True:
-                datos = cliente.recv(4096).decode('utf-8')
+                datos = cliente.recv(65536)
                 if not datos:
                     break
 
-                # Procesar cada mensaje (pueden venir concatenados)
-                mensajes = datos.split('|')
-                for msg in mensajes:
-                    if not msg:
-                        continue
-
-                    try:
-                        mensaje = json.loads(msg)
-                        tipo = mensaje.get("type")
-
-                        if tipo == "conectar":
-                            # Asignar ID al cliente
-                            with self.lock:
-                                id_cliente = str(len(self.clientes) + 1)
-                                self.clientes[id_cliente] = {
-                                    "socket": cliente,
-                                    "nombre": f"Jugador{id_cliente}",
-                                    "personaje": None,
-                                    "pos": [400, 300],
-                                    "vida": 100,
-                                    "vida_max": 100,
-                                    "velocidad": 5,
-                                    "daño": 20,
-                                    "nivel": 1,
-                                    "experiencia": 0,
-                                    "reduccion_daño": 0
-                                }
-                            
-                            # Enviar bienvenida con ID asignado y estado completo
-                            self.enviar_mensaje(cliente, "bienvenida", {
-                                "id": id_cliente,
-                                "mensaje": "Bienvenido al servidor",
-                                "jugadores": self.obtener_datos_jugadores(),
-                                "estado_juego": self.estado_juego,
-                                "oleada": {
-                                    "contador": self.estado_juego["oleadas"]["contador_oleadas"],
-                                    "tiempo": self.estado_juego["oleadas"]["tiempo_juego"]
-                                }
-                            })
-
-                            # Notificar a otros jugadores
-                            self.enviar_a_todos_excepto(id_cliente, "nuevo_jugador", {
-                                "id": id_cliente,
-                                **self.clientes[id_cliente]
-                            })
-
-                        elif tipo == "nuevo_jugador" and id_cliente:
-                            with self.lock:
-                                if id_cliente in self.clientes:
-                                    self.clientes[id_cliente].update({
-                                        "nombre": mensaje.get("nombre", f"Jugador{id_cliente}")[:16],
-                                        "personaje": mensaje.get("personaje", 1),
-                                        "pos": mensaje.get("pos", [400, 300]),
-                                        "vida": mensaje.get("vida", 100),
-                                        "vida_max": mensaje.get("vida_max", 100),
-                                        "velocidad": mensaje.get("velocidad", 5),
-                                        "daño": mensaje.get("daño", 20),
-                                        "nivel": mensaje.get("nivel", 1),
-                                        "experiencia": mensaje.get("experiencia", 0),
-                                        "reduccion_daño": mensaje.get("reduccion_daño", 0)
-                                    })
-                            
-                            # Actualizar a todos los jugadores
-                            self.enviar_a_todos("jugadores", {
-                                "jugadores": self.obtener_datos_jugadores()
-                            })
-
-                        elif tipo == "movimiento" and id_cliente:
-                            with self.lock:
-                                if id_cliente in self.clientes:
-                                    self.clientes[id_cliente]["pos"] = mensaje.get("pos", [400, 300])
-                            
-                            # Enviar actualización de posición a todos excepto al emisor
-                            self.enviar_a_todos_excepto(id_cliente, "actualizacion_posicion", {
-                                "id": id_cliente,
-                                "pos": mensaje.get("pos", [400, 300])
-                            })
-
-                        elif tipo == "estructura_destruida" and id_cliente:
-                            with self.lock:
-                                tipo_estructura = mensaje.get("tipo")
-                                equipo = mensaje.get("equipo")
-                                indice = mensaje.get("indice")
-                                
-                                if (tipo_estructura in self.estado_juego["estructuras"] and 
-                                    equipo in self.estado_juego["estructuras"][tipo_estructura] and
-                                    indice < len(self.estado_juego["estructuras"][tipo_estructura][equipo])):
-                                    
-                                    self.estado_juego["estructuras"][tipo_estructura][equipo][indice]["destruida"] = True
-                                    self.enviar_a_todos("estructura_destruida", mensaje)
-
-                        elif tipo == "desconectar" and id_cliente:
-                            with self.lock:
-                                if id_cliente in self.clientes:
-                                    del self.clientes[id_cliente]
-                            
-                            # Notificar a otros jugadores
-                            self.enviar_a_todos("jugador_desconectado", {
-                                "id": id_cliente
-                            })
-                            break
-
-                    except json.JSONDecodeError:
-                        print("Error decodificando mensaje JSON")
-                    except Exception as e:
-                        print(f"Error procesando mensaje: {e}")
-
-        except ConnectionResetError:
+                # Un recv puede traer varias tramas o solo parte de una
+                cargas = decodificador.alimentar(datos)
+                self.modos_conexion[cliente] = decodificador.modo
+                for carga in cargas:
+                    id_cliente = self.procesar_mensaje(cliente, id_cliente, carga)
+
+        except (ConnectionError, OSError):
             print("Cliente desconectado abruptamente")
+        except ErrorProtocolo as e:
+            print(f"Error de protocolo: {e}")
         finally:
-            if id_cliente:
-                with self.lock:
-                    if id_cliente in self.clientes:
-                        del self.clientes[id_cliente]
-                
-                # Notificar a otros jugadores
-                self.enviar_a_todos("jugador_desconectado", {
-                    "id": id_cliente
-                })
+            self.quitar_cliente(id_cliente)
+            self.cerrar_cola(cliente)
+            # El socket se cierra cuando el escritor ha terminado con él (o se le corta si no avanza)
+            escritor.join(ESPERA_ESCRITOR)
+            if escritor.is_alive():
+                try:
+                    cliente.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                escritor.join()
             cliente.close()
 
-    def obtener_datos_jugadores(self):
-        """Devuelve los datos de todos los jugadores para sincronización"""
-        datos = {}
-        for id_jugador, jugador in self.clientes.items():
-            datos[id_jugador] = {
-                "nombre": jugador["nombre"],
-                "personaje": jugador["personaje"],
-                "pos": jugador["pos"],
-                "vida": jugador["vida"],
-                "vida_max": jugador["vida_max"],
-                "velocidad": jugador["velocidad"],
-                "daño": jugador["daño"],
-                "nivel": jugador["nivel"],
-                "experiencia": jugador["experiencia"],
-                "reduccion_daño": jugador["reduccion_daño"]
-            }
-        return datos
+    async def manejar_cliente_asyncio(self, reader, writer):
+        """Maneja la comunicación con un cliente conectado usando streams de asyncio"""
+        id_cliente = None
+        decodificador = DecodificadorTramas()
+        hay_datos = asyncio.Event()
+        cola = self.crear_cola(writer, al_encolar=hay_datos.set)
+        escritor = asyncio.create_task(self.escritor_asyncio(writer, cola, hay_datos))
+        try:
+            while True:
+                datos = await reader.read(65536)
+                if not datos:
+                    break
+
+                # Un read puede traer varias tramas o solo parte de una
+                cargas = decodificador.alimentar(datos)
+                self.modos_conexion[writer] = decodificador.modo
+                for carga in cargas:
+                    id_cliente = self.procesar_mensaje(writer, id_cliente, carga)
+
+        except (ConnectionError, OSError):
+            print("Cliente desconectado abruptamente")
+        except ErrorProtocolo as e:
+            print(f"Error de protocolo: {e}")
+        finally:
+            self.quitar_cliente(id_cliente)
+            self.cerrar_cola(writer)
+            await escritor
+            writer.close()
+
+    def crear_cola(self, conexion, al_encolar=None):
+        """Crea la cola de salida acotada de una conexión nueva"""
+        cola = ColaSalida(self.capacidad_cola, self.politica_cola, al_encolar)
+        with self.lock:
+            self.colas[conexion] = cola
+        return cola
+
+    def cerrar_cola(self, conexion):
+        """Cierra y olvida la cola de una conexión terminada"""
+        with self.lock:
+            cola = self.colas.pop(conexion, None)
+            self.modos_conexion.pop(conexion, None)
+            self.formatos.pop(conexion, None)
+        if cola:
+            cola.cerrar()
+
+    def escritor_hilo(self, cliente, cola):
+        """Vacía la cola de un cliente; el sendall bloqueante solo frena a este hilo"""
+        try:
+            while True:
+                datos = cola.obtener()
+                if datos is None:
+                    break
+                cliente.sendall(datos)
+        except ConnectionError:
+            pass  # El cliente se fue: el hilo lector lo detecta y limpia la conexión
+        except OSError as e:
+            if not cola.cerrada:  # Con la cola cerrada el cliente ya se ha ido: no es un error
+                print(f"Error escribiendo a cliente: {e}")
+        finally:
+            if cola.desbordada:
+                print("Cola de salida llena: desconectando cliente lento")
+            try:
+                # Despierta al hilo lector para que limpie la conexión
+                cliente.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    async def escritor_asyncio(self, writer, cola, hay_datos):
+        """Vacía la cola de un cliente respetando el control de flujo del transporte"""
+        try:
+            while True:
+                await hay_datos.wait()
+                hay_datos.clear()
+                pendientes = cola.vaciar()
+                if pendientes:
+                    writer.writelines(pendientes)
+                    await writer.drain()
+                if cola.cerrada:
+                    break
+        except ConnectionError:
+            pass  # El cliente se fue: el lector lo detecta y limpia la conexión
+        except OSError as e:
+            if not cola.cerrada:  # Con la cola cerrada el cliente ya se ha ido: no es un error
+                print(f"Error escribiendo a cliente: {e}")
+        finally:
+            if cola.desbordada:
+                print("Cola de salida llena: desconectando cliente lento")
+            writer.close()
+
+    def procesar_mensaje(self, cliente, id_cliente, carga):
+        """Procesa la carga de una trama de un cliente y devuelve su ID (None si se desconectó)"""
+        try:
+            mensaje = decodificar_mensaje(carga)
+            # Los clientes actuales envían "tipo"; se acepta también "type"
+            tipo = mensaje.get("type", mensaje.get("tipo"))
+
+            if tipo == "conectar":
+                # Asignar ID al cliente
+                with self.lock:
+                    self.contador_ids += 1
+                    id_cliente = str(self.contador_ids)
+                    self.clientes[id_cliente] = {
+                        "socket": cliente,
+                        "nombre": f"Jugador{id_cliente}",
+                        "personaje": None,
+                        "pos": list(POS_INICIAL),
+                        "vida": 100,
+                        "vida_max": 100,
+                        "velocidad": 5,
+                        "daño": 20,
+                        "nivel": 1,
+                        "experiencia": 0,
+                        "reduccion_daño": 0,
+                        "sala": None,
+                        "ack_estado": None  # Última instantánea confirmada por el cliente
+                    }
+                    # Entrar en la sala pedida si existe; si no, en la sala por defecto
+                    sala = self.salas.obtener(mensaje.get("sala")) or self.salas.obtener(SALA_POR_DEFECTO)
+                    sala.agregar_jugador(id_cliente, self.clientes[id_cliente])
+
+                    # Códec binario para los mensajes frecuentes si el cliente lo pide
+                    # (no con el separador '|' del modo legado: los bytes podrían contenerlo)
+                    formato = mensaje.get("codec") if mensaje.get("codec") in FORMATOS else FORMATO_JSON
+                    if self.modos_conexion.get(cliente, MODO_TRAMAS) != MODO_TRAMAS:
+                        formato = FORMATO_JSON
+                    self.formatos[cliente] = formato
+
+                    # Canal UDP si el servidor lo tiene y el cliente lo pide
+                    udp = {}
+                    if self.udp and mensaje.get("udp"):
+                        token = secrets.token_hex(8)
+                        self.tokens_udp[token] = id_cliente
+                        self.clientes[id_cliente]["token_udp"] = token
+                        udp = {"udp": {"puerto": self.port, "token": token}}
+
+                    # Enviar bienvenida con ID asignado y estado completo (keyframe)
+                    self.enviar_mensaje(cliente, "bienvenida", {
+                        "id": id_cliente,
+                        "mensaje": "Bienvenido al servidor",
+                        "codec": formato,
+                        "mapa": MAPA.huella,  # Para que el cliente compruebe que usa el mismo mapa.json
+                        **sala.datos_bienvenida(id_cliente),
+                        **udp
+                    })
+
+            elif tipo == "crear_sala" and id_cliente:
+                try:
+                    sala = self.salas.crear(mensaje.get("sala"))
+                except ErrorSala as e:
+                    self.enviar_mensaje(cliente, "error_sala", {"mensaje": str(e)})
+                else:
+                    self.cambiar_sala(id_cliente, sala)
+
+            elif tipo == "unirse_sala" and id_cliente:
+                sala = self.salas.obtener(mensaje.get("sala"))
+                if sala is None:
+                    self.enviar_mensaje(cliente, "error_sala", {"mensaje": f"La sala {mensaje.get('sala')} no existe"})
+                else:
+                    self.cambiar_sala(id_cliente, sala)
+
+            elif tipo == "salir_sala" and id_cliente:
+                # El jugador queda en el vestíbulo, sin sala, hasta crear o unirse a otra
+                self.salir_de_sala(id_cliente)
+                self.enviar_mensaje(cliente, "sala_abandonada", {"salas": self.salas.resumen()})
+
+            elif tipo == "listar_salas":
+                self.enviar_mensaje(cliente, "salas", {"salas": self.salas.resumen()})
+
+            elif tipo == "ping":
+                # Eco por la cola de salida: el cliente mide la latencia incluida la espera en cola
+                self.enviar_mensaje(cliente, "pong", {"t": mensaje.get("t")})
+
+            elif tipo == "metricas":
+                self.enviar_mensaje(cliente, "metricas", self.metricas())
+
+            elif tipo == "nuevo_jugador" and id_cliente:
+                with self.lock:
+                    sala = self.sala_de(id_cliente)
+                    jugador = self.clientes.get(id_cliente)
+                    if jugador is not None:
+                        # Del cliente solo se toman el nombre, el personaje y la posición de aparición
+                        personaje = mensaje.get("personaje")
+                        personaje = personaje if isinstance(personaje, int) and personaje in PERSONAJES else None
+                        estadisticas = PERSONAJES.get(personaje, ESTADISTICAS_BASE)
+                        jugador.update({
+                            "nombre": str(mensaje.get("nombre", f"Jugador{id_cliente}"))[:16],
+                            "personaje": personaje,
+                            **estadisticas
+                        })
+                        if not jugador.get("aparecido"):
+                            jugador["aparecido"] = True
+                            jugador["pos"] = posicion_inicial(mensaje.get("pos"))
+                            jugador["vida"] = estadisticas["vida_max"]
+                        else:
+                            # Repetir nuevo_jugador no mueve ni cura al jugador
+                            jugador["vida"] = min(jugador["vida"], estadisticas["vida_max"])
+                    if sala is not None:
+                        sala.actualizar_posicion_jugador(id_cliente, self.clientes[id_cliente]["pos"])
+                        sala.registrar_alta(id_cliente)  # Nueva posición y vida (lockstep y grabación)
+
+                        # Actualizar a todos los jugadores de la sala
+                        sala.enviar_a_todos("jugadores", {
+                            "jugadores": sala.obtener_datos_jugadores()
+                        })
+
+            elif tipo == "movimiento" and id_cliente:
+                # No se reenvía: la sala difunde la última posición de cada jugador una vez por tick
+                with self.lock:
+                    sala = self.sala_de(id_cliente)
+                    if sala is not None:
+                        sala.mover_jugador(id_cliente, mensaje.get("pos", [400, 300]), mensaje.get("scroll_y"))
+
+            elif tipo == "entrada" and id_cliente:
+                # Entradas numeradas: el servidor calcula la posición y confirma la última aplicada
+                with self.lock:
+                    sala = self.sala_de(id_cliente)
+                    if sala is not None:
+                        sala.aplicar_entradas(id_cliente, int(mensaje.get("seq", 0)), mensaje.get("teclas", []),
+                                              mensaje.get("scroll_y"))
+
+            elif tipo == "estructura_destruida" and id_cliente:
+                sala = self.sala_de(id_cliente)
+                if sala is not None:
+                    sala.destruir_estructura(mensaje)
+
+            elif tipo == "desincronizado" and id_cliente:
+                sala = self.sala_de(id_cliente)
+                if sala is not None:
+                    sala.resincronizar(id_cliente, mensaje)
+
+            elif tipo == "ack_estado" and id_cliente:
+                sala = self.sala_de(id_cliente)
+                if sala is not None:
+                    sala.confirmar_instantanea(id_cliente, mensaje)
+
+            elif tipo == "desconectar" and id_cliente:
+                self.quitar_cliente(id_cliente)
+                return None
+
+        except json.JSONDecodeError:
+            print("Error decodificando mensaje JSON")
+        except Exception as e:
+            print(f"Error procesando mensaje: {e}")
+        return id_cliente
+
+    def sala_de(self, id_cliente):
+        """Sala en la que está el jugador (None si no existe o está en el vestíbulo)"""
+        jugador = self.clientes.get(id_cliente)
+        if jugador is None:
+            return None
+        return self.salas.obtener(jugador.get("sala"))
+
+    def salir_de_sala(self, id_cliente):
+        """Saca al jugador de su sala y elimina la sala si queda vacía"""
+        with self.lock:
+            sala = self.sala_de(id_cliente)
+            if sala is not None:
+                sala.quitar_jugador(id_cliente)
+                if not sala.activa:
+                    self.salas.eliminar(sala.id)
+
+    def cambiar_sala(self, id_cliente, sala):
+        """Mueve al jugador a otra sala y le envía el estado completo de la nueva partida"""
+        with self.lock:
+            jugador = self.clientes.get(id_cliente)
+            if jugador is None:
+                return
+            if jugador.get("sala") != sala.id:
+                self.salir_de_sala(id_cliente)
+                sala.agregar_jugador(id_cliente, jugador)
+            self.enviar_mensaje(jugador["socket"], "sala_unida", sala.datos_bienvenida(id_cliente))
+
+    def quitar_cliente(self, id_cliente):
+        """Elimina a un cliente del servidor y avisa al resto de jugadores de su sala"""
+        if not id_cliente:
+            return
+        with self.lock:
+            self.salir_de_sala(id_cliente)
+            jugador = self.clientes.pop(id_cliente, None)
+            if jugador is not None:
+                self.tokens_udp.pop(jugador.get("token_udp"), None)
+                canal = self.canales_udp.pop(jugador["socket"], None)
+                if canal is not None:
+                    self.conexiones_udp.pop(canal["direccion"], None)
+
+    def escuchar_udp(self):
+        """Bucle de recepción del canal UDP (motor de hilos)"""
+        while True:
+            try:
+                datos, direccion = self.socket_udp.recvfrom(65536)
+            except OSError:
+                break
+            self.procesar_datagrama(datos, direccion)
+
+    def procesar_datagrama(self, datos, direccion):
+        """Registra la dirección UDP de un jugador (hola_udp) o procesa un movimiento.
+
+        Los datagramas que llegan tarde (secuencia no mayor que la última) se descartan.
+        """
+        try:
+            seq, carga = desempaquetar_datagrama(datos)
+            mensaje = decodificar_mensaje(carga)
+            tipo = mensaje.get("tipo")
+        except (ErrorProtocolo, ValueError, AttributeError):
+            return
+        with self.lock:
+            if tipo == "hola_udp":
+                id_cliente = self.tokens_udp.get(mensaje.get("token"))
+                jugador = self.clientes.get(id_cliente)
+                if jugador is None:
+                    return
+                conexion = jugador["socket"]
+                anterior = self.canales_udp.get(conexion)
+                if anterior is not None:
+                    self.conexiones_udp.pop(anterior["direccion"], None)
+                self.canales_udp[conexion] = {"id": id_cliente, "direccion": direccion, "seq": 0,
+                                              "seq_recibido": anterior["seq_recibido"] if anterior else 0}
+                self.conexiones_udp[direccion] = conexion
+                # Confirmar por el mismo canal: el cliente reintenta hasta recibirlo
+                self.enviar_datagrama(direccion, empaquetar_datagrama(0, codificar_mensaje("hola_udp", {})))
+            elif tipo in MENSAJES_UDP_ENTRANTES:
+                conexion = self.conexiones_udp.get(direccion)
+                canal = self.canales_udp.get(conexion)
+                if canal is None or seq <= canal["seq_recibido"]:
+                    return  # Desconocido o más viejo que el último recibido
+                canal["seq_recibido"] = seq
+                self.procesar_mensaje(conexion, canal["id"], carga)
+
+    def enviar_datagrama(self, direccion, datos):
+        """Envía un datagrama por el socket o transporte UDP del motor en uso"""
+        try:
+            if self.transporte_udp is not None:
+                self.transporte_udp.sendto(datos, direccion)
+            else:
+                self.socket_udp.sendto(datos, direccion)
+            self.datagramas_enviados += 1
+            self.bytes_udp_enviados += len(datos)
+        except OSError as e:
+            print(f"Error enviando datagrama: {e}")
 
     def enviar_mensaje(self, cliente, tipo, contenido):
         """Envía un mensaje a un cliente específico"""
         try:
-            mensaje = json.dumps({
-                "tipo": tipo,
-                **contenido
-            })
-            cliente.sendall((mensaje + '|').encode('utf-8'))
+            formato = self.formatos.get(cliente, FORMATO_JSON)
+            self.enviar_carga(cliente, codificar_mensaje(tipo, contenido, formato), CLASES_MENSAJE.get(tipo, EVENTO))
         except:
             print(f"Error enviando mensaje a cliente")
 
-    def enviar_a_todos(self, tipo, contenido):
-        """Envía un mensaje a todos los clientes conectados"""
+    def enviar_carga(self, cliente, carga, clase=EVENTO):
+        """Encola una carga ya serializada con el formato de tramas del cliente (no bloquea).
+
+        Una CargaMensaje se serializa en el formato del cliente. Posiciones e instantáneas
+        van por UDP si el cliente tiene canal y caben en un datagrama.
+        """
+        if isinstance(carga, CargaMensaje):
+            carga = carga.codificar(self.formatos.get(cliente, FORMATO_JSON))
+        canal = self.canales_udp.get(cliente)
+        if (canal is not None and clase in CLASES_UDP and
+                len(carga) + CABECERA_DATAGRAMA.size <= TAMANO_MAXIMO_DATAGRAMA):
+            canal["seq"] += 1
+            self.enviar_datagrama(canal["direccion"], empaquetar_datagrama(canal["seq"], carga))
+            return
+        cola = self.colas.get(cliente)
+        if cola is not None:
+            cola.poner(empaquetar_trama(carga, self.modos_conexion.get(cliente, MODO_TRAMAS)), clase)
+
+    def estadisticas_colas(self):
+        """Profundidad y descartes de la cola de salida de cada jugador"""
         with self.lock:
-            for id_jugador, datos in self.clientes.items():
-                try:
-                    self.enviar_mensaje(datos["socket"], tipo, contenido)
-                except:
-                    print(f"Error enviando mensaje a jugador {id_jugador}")
-
-    def enviar_a_todos_excepto(self, id_excluido, tipo, contenido):
-        """Envía un mensaje a todos los clientes excepto al especificado"""
-        with self.lock:
-            for id_jugador, datos in self.clientes.items():
-                if id_jugador != id_excluido:
-                    try:
-                        self.enviar_mensaje(datos["socket"], tipo, contenido)
-                    except:
-                        print(f"Error enviando mensaje a jugador {id_jugador}")
+            return {id_jugador: self.colas[datos["socket"]].estadisticas()
+                    for id_jugador, datos in self.clientes.items() if datos["socket"] in self.colas}
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de Guerra de Minions")
+    parser.add_argument("--engine", choices=MOTORES, default="threads",
+                        help="Motor de red: un hilo por cliente o asyncio")
+    parser.add_argument("--politica-cola", choices=POLITICAS, default=DESCARTAR_POSICIONES,
+                        help="Qué hacer cuando se llena la cola de salida de un cliente")
+    parser.add_argument("--capacidad-cola", type=int, default=256,
+                        help="Mensajes pendientes máximos por cliente")
+    parser.add_argument("--tasa-tick", type=int, default=10,
+                        help="Ticks de simulación por segundo")
+    parser.add_argument("--tasa-estado", type=float, default=10,
+                        help="Instantáneas de estado (minions) por segundo; el cliente interpola entre ellas")
+    parser.add_argument("--tasa-posiciones", type=float, default=None,
+                        help="Difusiones de posiciones de jugadores por segundo (por defecto, una por tick)")
+    parser.add_argument("--udp", action="store_true",
+                        help="Ofrecer el canal UDP para posiciones e instantáneas (mismo puerto)")
+    parser.add_argument("--lockstep", action="store_true",
+                        help="Simulación lockstep: se difunden las entradas y cada cliente simula la partida")
+    parser.add_argument("--grabar", metavar="DIRECTORIO", default=None,
+                        help="Grabar cada partida (comandos y eventos por tick) para reproducirla con repeticion.py")
+    parser.add_argument("--intervalo-fotos", type=float, default=10,
+                        help="Segundos entre fotos del estado completo en las grabaciones (para buscar)")
+    parser.add_argument("--respaldo", metavar="ARCHIVO", default=None,
+                        help="Archivo de puntos de control: si tiene uno, las partidas siguen desde él")
+    parser.add_argument("--intervalo-respaldo", type=float, default=1.0,
+                        help="Segundos entre puntos de control")
+    parser.add_argument("--capacidad-respaldo", type=float, default=8,
+                        help="MB reservados para cada una de las dos copias del punto de control")
+    args = parser.parse_args()
+
     # Usar la IP de Radmin VPN (26.176.7.141) o 0.0.0.0 para escuchar en todas las interfaces
-    servidor = Servidor(host='0.0.0.0', port=5555)
\ No newline at end of file
+    servidor = Servidor(host='0.0.0.0', port=5555, engine=args.engine,
+                        politica_cola=args.politica_cola, capacidad_cola=args.capacidad_cola,
+                        tasa_tick=args.tasa_tick, intervalo_estado=1 / args.tasa_estado,
+                        tasa_posiciones=args.tasa_posiciones, udp=args.udp, lockstep=args.lockstep,
+                        directorio_grabaciones=args.grabar, intervalo_fotos=args.intervalo_fotos,
+                        archivo_respaldo=args.respaldo, intervalo_respaldo=args.intervalo_respaldo,
+                        capacidad_respaldo=int(args.capacidad_respaldo * 1024 * 1024))
\ No newline at end of file
@@ -0,0 +1,99 @@
+# test_binario.py - Códec binario: ida y vuelta de cada esquema, cuartos de píxel y vuelta a JSON
+import pytest
+
+import binario
+from almacen_minions import EQUIPOS, AlmacenMinions
+from instantaneas import REEMPLAZO
+from mapa import MAPA
+from protocolo import FORMATO_BINARIO, codificar_mensaje, decodificar_mensaje
+
+
+def ida_y_vuelta(tipo, contenido):
+    carga = codificar_mensaje(tipo, contenido, FORMATO_BINARIO)
+    assert binario.es_binario(carga)
+    mensaje = decodificar_mensaje(carga)
+    assert mensaje.pop("tipo") == tipo
+    return mensaje
+
+
+def minions_de_oleada():
+    minions = AlmacenMinions()
+    for equipo in EQUIPOS:
+        minions.agregar_varios(MAPA.oleada(equipo))
+    minions.mover(40)
+    return minions.vista_completa()
+
+
+@pytest.mark.parametrize("tipo, contenido", [
+    ("movimiento", {"id": "12", "pos": [402.5, 300.25], "scroll_y": -20.5}),
+    ("movimiento", {"id": "3", "pos": [49.0, 500.0]}),
+    ("actualizacion_posicion", {"id": "7", "pos": [751.0, 100.0]}),
+    ("actualizacion_posiciones", {"posiciones": {"1": [49.0, 500.0], "22": [-10.25, 8191.75]}}),
+    ("actualizacion_posiciones", {"posiciones": {}}),
+    ("jugador_dañado", {"id": "7", "vida": 85.0, "torre_pos": [200.0, 480.0]}),
+    ("nueva_oleada", {"contador": 3, "tiempo": 125, "limpiar": True}),
+    ("entrada", {"id": "5", "seq": 2 ** 32 - 1, "teclas": [0, 1, 24, 255]}),
+    ("entrada", {"id": "5", "seq": 1, "teclas": [], "scroll_y": 12.0}),
+    ("entrada_confirmada", {"seq": 77, "pos": [0.0, -8192.0]}),
+])
+def test_mensajes_pequeños(tipo, contenido):
+    assert ida_y_vuelta(tipo, contenido) == contenido
+
+
+def test_coordenadas_en_cuartos_de_pixel():
+    assert ida_y_vuelta("movimiento", {"id": "1", "pos": [10.1, 10.2]})["pos"] == [10.0, 10.25]
+
+
+@pytest.mark.parametrize("pos", [[8192.0, 0.0], [0.0, -8192.5], [1e6, 1e6]])
+def test_fuera_de_int16_va_en_json(pos):
+    # Más allá de ±8191.75 px no cabe en int16: el mensaje sale en JSON, sin perder precisión
+    carga = codificar_mensaje("movimiento", {"id": "1", "pos": pos}, FORMATO_BINARIO)
+    assert carga[:1] == b"{"
+    assert decodificar_mensaje(carga)["pos"] == pos
+
+
+def test_campos_sin_esquema_van_en_json():
+    carga = codificar_mensaje("movimiento", {"id": "1", "pos": [1, 2], "extra": 1}, FORMATO_BINARIO)
+    assert decodificar_mensaje(carga) == {"tipo": "movimiento", "id": "1", "pos": [1, 2], "extra": 1}
+    with pytest.raises(binario.ErrorCodec):
+        binario.codificar("movimiento", {"id": "no-numérico", "pos": [1, 2]})
+
+
+def comparar_minions(decodificados, originales):
+    for equipo in EQUIPOS:
+        assert len(decodificados[equipo]) == len(originales[equipo])
+        for nuevo, original in zip(decodificados[equipo], originales[equipo]):
+            assert nuevo["id"] == original["id"]
+            assert nuevo["tipo"] == original["tipo"]
+            assert nuevo["ruta_id"] == str(original["ruta_id"])
+            assert nuevo["pos"] == pytest.approx(original["pos"], abs=0.125)
+            assert nuevo["distancia"] == pytest.approx(original["distancia"], abs=0.125)
+            assert nuevo["vida"] == pytest.approx(max(original["vida"], 0), abs=0.05)
+            assert nuevo["velocidad"] == pytest.approx(original["velocidad"], abs=0.005)
+            assert nuevo["objetivo"] == original.get("objetivo")
+
+
+def test_estado_juego():
+    minions = minions_de_oleada()
+    contenido = {"seq": 41, "oleadas": {"tiempo_juego": 70, "contador_oleadas": 1},
+                 "estructuras": {"torres": {"aliadas": [{"vida": 100, "destruida": False}]}}, "minions": minions}
+    mensaje = ida_y_vuelta("estado_juego", contenido)
+    assert mensaje["seq"] == 41
+    assert mensaje["oleadas"] == contenido["oleadas"]
+    assert mensaje["estructuras"] == contenido["estructuras"]
+    comparar_minions(mensaje["minions"], minions)
+
+
+def test_estado_delta():
+    minions = minions_de_oleada()
+    delta = [1, {"oleadas": [1, {"tiempo_juego": [0, 71]}, []]}, []]
+    mensaje = ida_y_vuelta("estado_delta", {"seq": 42, "base": 41, "delta": delta, "minions_completos": minions})
+    assert (mensaje["seq"], mensaje["base"], mensaje["delta"]) == (42, 41, delta)
+    assert mensaje["minions"][0] == REEMPLAZO
+    comparar_minions(mensaje["minions"][1], minions)
+
+
+def test_estado_delta_sin_tabla_de_minions_va_en_json():
+    contenido = {"seq": 2, "base": 1, "delta": None, "minions": None}
+    carga = codificar_mensaje("estado_delta", contenido, FORMATO_BINARIO)
+    assert decodificar_mensaje(carga) == {"tipo": "estado_delta", **contenido}
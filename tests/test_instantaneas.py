@@ -0,0 +1,90 @@
+# test_instantaneas.py - Deltas entre instantáneas: ida y vuelta, JSON y base sin modificar
+import copy
+import json
+
+import pytest
+
+from instantaneas import HistorialInstantaneas, aplicar_delta, calcular_delta, copiar_estado
+
+BASE = {
+    "oleadas": {"tiempo_juego": 64, "contador_oleadas": 0, "primer_oleada": False},
+    "estructuras": {"torres": {"aliadas": [{"vida": 100, "pos": [200, 480], "destruida": False},
+                                           {"vida": 100, "pos": [400, 480], "destruida": False}]}},
+    "minions": {"aliados": [{"id": 1, "pos": [49.5, 500.0], "objetivo": None}], "enemigos": []},
+    "etiquetas": ["a", "b"]
+}
+
+
+def ida_y_vuelta(anterior, actual):
+    """El delta pasa por JSON (como en la red) y reconstruye `actual` sin tocar `anterior`"""
+    copia = copy.deepcopy(anterior)
+    delta = json.loads(json.dumps(calcular_delta(anterior, actual)))
+    assert aplicar_delta(anterior, delta) == actual
+    assert anterior == copia
+    return delta
+
+
+def test_sin_cambios():
+    assert calcular_delta(BASE, copy.deepcopy(BASE)) is None
+    assert aplicar_delta(BASE, None) is BASE
+
+
+def test_cambios_anidados():
+    actual = copy.deepcopy(BASE)
+    actual["oleadas"]["tiempo_juego"] = 65
+    actual["estructuras"]["torres"]["aliadas"][1]["destruida"] = True
+    actual["minions"]["aliados"][0]["pos"] = [52.0, 500.0]
+    actual["minions"]["aliados"][0]["objetivo"] = 3
+    delta = ida_y_vuelta(BASE, actual)
+    assert "etiquetas" not in delta[1]  # Solo viaja lo que cambió
+
+
+def test_listas_que_crecen_y_encogen():
+    actual = copy.deepcopy(BASE)
+    actual["minions"]["enemigos"] = [{"id": 2, "pos": [751, 100]}, {"id": 3, "pos": [751, 100]}]
+    actual["estructuras"]["torres"]["aliadas"].pop()
+    actual["etiquetas"].append("c")
+    ida_y_vuelta(BASE, actual)
+    ida_y_vuelta(actual, BASE)
+
+
+def test_claves_nuevas_y_borradas():
+    actual = copy.deepcopy(BASE)
+    del actual["etiquetas"]
+    actual["nueva"] = {"x": [1, 2]}
+    ida_y_vuelta(BASE, actual)
+
+
+@pytest.mark.parametrize("anterior, actual", [
+    (1, 1.0),                 # Mismo valor, otro tipo: se reemplaza
+    ({"a": 1}, [1]),
+    ([{"a": 1}], {"a": 1}),
+    (None, {"a": 1}),
+    ([1, 2], [1, 2, 3]),
+    ([], [{"a": 1}]),
+    ([{"a": 1}], []),
+])
+def test_cambios_de_forma(anterior, actual):
+    delta = ida_y_vuelta(anterior, actual)
+    assert delta is not None
+    assert type(aplicar_delta(anterior, delta)) is type(actual)
+
+
+def test_etiqueta_desconocida():
+    with pytest.raises(ValueError):
+        aplicar_delta({}, [9, None])
+
+
+def test_copiar_estado_normaliza_tuplas():
+    assert copiar_estado({"pos": (1, 2), "lista": [(3, 4)]}) == {"pos": [1, 2], "lista": [[3, 4]]}
+
+
+def test_historial_descarta_las_antiguas():
+    historial = HistorialInstantaneas(capacidad=3)
+    estado = {"n": 0}
+    for n in range(5):
+        estado["n"] = n
+        historial.registrar(estado)
+    assert historial.obtener(2) is None
+    assert historial.obtener(3) == {"n": 2}
+    assert historial.ultima() == (5, {"n": 4})
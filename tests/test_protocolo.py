@@ -0,0 +1,87 @@
+# test_protocolo.py - Tramas de longitud prefijada, modo legado '|' y límites del decodificador
+import json
+
+import pytest
+
+from protocolo import (CABECERA, FORMATO_BINARIO, MODO_LEGADO, MODO_TRAMAS, TAMANO_MAXIMO_TRAMA,
+                       DecodificadorTramas, ErrorProtocolo, codificar_mensaje, decodificar_mensaje,
+                       desempaquetar_datagrama, empaquetar_datagrama, empaquetar_trama)
+
+
+def test_varias_tramas_en_una_lectura():
+    cargas = [codificar_mensaje("ping", {"t": i}) for i in range(3)]
+    decodificador = DecodificadorTramas()
+    assert decodificador.alimentar(b"".join(empaquetar_trama(c) for c in cargas)) == cargas
+    assert decodificador.modo == MODO_TRAMAS
+    assert not decodificador.buffer
+
+
+def test_trama_partida_byte_a_byte():
+    carga = codificar_mensaje("chat", {"texto": "¡Ñandú! 🐉"})
+    datos = empaquetar_trama(carga) + empaquetar_trama(b"{}")
+    decodificador = DecodificadorTramas()
+    recibidas = []
+    for i in range(len(datos)):
+        recibidas += decodificador.alimentar(datos[i:i + 1])  # Parte también la cabecera y el UTF-8
+    assert recibidas == [carga, b"{}"]
+    assert decodificar_mensaje(recibidas[0])["texto"] == "¡Ñandú! 🐉"
+
+
+def test_alimentar_sin_datos():
+    decodificador = DecodificadorTramas()
+    assert decodificador.alimentar(b"") == []
+    assert decodificador.modo is None
+
+
+def test_deteccion_modo_legado():
+    decodificador = DecodificadorTramas()
+    assert decodificador.alimentar(b'{"tipo": "ping"}|{"tipo": "pong"}|{"ti') == [
+        b'{"tipo": "ping"}', b'{"tipo": "pong"}']
+    assert decodificador.modo == MODO_LEGADO
+    assert decodificador.alimentar(b'po": "fin"}|') == [b'{"tipo": "fin"}']
+
+
+def test_legado_utf8_partido_entre_lecturas():
+    carga = json.dumps({"tipo": "chat", "texto": "añoñería"}, ensure_ascii=False).encode("utf-8")
+    corte = carga.index("ñ".encode("utf-8")) + 1  # En medio del carácter de dos bytes
+    decodificador = DecodificadorTramas()
+    assert decodificador.alimentar(carga[:corte]) == []
+    assert decodificador.alimentar(carga[corte:] + b"|") == [carga]
+    assert decodificar_mensaje(carga)["texto"] == "añoñería"
+
+
+def test_legado_ignora_separadores_vacios():
+    assert DecodificadorTramas(MODO_LEGADO).alimentar(b'{"a": 1}||{"b": 2}|') == [b'{"a": 1}', b'{"b": 2}']
+
+
+def test_empaquetar_legado():
+    assert empaquetar_trama(b'{"a": 1}', MODO_LEGADO) == b'{"a": 1}|'
+
+
+def test_trama_demasiado_grande():
+    with pytest.raises(ErrorProtocolo):
+        DecodificadorTramas().alimentar(CABECERA.pack(TAMANO_MAXIMO_TRAMA + 1))
+    # Justo en el límite se acepta la cabecera y se espera al resto
+    decodificador = DecodificadorTramas()
+    assert decodificador.alimentar(CABECERA.pack(TAMANO_MAXIMO_TRAMA) + b"x") == []
+
+
+def test_empaquetar_trama_demasiado_grande():
+    with pytest.raises(ErrorProtocolo):
+        empaquetar_trama(bytes(TAMANO_MAXIMO_TRAMA + 1))
+
+
+def test_trama_vacia():
+    assert DecodificadorTramas(MODO_TRAMAS).alimentar(empaquetar_trama(b"")) == [b""]
+
+
+def test_datagrama_ida_y_vuelta():
+    assert desempaquetar_datagrama(empaquetar_datagrama(2 ** 32 + 5, b"carga")) == (5, b"carga")
+    with pytest.raises(ErrorProtocolo):
+        desempaquetar_datagrama(b"\x00\x01")
+
+
+def test_binario_sin_esquema_va_en_json():
+    carga = codificar_mensaje("chat", {"texto": "hola"}, FORMATO_BINARIO)
+    assert carga[:1] == b"{"
+    assert decodificar_mensaje(carga) == {"tipo": "chat", "texto": "hola"}
@@ -0,0 +1,52 @@
+# textos.py - Caché LRU de superficies de texto ya renderizadas
+from collections import OrderedDict
+
+CAPACIDAD_TEXTOS = 256  # Nombres, etiquetas del menú y del pie: sobra para una partida
+
+
+class CacheTextos:
+    """Superficies de `Font.render` guardadas por (fuente, texto, color, antialias).
+
+    Rasterizar una fuente es de lo más caro de un fotograma y casi todos los textos
+    se repiten de un fotograma a otro. Al llenarse se descarta el menos usado.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_TEXTOS):
+        self.capacidad = capacidad
+        self.superficies = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self):
+        return len(self.superficies)
+
+    def render(self, fuente, texto, antialias, color):
+        """Como `fuente.render(texto, antialias, color)`, sin volver a rasterizar lo ya visto.
+
+        La superficie es compartida: se puede dibujar pero no modificar.
+        """
+        clave = (fuente, texto, tuple(color), antialias)
+        superficie = self.superficies.get(clave)
+        if superficie is not None:
+            self.aciertos += 1
+            self.superficies.move_to_end(clave)
+            return superficie
+        self.fallos += 1
+        superficie = fuente.render(texto, antialias, color)
+        self.superficies[clave] = superficie
+        if len(self.superficies) > self.capacidad:
+            self.superficies.popitem(last=False)
+        return superficie
+
+    def limpiar(self):
+        self.superficies.clear()
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "textos": len(self.superficies),
+            "capacidad": self.capacidad,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else None
+        }